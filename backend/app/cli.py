@@ -0,0 +1,172 @@
+"""
+Lệnh quản trị chạy ngoài server:
+
+    python -m app.cli db upgrade [--to <version>]
+    python -m app.cli db current
+    python -m app.cli rebuild-stats [--doctor-id <uuid>]
+    python -m app.cli partitions [--months-ahead <n>]
+    python -m app.cli archive [--older-than-months <n>] [--batch-size <n>]
+    python -m app.cli idempotency purge
+    python -m app.cli tokens purge
+    python -m app.cli slots rebuild [--doctor-id <uuid>] [--days <n>]
+    python -m app.cli import-doctors <file> [--format csv|ndjson] [--report <file.json>]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from uuid import UUID
+
+from app import migrations
+from app.core import idempotency, security
+from app.core.database import SessionLocal, engine
+from app.modules.appointments import partitions, slots, stats
+from app.modules.auth import revocation
+from app.modules.doctors import bulk_import
+
+
+def db_upgrade(args):
+    applied = migrations.upgrade(engine, target=args.to)
+    for migration in applied:
+        print(f"  {migration.version}: {migration.description}")
+    with engine.connect() as conn:
+        print(f"Schema DB ở version {migrations.current_version(conn)}"
+              f" ({len(applied)} migration vừa chạy)")
+
+
+def db_current(args):
+    with engine.connect() as conn:
+        version = migrations.current_version(conn)
+    print(f"Schema DB: {version if version is not None else 'chưa khởi tạo'}, "
+          f"mới nhất: {migrations.LATEST_VERSION}")
+
+
+def rebuild_stats(args):
+    with SessionLocal() as db:
+        rows = stats.rebuild(db, doctor_id=args.doctor_id)
+        db.commit()
+    print(f"Đã dựng lại doctor_daily_stats: {rows} dòng")
+
+
+def ensure_partitions(args):
+    with engine.begin() as conn:
+        if not partitions.is_partitioned(conn):
+            print("Bảng appointments không chia partition (chỉ PostgreSQL, sau db upgrade)")
+            return
+        created = partitions.ensure_partitions(conn, months_ahead=args.months_ahead)
+        names = partitions.list_partitions(conn)
+    print(f"Đã tạo {len(created)} partition mới: {', '.join(created) or '-'}")
+    print(f"Hiện có {len(names)} partition: {names[0]} .. {names[-1]}")
+
+
+def archive(args):
+    moved, dropped = partitions.archive_closed(
+        engine, older_than_months=args.older_than_months, batch_size=args.batch_size)
+    print(f"Đã chuyển {moved} lịch sang {partitions.AppointmentArchive.__tablename__}")
+    if dropped:
+        print(f"Đã xóa {len(dropped)} partition trống: {', '.join(dropped)}")
+
+
+def purge_idempotency_keys(args):
+    with SessionLocal() as db:
+        deleted = idempotency.purge_expired(db)
+        db.commit()
+    print(f"Đã xóa {deleted} Idempotency-Key hết hạn")
+
+
+def purge_revoked_tokens(args):
+    with SessionLocal() as db:
+        deleted = revocation.purge_expired(db)
+        db.commit()
+    print(f"Đã xóa {deleted} token thu hồi đã hết hạn")
+
+
+def rebuild_slots(args):
+    written = asyncio.run(slots.rebuild(doctor_id=args.doctor_id, days_ahead=args.days))
+    print(f"Đã tính lại doctor_day_slots: {written} dòng")
+
+
+def import_doctors(args):
+    try:
+        report = asyncio.run(bulk_import.import_file(args.file, args.format))
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"File không đúng định dạng CSV / NDJSON (UTF-8), chưa import dòng nào: {e}")
+        sys.exit(1)
+    finally:
+        security.shutdown_hash_executor()
+    print(f"Đã import {report['imported']}/{report['total']} bác sĩ, lỗi {report['failed']} dòng")
+    for error in report["errors"][:20]:
+        print(f"  dòng {error['line']} ({error['email'] or '-'}): {error['error']}")
+    if len(report["errors"]) > 20:
+        print(f"  ... còn {len(report['errors']) - 20} lỗi")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Báo cáo đầy đủ: {args.report}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    db = commands.add_parser("db", help="Quản lý schema DB (migration)")
+    db_commands = db.add_subparsers(dest="db_command", required=True)
+    upgrade = db_commands.add_parser("upgrade", help="Chạy các migration còn thiếu")
+    upgrade.add_argument("--to", type=int, help="dừng ở version này")
+    upgrade.set_defaults(handler=db_upgrade)
+    current = db_commands.add_parser("current", help="Xem version hiện tại")
+    current.set_defaults(handler=db_current)
+
+    rebuild = commands.add_parser(
+        "rebuild-stats", help="Dựng lại bảng thống kê theo ngày từ lịch sử lịch hẹn")
+    rebuild.add_argument("--doctor-id", type=UUID,
+                         help="chỉ dựng lại cho 1 bác sĩ")
+    rebuild.set_defaults(handler=rebuild_stats)
+
+    partition = commands.add_parser(
+        "partitions", help="Tạo trước partition appointments cho các tháng sắp tới")
+    partition.add_argument("--months-ahead", type=int,
+                           help="mặc định PARTITION_MONTHS_AHEAD")
+    partition.set_defaults(handler=ensure_partitions)
+
+    archiver = commands.add_parser(
+        "archive", help="Chuyển lịch đã khám / đã hủy cũ sang appointments_archive")
+    archiver.add_argument("--older-than-months", type=int,
+                          help="mặc định ARCHIVE_AFTER_MONTHS")
+    archiver.add_argument("--batch-size", type=int, help="mặc định ARCHIVE_BATCH_SIZE")
+    archiver.set_defaults(handler=archive)
+
+    idempotency_parser = commands.add_parser("idempotency", help="Quản lý Idempotency-Key")
+    idempotency_commands = idempotency_parser.add_subparsers(
+        dest="idempotency_command", required=True)
+    purge = idempotency_commands.add_parser("purge", help="Xóa các key đã hết hạn")
+    purge.set_defaults(handler=purge_idempotency_keys)
+
+    tokens_parser = commands.add_parser("tokens", help="Quản lý token bị thu hồi")
+    tokens_commands = tokens_parser.add_subparsers(dest="tokens_command", required=True)
+    purge_tokens = tokens_commands.add_parser("purge", help="Xóa các token đã hết hạn")
+    purge_tokens.set_defaults(handler=purge_revoked_tokens)
+
+    slots_parser = commands.add_parser("slots", help="Bitmap ca theo ngày của bác sĩ")
+    slots_commands = slots_parser.add_subparsers(dest="slots_command", required=True)
+    rebuild_slots_parser = slots_commands.add_parser(
+        "rebuild", help="Tính lại bitmap ca các ngày sắp tới, xóa dòng của ngày đã qua")
+    rebuild_slots_parser.add_argument("--doctor-id", type=UUID, help="chỉ tính cho 1 bác sĩ")
+    rebuild_slots_parser.add_argument("--days", type=int, help="mặc định SLOTS_DAYS_AHEAD")
+    rebuild_slots_parser.set_defaults(handler=rebuild_slots)
+
+    importer = commands.add_parser(
+        "import-doctors", help="Tạo hàng loạt bác sĩ từ file CSV / NDJSON")
+    importer.add_argument("file")
+    importer.add_argument("--format", choices=bulk_import.FORMATS,
+                          help="mặc định tự nhận theo nội dung file")
+    importer.add_argument("--report", help="ghi báo cáo (kèm lỗi từng dòng) ra file JSON")
+    importer.set_defaults(handler=import_doctors)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
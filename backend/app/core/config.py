@@ -0,0 +1,174 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==========================================
+# MẬT KHẨU (ARGON2)
+# ==========================================
+
+# Tham số Argon2, mặc định giống các hash đã có (m=65536, t=3, p=4).
+# Đổi giá trị -> hash cũ được tự động hash lại khi user đăng nhập thành công.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+# Số process dành riêng cho việc hash (mặc định = số core)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "0")) or os.cpu_count() or 1
+# Số job hash tối đa được xếp hàng, vượt quá -> trả 503 ngay
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "0")) or HASH_WORKERS * 4
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("HASH_RETRY_AFTER_SECONDS", "2"))
+
+# ==========================================
+# GIỚI HẠN TẦN SUẤT (đăng nhập / đăng ký, app/core/ratelimit.py)
+# ==========================================
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Dạng "<số request>/<số giây>": cho phép dồn tối đa <số request>, hồi lại đều
+# trong <số giây>. Mỗi worker đếm riêng nếu không có RATE_LIMIT_REDIS_URL.
+RATE_LIMIT_LOGIN_PER_IP = os.getenv("RATE_LIMIT_LOGIN_PER_IP", "30/60")
+RATE_LIMIT_LOGIN_PER_EMAIL = os.getenv("RATE_LIMIT_LOGIN_PER_EMAIL", "10/300")
+RATE_LIMIT_REGISTER_PER_IP = os.getenv("RATE_LIMIT_REGISTER_PER_IP", "10/600")
+# Số key (IP / email) tối đa giữ trong bộ nhớ mỗi worker
+RATE_LIMIT_CACHE_SIZE = int(os.getenv("RATE_LIMIT_CACHE_SIZE", "100000"))
+# Dùng chung bộ đếm giữa các worker, vd redis://localhost:6379/0 (pip install redis)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Chạy sau reverse proxy: lấy IP client từ X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv(
+    "RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+# ==========================================
+# KHỞI ĐỘNG
+# ==========================================
+
+# Kiểm tra version schema DB khi worker khởi động (1 câu query). Tắt mặc định
+# để khởi động không phụ thuộc DB; bảng được tạo bằng: python -m app.cli db upgrade
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "false").lower() in ("1", "true", "yes")
+
+# ==========================================
+# METRICS (/metrics, định dạng Prometheus)
+# ==========================================
+
+# Đo thời gian, số câu SQL, thời gian DB của từng request theo route
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Nếu đặt: /metrics yêu cầu header "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# ==========================================
+# LOG CÂU SQL CHẬM (/internal/slow-queries)
+# ==========================================
+
+# Câu SQL chạy lâu hơn ngưỡng này (ms) được ghi lại, 0 = tắt
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Số câu chậm gần nhất giữ trong bộ nhớ (mỗi worker)
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+# Tỉ lệ câu chậm được lấy plan (EXPLAIN không ANALYZE), 0 = không lấy
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+# Plan của 1 fingerprint được dùng lại trong khoảng thời gian này
+SLOW_QUERY_PLAN_TTL_SECONDS = float(os.getenv("SLOW_QUERY_PLAN_TTL_SECONDS", "600"))
+
+# ==========================================
+# CACHE USER ĐANG ĐĂNG NHẬP (get_current_user)
+# ==========================================
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(
+    os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# ==========================================
+# THU HỒI TOKEN (đăng xuất, khóa tài khoản; app/modules/auth/revocation.py)
+# ==========================================
+
+# Mỗi worker đọc danh sách token bị thu hồi ở worker khác sau mỗi khoảng này
+# (giây): token đăng xuất ở worker khác có thể còn dùng được tối đa chừng đó
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+
+# ==========================================
+# LỊCH HẸN
+# ==========================================
+
+# Mỗi ca tư vấn thường kéo dài 60p
+APPOINTMENT_DURATION_MINUTES = int(
+    os.getenv("APPOINTMENT_DURATION_MINUTES", "60"))
+# Giờ địa phương của phòng khám so với UTC (phút), mặc định giờ Việt Nam (UTC+7).
+# Lịch làm việc của bác sĩ nhập theo giờ này; lưới ca tính từ 00:00 giờ này
+SCHEDULE_UTC_OFFSET_MINUTES = int(os.getenv("SCHEDULE_UTC_OFFSET_MINUTES", "420"))
+# Số ngày tới được tính sẵn bitmap ca (python -m app.cli slots rebuild)
+SLOTS_DAYS_AHEAD = int(os.getenv("SLOTS_DAYS_AHEAD", "31"))
+
+# ==========================================
+# IMPORT BÁC SĨ HÀNG LOẠT (app/modules/doctors/bulk_import.py)
+# ==========================================
+
+# Số dòng mỗi lần kiểm tra / hash / INSERT (mỗi lô 1 transaction)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Số dòng lỗi tối đa trả về trong báo cáo (vẫn đếm đủ số dòng lỗi)
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+# ==========================================
+# XUẤT LỊCH HẸN (app/modules/appointments/export.py)
+# ==========================================
+
+# Số dòng mỗi lần lấy từ server-side cursor và ghi ra response
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# ==========================================
+# IDEMPOTENCY-KEY (đặt lịch, xác nhận thanh toán; app/core/idempotency.py)
+# ==========================================
+
+# Key (kèm response đã lưu) được giữ trong khoảng thời gian này (giây)
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Cache trong process cho các response đã trả lại (mỗi worker)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CACHE_TTL_SECONDS = float(
+    os.getenv("IDEMPOTENCY_CACHE_TTL_SECONDS", "300"))
+
+# ==========================================
+# PARTITION VÀ LƯU TRỮ LỊCH HẸN (app/modules/appointments/partitions.py)
+# ==========================================
+
+# Số tháng tới được tạo sẵn partition (PostgreSQL)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# App kiểm tra / tạo partition mới theo chu kỳ này (giây), 0 = tắt (chỉ dùng CLI)
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(
+    os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+# Lịch đã khám / đã hủy cũ hơn số tháng này được chuyển sang appointments_archive
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "24"))
+# Số lịch chuyển trong mỗi transaction khi lưu trữ
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# ==========================================
+# CACHE DANH MỤC (CHUYÊN KHOA, CẤP BẬC)
+# ==========================================
+
+# Ghi ở worker nào thì worker đó xóa cache ngay; các worker khác tự làm mới sau TTL
+CATALOG_CACHE_TTL_SECONDS = float(
+    os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+
+# ==========================================
+# KẾT NỐI DATABASE (POOL)
+# ==========================================
+
+# Mỗi worker có pool riêng: tổng kết nối tối đa = số worker x (POOL_SIZE + MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Số giây chờ lấy kết nối khi pool đã hết, quá thì báo lỗi
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Đóng và mở lại kết nối đã sống quá số giây này (-1 = không giới hạn)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Kiểm tra kết nối còn sống trước khi dùng (tránh lỗi sau khi DB restart)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Giới hạn thời gian mỗi câu lệnh SQL (ms, chỉ PostgreSQL), 0 = không giới hạn
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Lấy kết nối chậm hơn ngưỡng này (ms) thì được đếm là "chờ lâu"
+DB_POOL_SLOW_WAIT_MS = float(os.getenv("DB_POOL_SLOW_WAIT_MS", "100"))
+
+# ==========================================
+# ĐỌC TỪ REPLICA (READ_DATABASE_URL)
+# ==========================================
+
+# Sau khi user ghi dữ liệu, các request đọc của user đó đi vào primary trong
+# khoảng thời gian này để luôn thấy dữ liệu mình vừa ghi (replica có độ trễ)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PIN_CACHE_SIZE = int(os.getenv("READ_PIN_CACHE_SIZE", "100000"))
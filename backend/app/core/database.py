@@ -1,21 +1,248 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from typing import Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
 
+from app.core import config, metrics, slow_queries
+from app.core.cache import TTLCache
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Driver async tương ứng với driver sync trong DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Replica chỉ đọc (không bắt buộc), không có thì mọi thứ đọc từ primary
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+
+# ==========================================
+# POOL KẾT NỐI CÓ ĐO ĐẠC
+# ==========================================
+
+
+class PoolStats:
+    """Số liệu cộng dồn của 1 pool: số lần lấy kết nối, thời gian chờ, timeout."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.slow_waits = 0
+        self.timeouts = 0
+        self.overflow_peak = 0
+
+    def record(self, waited: float, overflow: int):
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        if waited * 1000 >= config.DB_POOL_SLOW_WAIT_MS:
+            self.slow_waits += 1
+        self.overflow_peak = max(self.overflow_peak, overflow)
+
+
+class _TimedCheckout:
+    """
+    Đo thời gian lấy kết nối từ pool (_do_get: chờ kết nối rảnh hoặc mở kết
+    nối mới). stats gắn vào class để pool tạo lại (recreate) vẫn dùng chung.
+    """
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - started, self._overflow)
+        return record
+
+
+def _instrumented(base, name: str):
+    return type(f"Instrumented{base.__name__}", (_TimedCheckout, base),
+                {"stats": PoolStats(name)})
+
+
+def _engine_options(url: str, pool_class, name: str) -> dict:
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        # SQLite không có server / statement_timeout: giữ pool mặc định
+        return {}
+
+    options = {
+        "poolclass": _instrumented(pool_class, name),
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+    if backend == "postgresql" and config.DB_STATEMENT_TIMEOUT_MS > 0:
+        timeout = str(config.DB_STATEMENT_TIMEOUT_MS)
+        driver = make_url(url).get_driver_name()
+        if driver == "asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def pool_status(engine) -> dict:
+    """Trạng thái hiện tại + số liệu cộng dồn của pool (cho /internal/db-pool)."""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return status
+
+    status.update({
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "timeout_seconds": pool.timeout(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    })
+
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update({
+            "checkouts": stats.checkouts,
+            "wait_ms_avg": round(stats.wait_seconds_total * 1000 / stats.checkouts, 3)
+            if stats.checkouts else 0.0,
+            "wait_ms_max": round(stats.wait_seconds_max * 1000, 3),
+            "slow_waits": stats.slow_waits,
+            "timeouts": stats.timeouts,
+            "overflow_peak": stats.overflow_peak,
+        })
+    return status
+
+
+# Engine sync: chỉ dùng cho tạo bảng và các script chạy ngoài request
+engine = create_engine(DATABASE_URL, **_engine_options(
+    DATABASE_URL, QueuePool, "sync"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine async: dùng cho toàn bộ request, không chiếm thread khi chờ DB
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(
+    ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, "async"))
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Engine đọc: replica nếu có cấu hình, không thì dùng luôn engine primary
+if READ_DATABASE_URL:
+    ASYNC_READ_DATABASE_URL = to_async_url(READ_DATABASE_URL)
+    read_engine = create_async_engine(ASYNC_READ_DATABASE_URL, **_engine_options(
+        ASYNC_READ_DATABASE_URL, AsyncAdaptedQueuePool, "read"))
+else:
+    read_engine = async_engine
+ReadSessionLocal = async_sessionmaker(
+    read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Đếm số câu SQL / thời gian DB của từng request (xem app/core/metrics.py)
+if config.METRICS_ENABLED:
+    for _engine in {async_engine, read_engine}:
+        metrics.instrument_engine(_engine.sync_engine)
+
+# Ghi lại câu SQL chậm (xem app/core/slow_queries.py)
+if config.SLOW_QUERY_MS > 0:
+    for _engine in {async_engine, read_engine}:
+        slow_queries.instrument_engine(_engine)
+
 Base = declarative_base()
 
+# ==========================================
+# READ-YOUR-WRITES: GHIM USER VÀO PRIMARY SAU KHI GHI
+# ==========================================
 
-def get_db():
-    db = SessionLocal()
+# user (sub trong token) -> vừa ghi dữ liệu, hết hạn sau READ_YOUR_WRITES_SECONDS.
+# Lưu trong process: nếu chạy nhiều worker thì cần sticky session ở load balancer
+# để request kế tiếp quay lại đúng worker.
+primary_pins = TTLCache(maxsize=config.READ_PIN_CACHE_SIZE,
+                        ttl=config.READ_YOUR_WRITES_SECONDS)
+
+
+def _request_user_key(request: Request) -> Optional[str]:
+    # Chỉ dùng để chọn DB nên không cần verify chữ ký (token giả chỉ khiến
+    # request đi vào primary); xác thực thật vẫn nằm ở get_current_user
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
     try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+def _note_write(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["wrote"] = True
+
+
+def _pin_after_commit(session):
+    if session.info.pop("wrote", False) and session.info.get("user_key"):
+        primary_pins.set(session.info["user_key"], True)
+
+
+def _note_core_write(orm_execute_state):
+    # INSERT / UPDATE / DELETE gọi thẳng bằng db.execute() không đi qua flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+def _forget_write(session, previous_transaction):
+    session.info.pop("wrote", None)
+
+
+event.listen(Session, "after_flush", _note_write)
+event.listen(Session, "do_orm_execute", _note_core_write)
+event.listen(Session, "after_commit", _pin_after_commit)
+event.listen(Session, "after_soft_rollback", _forget_write)
+
+
+async def get_db(request: Request):
+    # Thoát khỏi "async with" luôn trả kết nối về pool (rollback nếu chưa commit)
+    async with AsyncSessionLocal() as db:
+        db.info["user_key"] = _request_user_key(request)
+        yield db
+
+
+async def get_read_db(request: Request):
+    """
+    Session cho API chỉ đọc: đi vào replica, trừ khi user vừa ghi dữ liệu
+    (trong READ_YOUR_WRITES_SECONDS) thì đọc từ primary.
+    """
+    user_key = _request_user_key(request)
+    use_primary = read_engine is async_engine or (
+        user_key is not None and primary_pins.get(user_key) is not None)
+
+    session_factory = AsyncSessionLocal if use_primary else ReadSessionLocal
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,59 @@
+from functools import lru_cache
+from typing import List, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+# Tạo sẵn loader options cho từng cặp (model, response schema).
+# Quan hệ nào xuất hiện trong schema thì được load kèm ngay trong câu query:
+# - Quan hệ 1 đối tượng (many-to-one) -> joinedload (JOIN vào câu SELECT chính)
+# - Quan hệ danh sách (one-to-many)   -> selectinload (1 câu SELECT ... IN)
+# Nhờ vậy số câu SQL của một request không phụ thuộc vào số dòng trả về.
+
+
+def _nested_schema(annotation) -> Union[Type[BaseModel], None]:
+    # Bóc Optional[...] / List[...] để lấy schema con (nếu có)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    if get_origin(annotation) is None:
+        return None
+    for arg in get_args(annotation):
+        nested = _nested_schema(arg)
+        if nested is not None:
+            return nested
+    return None
+
+
+def _build_options(model, schema: Type[BaseModel], parent=None) -> List:
+    options = []
+    relationships = inspect(model).relationships
+
+    for field_name, field in schema.model_fields.items():
+        rel = relationships.get(field_name)
+        nested = _nested_schema(field.annotation)
+        if rel is None or nested is None:
+            continue
+
+        attr = getattr(model, field_name)
+        loader = selectinload if rel.uselist else joinedload
+        option = loader(attr) if parent is None else getattr(
+            parent, loader.__name__)(attr)
+
+        children = _build_options(rel.mapper.class_, nested, option)
+        options.extend(children or [option])
+
+    return options
+
+
+@lru_cache(maxsize=None)
+def _cached_options(model, schema: Type[BaseModel]) -> Tuple:
+    return tuple(_build_options(model, schema))
+
+
+def eager_options(model, schema: Type[BaseModel]) -> Tuple:
+    """
+    Trả về các loader option phù hợp với response schema, dùng với
+    query.options(*eager_options(Model, Schema)).
+    """
+    return _cached_options(model, schema)
@@ -0,0 +1,151 @@
+"""
+Header Idempotency-Key cho các API ghi (đặt lịch, xác nhận thanh toán): client
+gửi lại cùng 1 request (mạng chập chờn, timeout) với cùng key thì nhận lại đúng
+response lần đầu, kèm header Idempotent-Replayed: true, mà không chạy lại logic
+ghi (tìm bác sĩ, kiểm tra trùng lịch, INSERT...).
+
+- Key (theo từng user) được ghi vào bảng idempotency_keys trong CÙNG transaction
+  với thay đổi dữ liệu, nên key chỉ tồn tại khi thay đổi đã commit. Request lỗi
+  (404, 409...) rollback luôn key: gửi lại sẽ chạy lại như request mới.
+- 2 request cùng key chạy song song: request sau bị chặn ở INSERT khóa chính
+  tới khi request trước commit, rồi trả response của request trước.
+- Cùng key nhưng khác nội dung (đường dẫn / body) -> 400.
+- Key hết hạn sau IDEMPOTENCY_TTL_SECONDS, dọn bằng:
+  python -m app.cli idempotency purge
+- Response đã trả lại được cache trong process: các lần gửi lại tiếp theo không
+  cần query DB.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Optional
+
+from fastapi import Header, HTTPException, Request, status
+from sqlalchemy import Column, DateTime, Integer, String, Text, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import config, responses
+from app.core.cache import TTLCache
+from app.core.database import Base
+from app.core.timeutils import utcnow_naive
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    key = Column(String(MAX_KEY_LENGTH), primary_key=True)
+    # sha256 của method + đường dẫn + body (JSON đã chuẩn hóa)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    # Body JSON của response lần đầu
+    response = Column(Text)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# (user_id, key) -> (fingerprint, status_code, body)
+response_cache = TTLCache(maxsize=config.IDEMPOTENCY_CACHE_SIZE,
+                          ttl=min(config.IDEMPOTENCY_CACHE_TTL_SECONDS,
+                                  config.IDEMPOTENCY_TTL_SECONDS))
+
+
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    try:
+        # Chuẩn hóa để khác biệt khoảng trắng / thứ tự field không tính là khác
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(b"%s %s\n%s" % (method.encode(), path.encode(), body)).hexdigest()
+
+
+class Idempotency:
+    """Idempotency-Key của 1 request; key None (client không gửi) thì không làm gì."""
+
+    def __init__(self, key: Optional[str], fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.user_id = None
+
+    def _replay(self, fingerprint: str, status_code: int, body: bytes):
+        if fingerprint != self.fingerprint:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Idempotency-Key đã được dùng cho request khác")
+        return responses.FastJSONResponse(body, status_code=status_code,
+                                          headers={REPLAYED_HEADER: "true"})
+
+    async def begin(self, db: AsyncSession, user_id) -> Optional[responses.FastJSONResponse]:
+        """
+        Giữ key trong transaction hiện tại của db. Key đã dùng (request gửi lại)
+        thì trả response cũ, route trả luôn response đó.
+        Gọi trước mọi thay đổi dữ liệu: INSERT lỗi sẽ rollback cả transaction.
+        """
+        if self.key is None:
+            return None
+        self.user_id = user_id
+        cache_key = (user_id, self.key)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return self._replay(*cached)
+
+        match = (IdempotencyKey.user_id == user_id) & (IdempotencyKey.key == self.key)
+        # Lần 2 chỉ xảy ra khi key cũ đã hết hạn (vừa bị xóa)
+        for _ in range(2):
+            try:
+                await db.execute(insert(IdempotencyKey).values(
+                    user_id=user_id, key=self.key, fingerprint=self.fingerprint,
+                    expires_at=utcnow_naive() + timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS)))
+                return None
+            except IntegrityError:
+                await db.rollback()
+
+            row = (await db.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                       IdempotencyKey.response, IdempotencyKey.expires_at)
+                .where(match))).one_or_none()
+            if row is not None and row.expires_at > utcnow_naive():
+                cached = (row.fingerprint, row.status_code, row.response.encode())
+                response_cache.set(cache_key, cached)
+                return self._replay(*cached)
+            await db.execute(delete(IdempotencyKey).where(match))
+
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Request cùng Idempotency-Key đang được xử lý")
+
+    async def commit(self, db: AsyncSession, schema: Any, data: Any,
+                     status_code: int = status.HTTP_200_OK) -> responses.FastJSONResponse:
+        """
+        Serialize response theo schema, lưu vào key (nếu có) rồi commit cùng
+        thay đổi dữ liệu trong 1 transaction.
+        """
+        body = responses.dump(schema, data)
+        if self.key is not None:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+                .values(status_code=status_code, response=body.decode()))
+        await db.commit()
+        return responses.FastJSONResponse(body, status_code=status_code)
+
+
+async def get_idempotency(
+        request: Request,
+        idempotency_key: Optional[str] = Header(
+            None, alias="Idempotency-Key", min_length=1, max_length=MAX_KEY_LENGTH)
+) -> Idempotency:
+    if idempotency_key is None:
+        return Idempotency(None, "")
+    body = await request.body()
+    return Idempotency(idempotency_key,
+                       request_fingerprint(request.method, request.url.path, body))
+
+
+def purge_expired(db) -> int:
+    """Xóa key đã hết hạn (session sync, dùng cho CLI). Trả số dòng đã xóa."""
+    result = db.execute(delete(IdempotencyKey)
+                        .where(IdempotencyKey.expires_at <= utcnow_naive()))
+    return result.rowcount
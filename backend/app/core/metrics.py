@@ -0,0 +1,209 @@
+"""
+Đo đạc theo từng request: thời gian xử lý, số câu SQL và tổng thời gian chờ DB,
+gom theo route (template, vd /doctors/{doctor_id}/availability) và xuất ra
+định dạng text của Prometheus ở /metrics.
+
+- MetricsMiddleware là ASGI middleware thuần (không dùng BaseHTTPMiddleware)
+  để overhead mỗi request chỉ vài µs.
+- Số liệu SQL của request hiện tại nằm trong 1 ContextVar; event của engine
+  (instrument_engine) cộng dồn vào đó. Câu SQL chạy ngoài request (CLI, script)
+  không được tính.
+- Số liệu lưu trong process: mỗi worker xuất số liệu của riêng nó, Prometheus
+  phân biệt theo instance khi scrape.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+# Bucket (giây / số câu) theo giới hạn trên, giống mặc định của client Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Request không khớp route nào (404, quét đường dẫn lạ) gom chung 1 nhãn để số
+# nhãn không tăng vô hạn
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Histogram kiểu Prometheus, lưu số đếm từng bucket (chưa cộng dồn)."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # phần tử cuối: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Số liệu SQL của 1 request, gắn vào ContextVar trong lúc xử lý request."""
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_route() -> Optional[str]:
+    """Route của request đang xử lý (None nếu chạy ngoài request)."""
+    stats = _current.get()
+    return route_template(stats.scope) if stats is not None else None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # (method, route, status) -> histogram thời gian xử lý
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}
+        # (method, route) -> histogram số câu SQL / thời gian DB mỗi request
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+
+    def record(self, method: str, route: str, status: int, seconds: float,
+               stats: RequestStats):
+        key = (method, route, str(status))
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+        key = (method, route)
+        histogram = self.queries.get(key)
+        if histogram is None:
+            histogram = self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.db_time[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(stats.queries)
+        self.db_time[key].observe(stats.db_seconds)
+
+    def reset(self):
+        self.latency.clear()
+        self.queries.clear()
+        self.db_time.clear()
+
+    def render(self) -> str:
+        """Định dạng text exposition 0.0.4 của Prometheus."""
+        lines = []
+        _render(lines, "http_request_duration_seconds",
+                "Thời gian xử lý request (giây)",
+                ("method", "route", "status"), self.latency)
+        _render(lines, "http_request_db_queries",
+                "Số câu SQL mỗi request", ("method", "route"), self.queries)
+        _render(lines, "http_request_db_seconds",
+                "Tổng thời gian chạy SQL mỗi request (giây)",
+                ("method", "route"), self.db_time)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _render(lines, name, help_text, label_names, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        labels = ",".join(f'{label}="{_escape(value)}"'
+                          for label, value in zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+registry = MetricsRegistry()
+
+
+def route_template(scope) -> str:
+    """
+    Đường dẫn dạng template của request, vd /doctors/{doctor_id}/availability.
+    Router ghi route khớp + path_params vào scope (dùng chung dict với
+    middleware); thay giá trị tham số bằng tên tham số thay vì đọc route.path
+    vì route trong router con (include_router) không phải lúc nào cũng kèm prefix.
+    """
+    if scope.get("route") is None:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    params = scope.get("path_params")
+    if not params:
+        return path
+    names = {str(value): "{" + name + "}" for name, value in params.items()}
+    return "/".join(names.get(part, part) for part in path.split("/"))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            registry.record(scope["method"], route_template(scope),
+                            status_code, elapsed, stats)
+
+
+# ==========================================
+# ĐẾM SQL TRÊN ENGINE
+# ==========================================
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _finish_query(conn):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is None or not started:
+        return
+    stats.db_seconds += time.perf_counter() - started.pop()
+    stats.queries += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(conn)
+
+
+def _on_error(exception_context):
+    # Câu lỗi (vd vi phạm ràng buộc) không có after_cursor_execute
+    if exception_context.connection is not None:
+        _finish_query(exception_context.connection)
+
+
+def instrument_engine(sync_engine):
+    """Gắn event đếm SQL vào engine (với AsyncEngine thì truyền .sync_engine)."""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _on_error)
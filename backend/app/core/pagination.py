@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+# Phân trang keyset (cursor): thay vì OFFSET, trang sau được lấy bằng điều kiện
+# (col1, col2) > (giá trị cuối trang trước). Trang thứ N tốn chi phí như trang 1
+# vì DB đi thẳng vào index, không phải quét rồi bỏ các dòng phía trước.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _dump(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _load(value: Any, python_type: type):
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is UUID:
+        return UUID(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_dump(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> Tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor length mismatch")
+        return tuple(_load(v, col.type.python_type)
+                     for v, col in zip(values, columns))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Cursor không hợp lệ.")
+
+
+def keyset_filter(query, columns: Sequence, cursor: Optional[str], limit: int,
+                  descending: bool = False):
+    """
+    Gắn điều kiện keyset + ORDER BY + LIMIT vào query.
+    Lấy dư 1 dòng (limit + 1) để biết còn trang sau hay không.
+    """
+    if cursor:
+        last_values = decode_cursor(cursor, columns)
+        keys = tuple_(*columns)
+        query = query.filter(
+            keys < tuple_(*last_values) if descending else keys > tuple_(*last_values))
+
+    order = [col.desc() if descending else col.asc() for col in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows: List, columns: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    """Tách kết quả thành (items, next_cursor)."""
+    if len(rows) <= limit:
+        return rows, None
+
+    items = rows[:limit]
+    last = items[-1]
+    return items, encode_cursor([getattr(last, col.key) for col in columns])
+
+
+def cursor_headers(next_cursor: Optional[str]) -> Optional[dict]:
+    """Header X-Next-Cursor cho response trả thẳng (không qua tham số Response)."""
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
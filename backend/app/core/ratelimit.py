@@ -0,0 +1,242 @@
+"""
+Giới hạn tần suất gọi các API tốn CPU (đăng nhập, đăng ký: mỗi lần hash Argon2
+mất ~50-100ms) theo IP và theo email, chặn ngay từ dependency, trước khi query
+DB hay xếp job vào pool hash.
+
+- Mỗi policy là 1 token bucket: tối đa `burst` request liền nhau, hồi lại đều
+  `burst` request mỗi `period` giây. Lưu dạng GCRA: mỗi key chỉ 1 số float
+  (thời điểm bucket đầy trở lại), key đã hồi đầy tương đương không có nên bị
+  xóa / đẩy ra khỏi LRU mà không mất thông tin.
+- Mặc định đếm trong process (mỗi worker 1 bộ đếm riêng, giới hạn thực tế =
+  số worker x burst). Đặt RATE_LIMIT_REDIS_URL để dùng chung giữa các worker
+  (cần cài thêm: pip install redis); Redis lỗi thì tạm đếm trong process.
+- Quá giới hạn -> 429 kèm Retry-After. Số liệu ở /internal/rate-limit và /metrics.
+"""
+import ipaddress
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.core import config
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # redis là tùy chọn, chỉ cần khi đặt RATE_LIMIT_REDIS_URL
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Policy:
+    name: str
+    # Lấy key từ đâu: "ip" hoặc "email" (field email trong body JSON)
+    key: str
+    burst: int
+    period: float
+
+    @property
+    def interval(self) -> float:
+        """Số giây để hồi lại 1 request."""
+        return self.period / self.burst
+
+    @classmethod
+    def parse(cls, name: str, key: str, spec: str) -> "Policy":
+        """spec dạng "<burst>/<giây>", vd "10/60" = 10 request mỗi phút."""
+        burst, _, period = spec.partition("/")
+        return cls(name, key, int(burst), float(period))
+
+
+# Policy theo route, dùng: Depends(rate_limit("login"))
+ROUTE_POLICIES: Dict[str, Tuple[Policy, ...]] = {
+    "login": (
+        Policy.parse("login:ip", "ip", config.RATE_LIMIT_LOGIN_PER_IP),
+        Policy.parse("login:email", "email", config.RATE_LIMIT_LOGIN_PER_EMAIL),
+    ),
+    # Bệnh nhân và bác sĩ đăng ký dùng chung bucket theo IP
+    "register": (
+        Policy.parse("register:ip", "ip", config.RATE_LIMIT_REGISTER_PER_IP),
+    ),
+}
+
+
+class LocalBackend:
+    """Bucket trong process: LRU có giới hạn, key -> thời điểm bucket đầy lại (GCRA)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self.evictions = 0
+
+    async def hit(self, key: str, interval: float, period: float) -> float:
+        """Trả 0 nếu được phép, ngược lại số giây phải chờ."""
+        now = time.monotonic()
+        full_at = max(self._full_at.get(key, now), now)
+        wait = full_at + interval - now - period
+        if wait > 0:
+            return wait
+
+        self._full_at[key] = full_at + interval
+        self._full_at.move_to_end(key)
+        # Bỏ các key cũ nhất: phần lớn đã hồi đầy nên bỏ đi không ảnh hưởng
+        while len(self._full_at) > self.maxsize:
+            self._full_at.popitem(last=False)
+            self.evictions += 1
+        return 0.0
+
+    def __len__(self):
+        return len(self._full_at)
+
+
+# Cùng thuật toán với LocalBackend, chạy nguyên tử trong Redis (giờ lấy từ Redis
+# để các worker không phụ thuộc đồng hồ của nhau)
+_REDIS_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local full_at = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local wait = full_at + interval - now - period
+if wait > 0 then
+    return tostring(wait)
+end
+full_at = full_at + interval
+redis.call('SET', KEYS[1], tostring(full_at), 'PX', math.ceil((full_at - now) * 1000))
+return '0'
+"""
+
+
+class RedisBackend:
+    """Bucket dùng chung giữa các worker / server qua Redis."""
+
+    def __init__(self, url: str):
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_SCRIPT)
+
+    async def hit(self, key: str, interval: float, period: float) -> float:
+        return float(await self.script(keys=[f"ratelimit:{key}"], args=[interval, period]))
+
+
+class RateLimiter:
+    def __init__(self, backend=None, local: Optional[LocalBackend] = None):
+        self.local = local or LocalBackend(config.RATE_LIMIT_CACHE_SIZE)
+        self.backend = backend or self.local
+        # policy -> [số request được phép, số request bị chặn]
+        self.counters: Dict[str, list] = {}
+        self.backend_errors = 0
+        self._error_logged_at = 0.0
+
+    async def hit(self, policy: Policy, value: str) -> float:
+        """Trừ 1 request khỏi bucket (policy, value). Trả số giây phải chờ (0 = được phép)."""
+        key = f"{policy.name}:{value}"
+        try:
+            wait = await self.backend.hit(key, policy.interval, policy.period)
+        except Exception as e:
+            if self.backend is self.local:
+                raise
+            # Redis lỗi: vẫn giới hạn được trong từng worker
+            self.backend_errors += 1
+            if time.monotonic() - self._error_logged_at > 60:
+                self._error_logged_at = time.monotonic()
+                logger.warning("Rate limit backend lỗi, tạm đếm trong process: %s", e)
+            wait = await self.local.hit(key, policy.interval, policy.period)
+
+        counter = self.counters.setdefault(policy.name, [0, 0])
+        counter[1 if wait > 0 else 0] += 1
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "enabled": config.RATE_LIMIT_ENABLED,
+            "backend": "redis" if self.backend is not self.local else "local",
+            "backend_errors": self.backend_errors,
+            "local_keys": len(self.local),
+            "local_evictions": self.local.evictions,
+            "policies": {
+                policy.name: {
+                    "burst": policy.burst, "period_seconds": policy.period,
+                    "allowed": self.counters.get(policy.name, [0, 0])[0],
+                    "limited": self.counters.get(policy.name, [0, 0])[1],
+                }
+                for policies in ROUTE_POLICIES.values() for policy in policies
+            },
+        }
+
+    def render(self) -> str:
+        """Counter dạng text của Prometheus (nối vào /metrics)."""
+        name = "rate_limit_requests_total"
+        lines = [f"# HELP {name} Số request qua rate limit theo policy",
+                 f"# TYPE {name} counter"]
+        for policy, (allowed, limited) in sorted(self.counters.items()):
+            lines.append(f'{name}{{policy="{policy}",result="allowed"}} {allowed}')
+            lines.append(f'{name}{{policy="{policy}",result="limited"}} {limited}')
+        return "\n".join(lines) + "\n"
+
+
+def _create_limiter() -> RateLimiter:
+    if not config.RATE_LIMIT_REDIS_URL:
+        return RateLimiter()
+    if redis is None:
+        logger.warning("Đã đặt RATE_LIMIT_REDIS_URL nhưng chưa cài redis, đếm trong process")
+        return RateLimiter()
+    return RateLimiter(RedisBackend(config.RATE_LIMIT_REDIS_URL))
+
+
+limiter = _create_limiter()
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP của client. Sau reverse proxy (RATE_LIMIT_TRUST_FORWARDED_FOR) lấy địa
+    chỉ cuối cùng trong X-Forwarded-For, tức địa chỉ do proxy của mình thêm vào;
+    các giá trị phía trước do client tự gửi nên không tin được.
+    """
+    if config.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for", "").rsplit(",", 1)[-1].strip()
+        if forwarded:
+            return forwarded
+    host = request.client.host if request.client else "unknown"
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host
+    # IPv6: 1 người dùng thường có cả dải /64, giới hạn theo dải
+    if address.version == 6:
+        return str(ipaddress.ip_network(f"{host}/64", strict=False))
+    return host
+
+
+async def _request_email(request: Request) -> Optional[str]:
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    email = body.get("email") if isinstance(body, dict) else None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def rate_limit(route: str):
+    """Dependency giới hạn tần suất theo các policy của route (ROUTE_POLICIES)."""
+    policies = ROUTE_POLICIES[route]
+
+    async def dependency(request: Request):
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        for policy in policies:
+            value = client_ip(request) if policy.key == "ip" else await _request_email(request)
+            if value is None:
+                continue
+            wait = await limiter.hit(policy, value)
+            if wait > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Thao tác quá nhiều lần, vui lòng thử lại sau.",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+
+    return dependency
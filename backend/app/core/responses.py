@@ -0,0 +1,58 @@
+from functools import lru_cache
+from typing import Any, Mapping, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from starlette.background import BackgroundTask
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, thiếu thì dùng json.dumps như JSONResponse
+    orjson = None
+
+# Serialize nhanh cho các API trả danh sách lớn.
+# Mặc định FastAPI validate ORM -> model, rồi jsonable_encoder đi lại toàn bộ cây
+# object thêm 1 lần nữa trước khi json.dumps. Ở đây mỗi schema có sẵn 1
+# TypeAdapter: validate từ ORM 1 lần rồi ghi thẳng ra bytes (pydantic-core, Rust).
+# Kết quả giống hệt JSONResponse của FastAPI (cũng serialize theo mode "json" của
+# pydantic): không khoảng trắng, UTF-8, không escape ký tự.
+
+
+@lru_cache(maxsize=None)
+def adapter(schema: Any) -> TypeAdapter:
+    """TypeAdapter dựng 1 lần cho mỗi kiểu (vd List[schemas.DoctorResponse])."""
+    return TypeAdapter(schema)
+
+
+def dump(schema: Any, data: Any) -> bytes:
+    """Validate data (object ORM / dict) theo schema rồi serialize ra JSON bytes."""
+    type_adapter = adapter(schema)
+    value = type_adapter.validate_python(data, from_attributes=True)
+    return type_adapter.dump_json(value)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse dùng orjson (nếu có cài) thay cho json.dumps.
+    Nhận cả bytes đã serialize sẵn (từ dump()) thì trả nguyên.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if orjson is not None:
+            return orjson.dumps(content)
+        return super().render(content)
+
+
+def model_response(schema: Any, data: Any, status_code: int = 200,
+                   headers: Optional[Mapping[str, str]] = None,
+                   background: Optional[BackgroundTask] = None) -> FastJSONResponse:
+    """
+    Trả thẳng response đã serialize theo schema. Route vẫn khai báo
+    response_model để sinh tài liệu OpenAPI; FastAPI sẽ không validate lại.
+    Lưu ý: header gán vào tham số `response: Response` của route không được
+    gộp vào response trả thẳng, phải truyền qua headers.
+    """
+    return FastJSONResponse(dump(schema, data), status_code=status_code,
+                            headers=headers, background=background)
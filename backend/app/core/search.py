@@ -0,0 +1,155 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import DDL, Index, event, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Tìm kiếm gần đúng (trigram) cho user / chuyên khoa.
+# - PostgreSQL: pg_trgm + index GIN (gin_trgm_ops) trên từng cột, ILIKE '%x%' và
+#   toán tử "<%" (word similarity) đều đi được vào index, xếp hạng bằng
+#   word_similarity() ngay trong DB.
+# - DB khác (SQLite khi test / dev): index n-gram trong process, dựng từ DB ở lần
+#   tìm đầu tiên, bị đánh dấu cũ mỗi khi có commit thay đổi bảng tương ứng.
+
+# Giống ngưỡng mặc định pg_trgm.word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+DEFAULT_LIMIT = 20
+
+
+def trigram_index(name: str, column: str) -> Index:
+    """Index GIN trigram cho 1 cột (chỉ tạo trên PostgreSQL)."""
+    return Index(name, column, postgresql_using="gin",
+                 postgresql_ops={column: "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+
+
+def enable_trigram_extension(table):
+    event.listen(table, "before_create", DDL(
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+
+# --- Index n-gram trong process (fallback) ---
+
+_WORD = re.compile(r"\w+")
+
+
+def trigrams(text: Optional[str]) -> Set[str]:
+    """Tách trigram giống pg_trgm: chữ thường, mỗi từ đệm 2 khoảng trắng đầu, 1 ở cuối."""
+    grams: Set[str] = set()
+    for word in _WORD.findall((text or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NgramIndex:
+    def __init__(self):
+        self.stale = True
+        self._texts: Dict[object, List[str]] = {}
+        self._postings: Dict[str, Set[object]] = defaultdict(set)
+
+    def build(self, rows):
+        """rows: (id, text1, text2, ...)"""
+        self._texts.clear()
+        self._postings.clear()
+        for row_id, *texts in rows:
+            texts = [t.lower() for t in texts if t]
+            self._texts[row_id] = texts
+            for text in texts:
+                for gram in trigrams(text):
+                    self._postings[gram].add(row_id)
+
+    def search(self, term: str) -> List[Tuple[object, float]]:
+        """Các id khớp (chứa chuỗi con hoặc đủ giống), điểm cao trước."""
+        needle = term.lower()
+        query = trigrams(term)
+
+        # Đếm số trigram trùng với từ khóa cho mỗi ứng viên
+        shared: Dict[object, int] = defaultdict(int)
+        for gram in query:
+            for row_id in self._postings.get(gram, ()):
+                shared[row_id] += 1
+
+        results = []
+        for row_id, texts in self._texts.items():
+            score = shared.get(row_id, 0) / len(query) if query else 0.0
+            # Giống ILIKE '%term%' hoặc đủ giống theo trigram
+            if score < WORD_SIMILARITY_THRESHOLD and not any(
+                    needle in text for text in texts):
+                continue
+            results.append((row_id, score))
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results
+
+
+_ngram_indexes: Dict[type, NgramIndex] = {}
+
+
+# Ghi nhận bảng bị sửa lúc flush, chỉ đánh dấu index cũ khi đã commit
+# (trước đó session khác chưa thấy dữ liệu mới)
+def _collect_changes(session, flush_context):
+    changed = {type(obj) for obj in (*session.new, *session.dirty, *session.deleted)}
+    session.info.setdefault("search_changed", set()).update(changed)
+
+
+def mark_stale(*models):
+    """
+    Đánh dấu index của các bảng là cũ. Dùng sau khi commit các thay đổi ghi
+    bằng Core (insert / update), không đi qua session.new / dirty.
+    """
+    for model in models:
+        if model in _ngram_indexes:
+            _ngram_indexes[model].stale = True
+
+
+def _mark_stale(session):
+    mark_stale(*session.info.pop("search_changed", ()))
+
+
+def _forget_changes(session, previous_transaction):
+    session.info.pop("search_changed", None)
+
+
+event.listen(Session, "after_flush", _collect_changes)
+event.listen(Session, "after_commit", _mark_stale)
+event.listen(Session, "after_soft_rollback", _forget_changes)
+
+
+# --- API dùng chung ---
+
+def _score(term: str, columns: Sequence):
+    return func.greatest(*[func.word_similarity(term, func.coalesce(col, ""))
+                           for col in columns])
+
+
+async def search(db: AsyncSession, query, columns: Sequence, term: str,
+                 limit: int = DEFAULT_LIMIT) -> list:
+    """
+    Chạy query (select(Model) đã gắn sẵn bộ lọc khác) chỉ lấy các dòng khớp
+    term trên columns, sắp xếp theo độ giống giảm dần, tối đa limit dòng.
+    """
+    model = query.column_descriptions[0]["entity"]
+
+    if db.get_bind().dialect.name == "postgresql":
+        pattern = f"%{term}%"
+        matches = [cond for col in columns
+                   for cond in (col.ilike(pattern), literal(term).op("<%")(col))]
+        ranked = (query.where(or_(*matches))
+                  .order_by(_score(term, columns).desc(), model.id)
+                  .limit(limit))
+        return list((await db.scalars(ranked)).all())
+
+    index = _ngram_indexes.setdefault(model, NgramIndex())
+    if index.stale:
+        # Đánh dấu trước khi đọc: commit xen giữa sẽ đánh dấu cũ lại
+        index.stale = False
+        index.build(await db.execute(select(model.id, *columns)))
+
+    scores = dict(index.search(term))
+    if not scores:
+        return []
+    rows = (await db.scalars(query.where(model.id.in_(scores)))).all()
+    return sorted(rows, key=lambda row: (-scores[row.id], str(row.id)))[:limit]
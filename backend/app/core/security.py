@@ -1,32 +1,135 @@
+import asyncio
+import multiprocessing
 import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from jose import jwt
+from app.core import config
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+# Access token sống ngắn: thu hồi (đăng xuất, khóa tài khoản) chỉ cần giữ
+# danh sách trong bộ nhớ tới khi token hết hạn; hết hạn thì dùng refresh token
 ACCESS_TOKEN_EXPIRE_MINUTES = int(
-    os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # Default 1 day
+    os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 # Khởi động CryptContext để xử lý mật khẩu
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=config.ARGON2_TIME_COST,
+    argon2__memory_cost=config.ARGON2_MEMORY_COST,
+    argon2__parallelism=config.ARGON2_PARALLELISM,
+)
 
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    # Trả về (đúng mật khẩu?, hash mới nếu tham số Argon2 đã thay đổi)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def create_access_token(data: dict):
+def get_password_hashes(passwords: List[str]) -> List[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+# ==========================================
+# POOL PROCESS RIÊNG CHO ARGON2
+# ==========================================
+# Argon2 tốn CPU -> chạy trong pool process riêng (số process = số core)
+# để không chiếm event loop / threadpool của các API khác.
+# Hàng đợi có giới hạn: quá HASH_MAX_PENDING job thì từ chối ngay bằng 503.
+
+_hash_executor: Optional[ProcessPoolExecutor] = None
+_hash_pending = 0
+
+
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(
+            max_workers=config.HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_executor
+
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
+async def _run_hash_job(func, *args, shed: bool = True):
+    global _hash_pending
+    if shed and _hash_pending >= config.HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hệ thống đang quá tải, vui lòng thử lại sau.",
+            headers={"Retry-After": str(config.HASH_RETRY_AFTER_SECONDS)},
+        )
+
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_executor(), func, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def verify_password_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    return await _run_hash_job(verify_and_update_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    return await _run_hash_job(get_password_hash, password)
+
+
+async def get_password_hashes_async(passwords: List[str], chunk_size: int = 8) -> List[str]:
+    """
+    Hash nhiều mật khẩu (import hàng loạt) song song trên pool hash. Chia thành
+    nhóm nhỏ, tối đa HASH_WORKERS nhóm cùng lúc: đăng nhập xen vào chỉ phải chờ
+    1 nhóm. Không bị từ chối khi pool quá tải, nhưng vẫn được tính vào hàng đợi.
+    """
+    limit = asyncio.Semaphore(config.HASH_WORKERS)
+
+    async def run(chunk):
+        async with limit:
+            return await _run_hash_job(get_password_hashes, chunk, shed=False)
+
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return [hashed for result in results for hashed in result]
+
+
+def _create_token(data: dict, token_type: str, lifetime: timedelta) -> str:
+    now = datetime.now(timezone.utc)
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + \
-        timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encode_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encode_jwt
+    # iat giữ phần lẻ của giây: so chính xác với mốc thu hồi toàn bộ token của user
+    to_encode.update({"type": token_type, "jti": uuid.uuid4().hex,
+                      "iat": now.timestamp(), "exp": now + lifetime})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_access_token(data: dict):
+    return _create_token(data, "access", timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(data: dict):
+    return _create_token(data, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
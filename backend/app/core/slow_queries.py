@@ -0,0 +1,221 @@
+"""
+Log câu SQL chậm: câu nào chạy lâu hơn SLOW_QUERY_MS được ghi vào 1 ring buffer
+trong process (đọc qua /internal/slow-queries) và log ở mức WARNING, kèm:
+
+- fingerprint: câu SQL đã chuẩn hóa (bỏ giá trị, gộp danh sách IN) để gom các
+  lần chạy của cùng 1 câu,
+- kiểu của tham số (không lưu giá trị để tránh lộ dữ liệu),
+- route của request gây ra câu SQL (cần METRICS_ENABLED),
+- lỗi (SQLSTATE hoặc tên lớp lỗi) nếu câu SQL lỗi, vd bị statement_timeout hủy,
+- plan (EXPLAIN, không ANALYZE) lấy ngẫu nhiên theo SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+  chạy ở task riêng bằng kết nối khác nên không làm chậm thêm request.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core import config, metrics
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Câu lệnh chạy EXPLAIN được (plan, không thực thi)
+_EXPLAIN_PREFIX = {
+    "postgresql": "EXPLAIN (ANALYZE off) ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+# Chuẩn hóa SQL thành fingerprint
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    sql = _STRING.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def _shape(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shapes(parameters, executemany: bool):
+    """
+    Kiểu của từng tham số, vd ["UUID", "datetime"] hoặc {"email": "str"}.
+    Các tham số liền nhau cùng kiểu (danh sách IN) gộp lại: ["str x 120"].
+    """
+    if executemany:
+        rows = list(parameters or [])
+        first = param_shapes(rows[0], False) if rows else None
+        return {"rows": len(rows), "first": first}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+
+    runs = []
+    for value in parameters or ():
+        shape = _shape(value)
+        if runs and runs[-1][0] == shape:
+            runs[-1][1] += 1
+        else:
+            runs.append([shape, 1])
+    return [shape if count == 1 else f"{shape} x {count}" for shape, count in runs]
+
+
+def error_code(exception: BaseException) -> str:
+    """SQLSTATE nếu driver có (vd 57014 = bị hủy do statement_timeout), không thì tên lớp lỗi."""
+    for attr in ("sqlstate", "pgcode"):
+        code = getattr(exception, attr, None)
+        if code:
+            return f"{type(exception).__name__} ({code})"
+    return type(exception).__name__
+
+
+class SlowQueryLog:
+    def __init__(self, maxsize: int):
+        self.entries: deque = deque(maxlen=maxsize)
+        # fingerprint -> plan đã lấy, để không EXPLAIN lại cùng 1 câu liên tục
+        self.plans = TTLCache(maxsize=maxsize, ttl=config.SLOW_QUERY_PLAN_TTL_SECONDS)
+        self.recorded = 0
+        self.explained = 0
+        self.explain_errors = 0
+        self._explaining = set()
+        self._tasks = set()
+
+    def record(self, async_engine: Optional[AsyncEngine], dialect: str, statement: str,
+               parameters, executemany: bool, seconds: float, error: Optional[str] = None):
+        sql = fingerprint(statement)
+        key = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(seconds * 1000, 2),
+            "fingerprint": key,
+            "sql": sql[:2000],
+            "params": param_shapes(parameters, executemany),
+            "route": metrics.current_route(),
+            "plan": self.plans.get(key),
+            "error": error,
+        }
+        self.entries.append(entry)
+        self.recorded += 1
+        logger.warning("Câu SQL chậm %.1f ms [%s] route=%s%s: %s",
+                       entry["duration_ms"], key, entry["route"],
+                       f" lỗi={error}" if error else "", entry["sql"][:500])
+
+        # Câu lỗi (vd bị statement_timeout hủy) không EXPLAIN: chạy lại plan có thể lỗi tiếp
+        if (error is None and entry["plan"] is None and async_engine is not None
+                and key not in self._explaining
+                and statement.lstrip().lower().startswith(_EXPLAINABLE)
+                and dialect in _EXPLAIN_PREFIX and not executemany
+                and random.random() < config.SLOW_QUERY_EXPLAIN_SAMPLE_RATE):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._explaining.add(key)
+            task = loop.create_task(self._explain(
+                async_engine, _EXPLAIN_PREFIX[dialect] + statement, parameters, key, entry))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, async_engine, statement, parameters, key, entry):
+        try:
+            async with async_engine.connect() as conn:
+                result = await conn.exec_driver_sql(statement, parameters)
+                plan = "\n".join(" | ".join(str(col) for col in row) for row in result)
+        except Exception as e:
+            self.explain_errors += 1
+            logger.warning("Không EXPLAIN được câu SQL [%s]: %s", key, e)
+            return
+        finally:
+            self._explaining.discard(key)
+        self.plans.set(key, plan)
+        entry["plan"] = plan
+        self.explained += 1
+
+    def snapshot(self, limit: int) -> dict:
+        entries = list(self.entries)[-limit:][::-1]
+        # Gom theo fingerprint: câu nào chậm nhiều nhất
+        summary = {}
+        for entry in self.entries:
+            item = summary.setdefault(entry["fingerprint"], {
+                "fingerprint": entry["fingerprint"], "sql": entry["sql"],
+                "count": 0, "max_ms": 0.0, "total_ms": 0.0, "routes": set()})
+            item["count"] += 1
+            item["max_ms"] = max(item["max_ms"], entry["duration_ms"])
+            item["total_ms"] = round(item["total_ms"] + entry["duration_ms"], 2)
+            if entry["route"]:
+                item["routes"].add(entry["route"])
+        for item in summary.values():
+            item["routes"] = sorted(item["routes"])
+
+        return {
+            "threshold_ms": config.SLOW_QUERY_MS,
+            "recorded": self.recorded,
+            "explained": self.explained,
+            "explain_errors": self.explain_errors,
+            "by_fingerprint": sorted(summary.values(), key=lambda i: i["total_ms"], reverse=True),
+            "recent": entries,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.plans.clear()
+
+
+slow_query_log = SlowQueryLog(config.SLOW_QUERY_BUFFER_SIZE)
+
+
+def instrument_engine(engine):
+    """Gắn event đo câu SQL chậm vào engine (sync hoặc AsyncEngine)."""
+    async_engine = engine if isinstance(engine, AsyncEngine) else None
+    sync_engine = engine.sync_engine if async_engine is not None else engine
+    threshold = config.SLOW_QUERY_MS / 1000
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("slow_query_started")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        # Bỏ qua chính câu EXPLAIN do _explain chạy
+        if elapsed >= threshold and not statement.startswith("EXPLAIN"):
+            slow_query_log.record(async_engine, conn.dialect.name, statement,
+                                  parameters, executemany, elapsed)
+
+    def on_error(exception_context):
+        conn = exception_context.connection
+        if conn is None or not conn.info.get("slow_query_started"):
+            return
+        elapsed = time.perf_counter() - conn.info["slow_query_started"].pop()
+        statement = exception_context.statement
+        # Câu lỗi cũng ghi lại nếu đã chạy lâu, nhất là câu bị statement_timeout hủy
+        if elapsed >= threshold and statement and not statement.startswith("EXPLAIN"):
+            context = exception_context.execution_context
+            slow_query_log.record(async_engine, conn.dialect.name, statement,
+                                  exception_context.parameters,
+                                  bool(context is not None and context.executemany),
+                                  elapsed, error_code(exception_context.original_exception))
+
+    event.listen(sync_engine, "before_cursor_execute", before)
+    event.listen(sync_engine, "after_cursor_execute", after)
+    event.listen(sync_engine, "handle_error", on_error)
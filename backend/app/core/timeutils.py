@@ -0,0 +1,14 @@
+from datetime import datetime, timezone
+
+# Các cột thời gian của lịch hẹn là DateTime không timezone, quy ước lưu giờ UTC.
+# Mọi giá trị từ client đều được đưa về UTC "naive" trước khi so sánh / ghi DB.
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utcnow_naive() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
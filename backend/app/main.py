@@ -1,25 +1,74 @@
 # app/main.py
-from fastapi import FastAPI
-from app.core.database import engine, Base
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from app.core.database import async_engine, read_engine
+from app.core import config, metrics, ratelimit, security
+from app.modules.auth import revocation
 from app.modules.auth.router import router as auth_router
 from app.modules.doctors.router import router as doctors_router
+from app.modules.appointments import partitions
 from app.modules.appointments.router import router as appointments_router
-from app.modules.doctors import models as doctor_models
-from app.modules.appointments import models as appointment_models
-from app.modules.auth import models
+from app.modules.internal.router import router as internal_router
 
-# Tạo bảng trong DB dua tren model.py
+# Không tạo bảng khi import: schema do migration quản lý (python -m app.cli db upgrade)
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Booking System API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.SCHEMA_CHECK:
+        # Chỉ import danh sách migration khi cần kiểm tra, không làm chậm import app
+        from app import migrations
+        await migrations.check_version(async_engine)
+
+    # Tạo trước partition lịch hẹn cho các tháng sắp tới (chỉ PostgreSQL),
+    # chạy nền để không làm chậm khởi động
+    maintenance = None
+    if (async_engine.dialect.name == "postgresql"
+            and config.PARTITION_MAINTENANCE_INTERVAL_SECONDS > 0):
+        maintenance = asyncio.create_task(partitions.run_maintenance(async_engine))
+
+    # Đồng bộ danh sách token bị thu hồi ở các worker khác
+    revocation_sync = None
+    if config.REVOCATION_SYNC_SECONDS > 0:
+        revocation_sync = asyncio.create_task(revocation.run_sync(async_engine))
+
+    yield
+
+    if maintenance is not None:
+        maintenance.cancel()
+    if revocation_sync is not None:
+        revocation_sync.cancel()
+    # Đóng toàn bộ kết nối trong pool và pool hash khi tắt worker
+    security.shutdown_hash_executor()
+    await async_engine.dispose()
+    if read_engine is not async_engine:
+        await read_engine.dispose()
+
+
+app = FastAPI(title="Booking System API", lifespan=lifespan)
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(doctors_router, prefix="/doctors", tags=["Doctors"])
 app.include_router(appointments_router,
                    prefix="/appointments", tags=["Appointments"])
+app.include_router(internal_router, prefix="/internal", tags=["Internal"])
 
 
 @app.get("/")
-def health_check():
+async def health_check():
     return {"status": "ok", "message": "Booking System is running!"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: str = Header("")):
+    """Số liệu theo route của worker này, định dạng text của Prometheus."""
+    if config.METRICS_TOKEN and authorization != f"Bearer {config.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Sai token metrics")
+    return PlainTextResponse(metrics.registry.render() + ratelimit.limiter.render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,184 @@
+"""
+Migration có đánh số version cho schema DB.
+
+- Bảng schema_version lưu version hiện tại (1 dòng).
+- Mỗi migration chạy trong 1 transaction riêng, xong thì tăng version.
+- Migration phải idempotent (IF NOT EXISTS / checkfirst): DB cũ được tạo bằng
+  create_all trước đây vẫn nâng cấp được, và chạy lại không gây lỗi.
+
+Chạy: python -m app.cli db upgrade
+"""
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from app.core import idempotency
+from app.core.database import Base
+# Import để Base.metadata có đủ các bảng
+from app.modules.auth import models as auth_models  # noqa: F401
+from app.modules.doctors import models as doctor_models  # noqa: F401
+from app.modules.appointments import models as appointment_models
+from app.modules.appointments import partitions, stats
+
+# Bảng version nằm ngoài Base.metadata để không bị create_all tạo lẫn
+schema_version = Table(
+    "schema_version", MetaData(),
+    Column("version", Integer, nullable=False),
+)
+
+# Khóa để 2 lệnh upgrade chạy cùng lúc (vd 2 lần deploy) không giẫm lên nhau
+_PG_MIGRATION_LOCK_ID = 7_241_001
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _create_tables(conn: Connection):
+    # checkfirst: chỉ tạo bảng chưa có (kèm index / ràng buộc / trigger của bảng đó)
+    Base.metadata.create_all(conn)
+
+
+def _indexes_and_constraints(conn: Connection):
+    """Index / ràng buộc thêm vào các bảng đã tồn tại từ trước khi có migration."""
+    dialect = conn.dialect.name
+
+    if dialect == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+    table = appointment_models.Appointment.__table__
+    if dialect == "postgresql":
+        # Bảng đã chia partition (DB mới) thì ràng buộc nằm trên từng partition
+        exists = conn.scalar(
+            text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+            {"name": appointment_models.OVERLAP_CONSTRAINT})
+        if not exists and not partitions.is_partitioned(conn):
+            conn.execute(text(partitions.overlap_constraint_ddl(
+                table.name, appointment_models.OVERLAP_CONSTRAINT)))
+    elif dialect == "sqlite":
+        for trigger in appointment_models.SQLITE_OVERLAP_TRIGGERS:
+            trigger(table, conn)
+
+
+def _backfill_daily_stats(conn: Connection):
+    with Session(bind=conn) as db:
+        stats.rebuild(db)
+        db.flush()
+
+
+def _partition_appointments(conn: Connection):
+    """
+    Bảng appointments_archive (mọi DB). PostgreSQL: chia appointments thành
+    partition theo tháng (chép lại toàn bộ dữ liệu, khóa bảng trong lúc chạy).
+    """
+    appointment_models.AppointmentArchive.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name != "postgresql":
+        return
+
+    if not partitions.is_partitioned(conn):
+        partitions.convert_to_partitioned(conn)
+    partitions.ensure_partitions(conn)
+    partitions.install_overlap_trigger(conn)
+
+
+def _appointment_indexes(conn: Connection):
+    # PostgreSQL: CREATE INDEX trên bảng cha tạo index ở từng partition, khóa
+    # ghi bảng appointments tới khi xong -> chạy lúc ít người dùng
+    for index in appointment_models.Appointment.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _idempotency_keys(conn: Connection):
+    idempotency.IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def _revoked_tokens(conn: Connection):
+    auth_models.RevokedToken.__table__.create(conn, checkfirst=True)
+
+
+def _doctor_schedules(conn: Connection):
+    # Bitmap doctor_day_slots bắt đầu trống: ngày chưa có dòng được tính từ
+    # lịch hẹn khi đọc, tính sẵn bằng python -m app.cli slots rebuild
+    for table in (doctor_models.DoctorSchedule, doctor_models.ScheduleException,
+                  appointment_models.DoctorDaySlots):
+        table.__table__.create(conn, checkfirst=True)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Tạo các bảng còn thiếu", _create_tables),
+    Migration(2, "Index, ràng buộc chống trùng lịch, extension", _indexes_and_constraints),
+    Migration(3, "Dựng bảng doctor_daily_stats từ lịch sử", _backfill_daily_stats),
+    Migration(4, "Partition appointments theo tháng, bảng appointments_archive",
+              _partition_appointments),
+    Migration(5, "Index cho tìm lịch trống và danh sách lịch hẹn", _appointment_indexes),
+    Migration(6, "Bảng idempotency_keys", _idempotency_keys),
+    Migration(7, "Bảng revoked_tokens (đăng xuất / thu hồi JWT)", _revoked_tokens),
+    Migration(8, "Lịch làm việc của bác sĩ, bitmap ca theo ngày", _doctor_schedules),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> Optional[int]:
+    """None nếu DB chưa có bảng schema_version, 0 nếu chưa chạy migration nào."""
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.scalar(select(schema_version.c.version)) or 0
+
+
+def _set_version(conn: Connection, version: int):
+    if conn.scalar(select(schema_version.c.version)) is None:
+        conn.execute(schema_version.insert().values(version=version))
+    else:
+        conn.execute(schema_version.update().values(version=version))
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    """Chạy các migration còn thiếu tới target (mặc định bản mới nhất)."""
+    target = LATEST_VERSION if target is None else target
+    with engine.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version > target:
+            break
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"),
+                             {"id": _PG_MIGRATION_LOCK_ID})
+            # Đọc lại sau khi có khóa: có thể tiến trình khác đã chạy xong
+            if (current_version(conn) or 0) >= migration.version:
+                continue
+            migration.apply(conn)
+            _set_version(conn, migration.version)
+        applied.append(migration)
+    return applied
+
+
+async def check_version(engine: AsyncEngine):
+    """
+    Kiểm tra nhanh lúc khởi động (1 câu query): DB phải ở đúng version mới nhất.
+    Không tạo / sửa gì, sai thì báo lỗi để worker không nhận request.
+    """
+    async with engine.connect() as conn:
+        try:
+            version = await conn.scalar(select(schema_version.c.version))
+        except Exception as e:
+            raise RuntimeError(
+                "DB chưa có schema_version, chạy: python -m app.cli db upgrade") from e
+
+    if version != LATEST_VERSION:
+        raise RuntimeError(
+            f"Schema DB đang ở version {version}, code cần {LATEST_VERSION}. "
+            "Chạy: python -m app.cli db upgrade")
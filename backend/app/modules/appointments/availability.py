@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.timeutils import utcnow_naive
+from app.modules.appointments import slots
+
+# Tính các ca trống của bác sĩ trong 1 khoảng thời gian từ bitmap ca theo ngày
+# (xem slots.py): ca trống = working & ~booked, mỗi bác sĩ / ngày 1 phép toán bit.
+# Chỉ 1 câu query đọc các dòng bitmap; ngày chưa có dòng mới phải tính từ lịch
+# làm việc + lịch hẹn.
+
+Interval = Tuple[datetime, datetime]
+
+# Giới hạn để 1 request không quét quá nhiều dữ liệu
+MAX_WINDOW_DAYS = 31
+MAX_DOCTORS_PER_REQUEST = 50
+
+
+async def get_free_slots(db: AsyncSession, doctor_ids: Sequence[UUID],
+                         window_start: datetime,
+                         window_end: datetime) -> Dict[UUID, List[Interval]]:
+    """Ca trống [t, t + 1 ca) nằm trọn trong cửa sổ của nhiều bác sĩ cùng lúc."""
+    # Không trả về ca đã qua
+    window_start = max(window_start, utcnow_naive())
+    if window_end <= window_start:
+        return {doctor_id: [] for doctor_id in doctor_ids}
+
+    first_day = slots.local_day(window_start)
+    last_day = slots.local_day(window_end)
+    masks = await slots.day_masks(db, doctor_ids, first_day, last_day)
+
+    step = slots.slot_length()
+    free: Dict[UUID, List[Interval]] = {}
+    for doctor_id in doctor_ids:
+        result = free[doctor_id] = []
+        for day in slots.days(first_day, last_day):
+            working, booked = masks[(doctor_id, day)]
+            midnight = slots.day_start(day)
+            for index in slots.iter_slots(working & ~booked):
+                start = midnight + index * step
+                if start >= window_start and start + step <= window_end:
+                    result.append((start, start + step))
+    return free
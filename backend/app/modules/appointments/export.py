@@ -0,0 +1,104 @@
+"""
+Xuất toàn bộ lịch hẹn trong 1 khoảng thời gian (CSV / NDJSON) cho kế toán:
+GET /appointments/export.
+
+- Chỉ lấy các cột phẳng cần thiết (JOIN sẵn tên bác sĩ, bệnh nhân, chuyên khoa),
+  không dựng object ORM / DoctorResponse cho từng dòng.
+- Đọc bằng server-side cursor (yield_per): mỗi lần lấy EXPORT_BATCH_SIZE dòng,
+  ghi ra response rồi mới lấy tiếp, nên bộ nhớ không phụ thuộc số dòng xuất.
+- Kết nối riêng (replica nếu có), mở trong generator: giữ tới khi gửi xong,
+  không phụ thuộc vòng đời session của request.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+from sqlalchemy import literal, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from app.core import config
+from app.core.database import read_engine
+from app.modules.appointments.models import Appointment, AppointmentArchive
+from app.modules.auth.models import User
+from app.modules.doctors.models import Doctor, Specialty
+
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def _select_rows(table, start: datetime, end: datetime, archived: bool):
+    patient = aliased(User)
+    doctor_user = aliased(User)
+    return (
+        select(table.id, table.start_time, table.end_time, table.status,
+               table.patient_id, patient.full_name.label("patient_name"),
+               patient.email.label("patient_email"),
+               table.doctor_id, doctor_user.full_name.label("doctor_name"),
+               Specialty.name.label("specialty"),
+               table.paid_price, table.paid_method, table.payment_status,
+               table.refund_amount, table.created_at,
+               literal(archived).label("archived"))
+        .join(patient, patient.id == table.patient_id)
+        .join(Doctor, Doctor.id == table.doctor_id)
+        .join(doctor_user, doctor_user.id == Doctor.user_id)
+        .outerjoin(Specialty, Specialty.id == Doctor.specialty_id)
+        .where(table.start_time >= start, table.start_time < end)
+    )
+
+
+def export_query(start: datetime, end: datetime, include_archived: bool = False):
+    """Lịch có start_time trong [start, end), sắp theo (start_time, id)."""
+    query = _select_rows(Appointment, start, end, False)
+    if include_archived:
+        query = union_all(query, _select_rows(AppointmentArchive, start, end, True))
+        query = select(query.subquery())
+    columns = query.selected_columns
+    return query.order_by(columns.start_time, columns.id)
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)  # UUID
+
+
+def _csv_chunk(rows, header=None) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(rows, keys) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(keys, map(_value, row))), ensure_ascii=False) + "\n"
+        for row in rows).encode()
+
+
+async def stream_export(start: datetime, end: datetime, file_format: str = "csv",
+                        include_archived: bool = False) -> AsyncIterator[bytes]:
+    """Các đoạn bytes của file xuất, mỗi đoạn ~EXPORT_BATCH_SIZE dòng."""
+    query = export_query(start, end, include_archived).execution_options(
+        yield_per=config.EXPORT_BATCH_SIZE)
+    async with read_engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # Xuất nhiều dòng có thể lâu hơn DB_STATEMENT_TIMEOUT_MS của API thường
+            await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        result = await conn.stream(query)
+        keys = list(result.keys())
+        first = True
+        async for rows in result.partitions():
+            if file_format == "csv":
+                yield _csv_chunk(rows, keys if first else None)
+            else:
+                yield _ndjson_chunk(rows, keys)
+            first = False
+        if first and file_format == "csv":
+            # Không có dòng nào: vẫn trả dòng tiêu đề
+            yield _csv_chunk([], keys)
@@ -1,11 +1,15 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, Text, Float
+from sqlalchemy import Column, String, ForeignKey, Date, DateTime, Integer, LargeBinary, Text, Float, DDL, Index, PrimaryKeyConstraint, event, func, literal_column, text
 from sqlalchemy.orm import relationship
+from app.core.database import Base
 from app.core.model_base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID
 
+# Tên ràng buộc chống trùng lịch, dùng để nhận diện lỗi khi INSERT / UPDATE
+OVERLAP_CONSTRAINT = "appointments_no_overlap"
 
-class Appointment(BaseModel):
-    __tablename__ = "appointments"
+
+class AppointmentColumns:
+    """Các cột dùng chung của bảng lịch hẹn đang hoạt động và bảng lưu trữ."""
 
     # Ai đặt ? (Liên kết với bảng users)
     patient_id = Column(UUID(as_uuid=True), ForeignKey(
@@ -15,8 +19,6 @@ class Appointment(BaseModel):
     doctor_id = Column(UUID(as_uuid=True), ForeignKey(
         "doctors.id"), nullable=False)
 
-    # Thời gian
-    start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
 
     # Trạng thái và ghi chú
@@ -35,8 +37,140 @@ class Appointment(BaseModel):
 
     refund_amount = Column(Float, default=0.0)
 
+
+class Appointment(AppointmentColumns, BaseModel):
+    __tablename__ = "appointments"
+    __table_args__ = (
+        # Khóa chính trong DB là (id, start_time) vì bảng partition bắt buộc khóa
+        # chứa cột partition; ORM vẫn nhận diện lịch hẹn theo id (id là uuid4)
+        PrimaryKeyConstraint("id", "start_time"),
+        {
+            # PostgreSQL: chia partition theo tháng của start_time (xem
+            # partitions.py). Ràng buộc chống trùng lịch nằm trên từng partition.
+            "postgresql_partition_by": "RANGE (start_time)",
+        },
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+
+    # Thời gian
+    start_time = Column(DateTime, primary_key=True, nullable=False)
+
     # Quan hệ ngược để lấy thông tin chi tiết
     patient = relationship(
         "app.modules.auth.models.User", backref="appointments")
     doctor = relationship(
         "app.modules.doctors.models.Doctor", backref="appointments")
+
+
+# ==========================================
+# INDEX THEO ĐƯỜNG TRUY CẬP
+# ==========================================
+# PostgreSQL: index tạo trên bảng cha, tự có ở mọi partition.
+
+# Điều kiện "chưa hủy" viết dạng hằng số (không phải bind param): planner chỉ
+# dùng được index partial khi chứng minh được WHERE của query khớp với WHERE
+# của index, điều không làm được với tham số (prepared statement / SQLite)
+NOT_CANCELLED = Appointment.status != literal_column("'cancelled'")
+_NOT_CANCELLED_SQL = text("status <> 'cancelled'")
+
+# Tìm lịch chưa hủy của bác sĩ giao với 1 khoảng thời gian: ca trống
+# (availability), trigger chống trùng lịch. Bỏ qua lịch đã hủy nên index nhỏ hơn.
+Index("ix_appointments_doctor_active_time",
+      Appointment.doctor_id, Appointment.start_time, Appointment.end_time,
+      postgresql_where=_NOT_CANCELLED_SQL, sqlite_where=_NOT_CANCELLED_SQL)
+
+# my-appointments: lịch của 1 bác sĩ / 1 bệnh nhân, mới nhất trước, phân trang
+# keyset theo (start_time, id) -> đọc thẳng theo thứ tự index, dừng sau limit dòng
+Index("ix_appointments_doctor_start_id",
+      Appointment.doctor_id, Appointment.start_time.desc(), Appointment.id.desc())
+Index("ix_appointments_patient_start_id",
+      Appointment.patient_id, Appointment.start_time.desc(), Appointment.id.desc())
+
+
+class AppointmentArchive(AppointmentColumns, BaseModel):
+    """
+    Lịch đã khám xong / đã hủy quá ARCHIVE_AFTER_MONTHS tháng, được chuyển khỏi
+    bảng appointments (python -m app.cli archive). Chỉ dùng để tra cứu / thống kê.
+    """
+    __tablename__ = "appointments_archive"
+    __table_args__ = (
+        Index("ix_appointments_archive_patient_start", "patient_id", "start_time"),
+        Index("ix_appointments_archive_doctor_start", "doctor_id", "start_time"),
+    )
+
+    start_time = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DoctorDailyStats(Base):
+    """
+    Bảng tổng hợp theo ngày cho từng bác sĩ (ngày = ngày của start_time, UTC).
+    Cập nhật cộng dồn trong cùng transaction với thay đổi lịch hẹn
+    (xem app/modules/appointments/stats.py), dựng lại bằng: python -m app.cli rebuild-stats
+    """
+    __tablename__ = "doctor_daily_stats"
+    __table_args__ = (
+        # Doanh thu toàn hệ thống lọc theo khoảng ngày của mọi bác sĩ
+        Index("ix_doctor_daily_stats_day", "day"),
+    )
+
+    doctor_id = Column(UUID(as_uuid=True), ForeignKey(
+        "doctors.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    # Số lịch đã khám xong và tổng tiền của các lịch đó
+    completed_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+    # Tổng tiền đã hoàn cho bệnh nhân
+    refunds = Column(Float, nullable=False, default=0.0)
+
+
+class DoctorDaySlots(Base):
+    """
+    Các ca của 1 bác sĩ trong 1 ngày (giờ địa phương) dạng bitmap: bit i là ca
+    thứ i tính từ 00:00, mỗi ca slot_minutes phút.
+    - working: ca nằm trong giờ làm việc (lịch hằng tuần + ngoại lệ)
+    - booked: ca đã có lịch hẹn chưa hủy
+    Ca trống = working & ~booked. Cập nhật cùng transaction với lịch hẹn và lịch
+    làm việc (xem app/modules/appointments/slots.py), dựng lại bằng:
+    python -m app.cli slots rebuild
+    """
+    __tablename__ = "doctor_day_slots"
+
+    doctor_id = Column(UUID(as_uuid=True), ForeignKey(
+        "doctors.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    # Độ dài ca lúc tính bitmap: đổi APPOINTMENT_DURATION_MINUTES thì dòng cũ bị bỏ qua
+    slot_minutes = Column(Integer, nullable=False)
+    working = Column(LargeBinary, nullable=False)
+    booked = Column(LargeBinary, nullable=False)
+
+
+# EXCLUDE với "doctor_id WITH =" trên index GiST cần extension btree_gist
+event.listen(
+    Appointment.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"))
+
+# SQLite (chạy test / dev) không có EXCLUDE -> dùng trigger với cùng tên ràng buộc
+_SQLITE_OVERLAP_CHECK = f"""
+    SELECT RAISE(ABORT, '{OVERLAP_CONSTRAINT}') WHERE EXISTS (
+        SELECT 1 FROM appointments
+        WHERE doctor_id = NEW.doctor_id AND id != NEW.id
+          AND status != 'cancelled'
+          AND start_time < NEW.end_time AND end_time > NEW.start_time);
+"""
+
+SQLITE_OVERLAP_TRIGGERS = [DDL(_ddl).execute_if(dialect="sqlite") for _ddl in (
+    f"""CREATE TRIGGER IF NOT EXISTS {OVERLAP_CONSTRAINT}_insert
+        BEFORE INSERT ON appointments WHEN NEW.status != 'cancelled'
+        BEGIN {_SQLITE_OVERLAP_CHECK} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {OVERLAP_CONSTRAINT}_update
+        BEFORE UPDATE OF doctor_id, start_time, end_time, status ON appointments
+        WHEN NEW.status != 'cancelled'
+        BEGIN {_SQLITE_OVERLAP_CHECK} END""",
+)]
+
+for _trigger in SQLITE_OVERLAP_TRIGGERS:
+    event.listen(Appointment.__table__, "after_create", _trigger)
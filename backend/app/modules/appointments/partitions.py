@@ -0,0 +1,284 @@
+"""
+Partition theo tháng và lưu trữ lịch hẹn cũ.
+
+PostgreSQL: bảng appointments chia partition RANGE (start_time) theo tháng
+(appointments_p2026_10, ...), cộng 1 partition default hứng các lịch nằm ngoài
+những tháng đã tạo. Query lọc theo start_time chỉ đụng tới partition liên quan;
+index / vacuum chạy trên từng partition nhỏ.
+
+- EXCLUDE chống trùng lịch không đặt được trên bảng cha (start_time không so
+  sánh bằng "="), nên mỗi partition có ràng buộc riêng. 2 lịch ở 2 partition kề
+  nhau chỉ có thể trùng quanh ranh giới tháng: trigger OVERLAP_TRIGGER khóa theo
+  bác sĩ và kiểm tra thêm cho các lịch đó.
+- Partition các tháng sắp tới được tạo trước (ensure_partitions): khi migrate,
+  định kỳ trong lifespan của app và bằng: python -m app.cli partitions
+
+Lưu trữ (mọi DB): lịch completed / cancelled cũ hơn ARCHIVE_AFTER_MONTHS tháng
+được chuyển sang bảng appointments_archive theo từng lô (python -m app.cli archive).
+Partition cũ đã trống thì DROP luôn (nhanh, không cần vacuum).
+"""
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core import config
+from app.core.timeutils import utcnow_naive
+from app.modules.appointments.models import (
+    OVERLAP_CONSTRAINT, Appointment, AppointmentArchive)
+
+logger = logging.getLogger(__name__)
+
+PARENT = Appointment.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+OVERLAP_TRIGGER = f"{OVERLAP_CONSTRAINT}_across_months"
+CLOSED_STATUSES = ("completed", "cancelled")
+
+# Khóa để nhiều worker / lệnh CLI không cùng lúc tạo partition
+_PG_PARTITION_LOCK_ID = 7_241_002
+
+# Lịch gần ranh giới tháng (kéo qua tháng sau hoặc bắt đầu trong ngày đầu tháng)
+# được kiểm tra trùng với toàn bảng, khóa theo bác sĩ để 2 request không lọt nhau.
+# Giả định 1 ca khám ngắn hơn 1 ngày.
+_OVERLAP_TRIGGER_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION {OVERLAP_TRIGGER}() RETURNS trigger AS $$
+BEGIN
+    IF NEW.status = 'cancelled' THEN
+        RETURN NEW;
+    END IF;
+    IF date_trunc('month', NEW.start_time)
+           = date_trunc('month', NEW.end_time - interval '1 microsecond')
+       AND NEW.start_time >= date_trunc('month', NEW.start_time) + interval '1 day' THEN
+        RETURN NEW;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(hashtext('{OVERLAP_CONSTRAINT}:' || NEW.doctor_id::text));
+    IF EXISTS (
+        SELECT 1 FROM {PARENT}
+        WHERE doctor_id = NEW.doctor_id AND id <> NEW.id AND status <> 'cancelled'
+          AND start_time < NEW.end_time AND end_time > NEW.start_time
+          AND start_time > NEW.start_time - interval '1 day'
+    ) THEN
+        RAISE EXCEPTION 'conflicting key value violates exclusion constraint "{OVERLAP_CONSTRAINT}"'
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = '{OVERLAP_CONSTRAINT}';
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def overlap_constraint_ddl(table: str, name: str) -> str:
+    """EXCLUDE chống trùng lịch: cùng bác sĩ, 2 lịch chưa hủy không giao nhau."""
+    return (f"ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist "
+            "(doctor_id WITH =, tsrange(start_time, end_time) WITH &&) "
+            "WHERE (status <> 'cancelled')")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass(:table))"), {"table": PARENT}))
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    return list(conn.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"), {"table": PARENT}))
+
+
+def _table_exists(conn: Connection, name: str) -> bool:
+    return conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+def _create_default_partition(conn: Connection):
+    if _table_exists(conn, DEFAULT_PARTITION):
+        return
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    conn.execute(text(overlap_constraint_ddl(
+        DEFAULT_PARTITION, f"{OVERLAP_CONSTRAINT}_default")))
+
+
+def _create_month_partition(conn: Connection, month: date) -> bool:
+    name = partition_name(month)
+    if _table_exists(conn, name):
+        return False
+
+    lower, upper = month, add_months(month, 1)
+    # Lịch của tháng này có thể đã rơi vào partition default (đặt trước khi
+    # partition được tạo): chuyển tạm ra ngoài rồi đưa lại vào partition mới
+    conn.execute(text(
+        f"CREATE TEMP TABLE _moving_appointments (LIKE {DEFAULT_PARTITION}) ON COMMIT DROP"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE start_time >= :lower AND start_time < :upper RETURNING *) "
+        f"INSERT INTO _moving_appointments SELECT * FROM moved"),
+        {"lower": lower, "upper": upper})
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"))
+    conn.execute(text(overlap_constraint_ddl(
+        name, f"{OVERLAP_CONSTRAINT}_p{month:%Y_%m}")))
+    conn.execute(text(f"INSERT INTO {name} SELECT * FROM _moving_appointments"))
+    conn.execute(text("DROP TABLE _moving_appointments"))
+    return True
+
+
+def ensure_partitions(conn: Connection, since: Optional[date] = None,
+                      months_ahead: Optional[int] = None, wait: bool = True) -> List[str]:
+    """
+    Tạo partition default và partition từng tháng từ since (mặc định tháng
+    hiện tại) tới months_ahead tháng sau. Không làm gì nếu không phải PostgreSQL
+    hoặc bảng chưa chia partition. wait=False: bỏ qua nếu tiến trình khác đang tạo.
+    """
+    if not is_partitioned(conn):
+        return []
+
+    lock = "pg_advisory_xact_lock" if wait else "pg_try_advisory_xact_lock"
+    if conn.scalar(text(f"SELECT {lock}(:id)"), {"id": _PG_PARTITION_LOCK_ID}) is False:
+        return []
+
+    months_ahead = config.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(utcnow_naive())
+    month = min(since, current) if since else current
+    last = add_months(current, months_ahead)
+
+    _create_default_partition(conn)
+    created = []
+    while month <= last:
+        if _create_month_partition(conn, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def install_overlap_trigger(conn: Connection):
+    conn.execute(text(_OVERLAP_TRIGGER_FUNCTION))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {OVERLAP_TRIGGER} ON {PARENT}"))
+    conn.execute(text(
+        f"CREATE TRIGGER {OVERLAP_TRIGGER} "
+        f"BEFORE INSERT OR UPDATE OF doctor_id, start_time, end_time, status ON {PARENT} "
+        f"FOR EACH ROW EXECUTE FUNCTION {OVERLAP_TRIGGER}()"))
+
+
+def convert_to_partitioned(conn: Connection):
+    """
+    Chuyển bảng appointments thường (tạo trước khi có partition) thành bảng
+    partition: đổi tên bảng cũ, tạo bảng cha + partition, chép dữ liệu, xóa bảng cũ.
+    Chạy trong 1 transaction (khóa bảng appointments tới khi xong).
+    """
+    legacy = f"{PARENT}_unpartitioned"
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {legacy}"))
+
+    # Tên index / ràng buộc phải duy nhất: bỏ hết ở bảng cũ trước khi tạo bảng mới
+    constraints = conn.scalars(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) "
+        "AND contype IN ('p', 'u', 'x', 'f')"), {"table": legacy}).all()
+    for name in constraints:
+        conn.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{name}"'))
+    indexes = conn.scalars(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy}).all()
+    for name in indexes:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+    Appointment.__table__.create(conn)
+    first = conn.scalar(text(f"SELECT min(start_time) FROM {legacy}"))
+    ensure_partitions(conn, since=month_start(first) if first else None)
+
+    columns = ", ".join(column.name for column in Appointment.__table__.columns)
+    conn.execute(text(f"INSERT INTO {PARENT} ({columns}) SELECT {columns} FROM {legacy}"))
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+
+async def run_maintenance(engine: AsyncEngine):
+    """Chạy nền trong app: định kỳ tạo trước partition cho các tháng sắp tới."""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                created = await conn.run_sync(ensure_partitions, wait=False)
+            if created:
+                logger.info("Đã tạo partition: %s", ", ".join(created))
+        except Exception:
+            logger.exception("Không tạo được partition lịch hẹn")
+        await asyncio.sleep(config.PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+
+
+# ==========================================
+# LƯU TRỮ LỊCH CŨ
+# ==========================================
+
+
+def archive_cutoff(older_than_months: int) -> datetime:
+    """Đầu tháng cách đây older_than_months tháng: lịch trước mốc này được lưu trữ."""
+    month = add_months(month_start(utcnow_naive()), -older_than_months)
+    return datetime(month.year, month.month, 1)
+
+
+def _drop_empty_partitions(conn: Connection, cutoff: datetime) -> List[str]:
+    dropped = []
+    for name in list_partitions(conn):
+        if not name.startswith(f"{PARENT}_p"):
+            continue
+        year, month = name.rsplit("_p", 1)[1].split("_")
+        upper = add_months(date(int(year), int(month), 1), 1)
+        if datetime(upper.year, upper.month, 1) > cutoff:
+            continue
+        if conn.scalar(text(f"SELECT NOT EXISTS (SELECT 1 FROM {name})")):
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def archive_closed(engine: Engine, older_than_months: Optional[int] = None,
+                   batch_size: Optional[int] = None) -> Tuple[int, List[str]]:
+    """
+    Chuyển lịch completed / cancelled có start_time trước archive_cutoff sang
+    appointments_archive, mỗi lô 1 transaction. Trả về (số lịch đã chuyển,
+    các partition trống đã xóa).
+    """
+    older_than_months = (config.ARCHIVE_AFTER_MONTHS
+                         if older_than_months is None else older_than_months)
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    cutoff = archive_cutoff(older_than_months)
+
+    hot = Appointment.__table__
+    archive = AppointmentArchive.__table__
+    columns = [column.name for column in hot.columns]
+    old_closed = (hot.c.start_time < cutoff) & hot.c.status.in_(CLOSED_STATUSES)
+
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.scalars(select(hot.c.id).where(old_closed).limit(batch_size)).all()
+            if not ids:
+                break
+            batch = hot.c.id.in_(ids) & (hot.c.start_time < cutoff)
+            conn.execute(insert(archive).from_select(
+                columns, select(*[hot.c[name] for name in columns]).where(batch)))
+            conn.execute(delete(hot).where(batch))
+        moved += len(ids)
+
+    dropped = []
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            dropped = _drop_empty_partitions(conn, cutoff)
+    return moved, dropped
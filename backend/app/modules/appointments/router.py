@@ -1,113 +1,161 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
-from datetime import datetime, timedelta, timezone
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import List, Optional
+import uuid
 from uuid import UUID
 
-from app.core.database import get_db
-from app.modules.appointments import models, schemas
-from app.modules.auth.dependencies import get_current_user, get_current_admin
-from app.modules.auth.models import User
+from app.core import config
+from app.core.database import get_db, get_read_db
+from app.core.eager_load import eager_options
+from app.core.idempotency import Idempotency, get_idempotency
+from app.core import responses
+from app.core.pagination import cursor_headers, keyset_filter, split_page
+from app.core.timeutils import to_utc_naive, utcnow_naive
+from app.modules.appointments import export, models, schemas, slots, stats
+from app.modules.auth.dependencies import Principal, get_current_user, get_current_admin
 from app.modules.doctors.models import Doctor
 
 router = APIRouter()
 
-# Cấu hình: Mỗi ca tư vấn thường kéo dài 60p
-APPOINTMENT_DURATION_MINUTES = 60
+# Cấu hình: Mỗi ca tư vấn thường kéo dài 60p (xem app/core/config.py)
+APPOINTMENT_DURATION_MINUTES = config.APPOINTMENT_DURATION_MINUTES
+
+
+def _appointment_query():
+    # Query Appointment kèm sẵn doctor (user, specialty_info, level_info)
+    return select(models.Appointment).options(
+        *eager_options(models.Appointment, schemas.AppointmentResponse))
+
+
+async def _load_appointment(db: AsyncSession, appointment_id) -> models.Appointment:
+    # populate_existing: lấy lại dữ liệu mới nhất sau khi commit
+    return await db.scalar(_appointment_query()
+                           .where(models.Appointment.id == appointment_id)
+                           .execution_options(populate_existing=True))
+
+
+async def _get_doctor_profile(db: AsyncSession, user_id) -> Optional[Doctor]:
+    return await db.scalar(select(Doctor).where(Doctor.user_id == user_id))
+
+
+def _is_overlap_violation(error: IntegrityError) -> bool:
+    # PostgreSQL: EXCLUDE constraint, SQLite: trigger; cả 2 đều mang tên ràng buộc
+    return models.OVERLAP_CONSTRAINT in str(error.orig)
 
 # API đặt lịch
 
 
 @router.post("/", response_model=schemas.AppointmentResponse, status_code=status.HTTP_201_CREATED)
-def create_appointment(booking_in: schemas.AppointmentCreate,
-                       db: Session = Depends(get_db),
-                       current_user: User = Depends(get_current_user)):
+async def create_appointment(booking_in: schemas.AppointmentCreate,
+                             db: AsyncSession = Depends(get_db),
+                             current_user: Principal = Depends(get_current_user),
+                             idempotency: Idempotency = Depends(get_idempotency)):
     """
     Đặt lịch hẹn
     Logic:
-    1. Kiểm tra bác sĩ có tồn tại không
-    2. Tính giờ kết thúc (start + 60p)
-    3. Check trùng lịch
-    4. Lưu vào DB
+    1. Tính giờ kết thúc (start + 60p)
+    2. INSERT ... SELECT từ bảng doctors: chỉ tạo được lịch nếu bác sĩ tồn tại
+       và đang hoạt động (lấy luôn giá khám), 1 lần gọi DB duy nhất
+    3. Trùng lịch do ràng buộc trong DB chặn lại -> trả 409
+    4. Đánh dấu ca đã đặt trong bitmap ca của ngày (slots.py); ca ngoài giờ
+       làm việc của bác sĩ -> 400
+    Gửi kèm header Idempotency-Key: gửi lại cùng key trả lại đúng lịch đã tạo
+    thay vì 409 (xem app/core/idempotency.py)
     """
 
-    # 1. Kiểm tra bác sĩ có tồn tại không
-    doctor = db.query(Doctor).filter(Doctor.id == booking_in.doctor_id).first()
-    if not doctor or not doctor.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Bác sĩ không tồn tại hoặc đang tạm nghỉ.")
-
-    # 2. Tính toán thời gian
-
-    start_time = booking_in.start_time  # datetime object
+    # 1. Tính toán thời gian
 
-    if start_time.tzinfo is not None:
-        # Nếu start_time chưa có timezone, gắn timezone UTC cho nó
-        start_time = start_time.replace(tzinfo=timezone.utc)
+    # Đưa về giờ UTC (không kèm tzinfo) giống cách lưu trong DB
+    start_time = to_utc_naive(booking_in.start_time)
 
     # Kiểm tra không được đặt lịch trong quá khứ
-    if start_time < datetime.now(timezone.utc):
+    if start_time < utcnow_naive():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Không thể đặt lịch trong quá khứ.")
 
+    # Chỉ đặt được đúng giờ bắt đầu của 1 ca (các ca trả về ở API lịch trống)
+    if slots.slot_of(start_time) is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Giờ hẹn phải là giờ bắt đầu của 1 ca "
+                                   f"({APPOINTMENT_DURATION_MINUTES} phút / ca).")
+
     end_time = start_time + timedelta(minutes=APPOINTMENT_DURATION_MINUTES)
 
-    # Check trùng lịch
-    # Check 2 khoảng thời gian (A, B) và (C, D) có giao nhau không
-    # (StartA < EndB) AND (EndA > StartB)
-
-    overlapping_appointment = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == booking_in.doctor_id,
-        models.Appointment.status != "cancelled",
-        and_(
-            models.Appointment.start_time < end_time,
-            models.Appointment.end_time > start_time
-        )
-    ).first()
-
-    if overlapping_appointment:
-        raise HTTPException(409, detail="Bác sĩ đã kín lịch khung giờ này")
-
-    # Tạo lịch hẹn
-    new_appointment = models.Appointment(
-        patient_id=current_user.id,
-        doctor_id=booking_in.doctor_id,
-        start_time=start_time,
-        end_time=end_time,
-        reason=booking_in.reason,
-        status="pending",  # Mặc định là pending
-        paid_price=doctor.price_per_visit,
-        doctor_note=None
-    )
-
-    db.add(new_appointment)
-    db.commit()
-    db.refresh(new_appointment)
-
-    return new_appointment
+    replayed = await idempotency.begin(db, current_user.id)
+    if replayed is not None:
+        return replayed
+
+    # 2. Tạo lịch hẹn (mặc định là pending)
+    Appointment = models.Appointment
+    appointment_id = uuid.uuid4()
+    booking = insert(Appointment).from_select(
+        ["id", "patient_id", "doctor_id", "start_time",
+            "end_time", "reason", "status", "paid_price"],
+        select(
+            literal(appointment_id, Appointment.id.type),
+            literal(current_user.id, Appointment.patient_id.type),
+            Doctor.id,
+            literal(start_time, Appointment.start_time.type),
+            literal(end_time, Appointment.end_time.type),
+            literal(booking_in.reason, Appointment.reason.type),
+            literal("pending", Appointment.status.type),
+            func.coalesce(Doctor.price_per_visit, 0.0),
+        ).where(Doctor.id == booking_in.doctor_id, Doctor.is_active == True)
+    ).returning(Appointment.id)
+
+    # 3. Check trùng lịch: ràng buộc appointments_no_overlap trong DB
+    try:
+        created_id = await db.scalar(booking)
+    except IntegrityError as e:
+        await db.rollback()
+        if _is_overlap_violation(e):
+            raise HTTPException(409, detail="Bác sĩ đã kín lịch khung giờ này")
+        raise
+
+    if created_id is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Bác sĩ không tồn tại hoặc đang tạm nghỉ.")
+
+    # 4. Giờ làm việc + đánh dấu ca (khóa dòng bitmap của ngày tới khi commit)
+    if not await slots.book(db, booking_in.doctor_id, start_time, end_time):
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Bác sĩ không làm việc vào khung giờ này.")
+
+    # Lưu response cùng transaction với lịch vừa tạo (nếu có Idempotency-Key)
+    appointment = await _load_appointment(db, created_id)
+    return await idempotency.commit(db, schemas.AppointmentResponse, appointment,
+                                    status.HTTP_201_CREATED)
 
 # API lấy danh sách lịch hẹn
 
 
 @router.get("/my-appointments", response_model=List[schemas.AppointmentResponse])
-def get_my_appointments(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_appointments(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     API Đa năng:
     - Nếu là Bác sĩ -> Xem lịch mình CẦN KHÁM cho khách.
     - Nếu là Bệnh nhân -> Xem lịch mình ĐÃ ĐẶT.
+    Sắp xếp mới nhất trước, phân trang theo cursor (start_time, id);
+    cursor của trang sau trả trong header X-Next-Cursor.
     """
     # Khởi tạo query chung
-    query = db.query(models.Appointment)
+    query = _appointment_query()
 
     # TRƯỜNG HỢP 1: LÀ BÁC SĨ
     if current_user.role == "doctor":
         # Tìm hồ sơ chuyên môn (Doctor Profile)
-        doctor_profile = db.query(Doctor).filter(
-            Doctor.user_id == current_user.id).first()
+        doctor_profile = await _get_doctor_profile(db, current_user.id)
 
         if not doctor_profile:
             # Báo lỗi ngay nếu tài khoản bị lỗi (có role doctor nhưng không có trong bảng doctors)
@@ -117,35 +165,40 @@ def get_my_appointments(
             )
 
         # Lọc các lịch mà bác sĩ này ĐƯỢC ĐẶT (theo doctor_id)
-        appointments = query.filter(models.Appointment.doctor_id == doctor_profile.id)\
-                            .order_by(models.Appointment.start_time.desc()).all()
-        return appointments
+        query = query.where(
+            models.Appointment.doctor_id == doctor_profile.id)
 
     # TRƯỜNG HỢP 2: LÀ BỆNH NHÂN (HOẶC ADMIN)
     # Lọc các lịch mà user này ĐI ĐẶT (theo patient_id)
-    appointments = query.filter(models.Appointment.patient_id == current_user.id)\
-                        .order_by(models.Appointment.start_time.desc()).all()
-
-    return appointments
+    else:
+        query = query.where(
+            models.Appointment.patient_id == current_user.id)
+
+    sort_keys = (models.Appointment.start_time, models.Appointment.id)
+    rows = (await db.scalars(keyset_filter(query, sort_keys, cursor,
+                                           limit, descending=True))).all()
+    appointments, next_cursor = split_page(rows, sort_keys, limit)
+
+    # Serialize thẳng ra bytes (xem app/core/responses.py)
+    return responses.model_response(List[schemas.AppointmentResponse], appointments,
+                                    headers=cursor_headers(next_cursor))
 # 2. API CẬP NHẬT LỊCH HẸN (DÀNH CHO BÁC SĨ)
 
 
 @router.patch("/{appointment_id}/status", response_model=schemas.AppointmentResponse)
-def update_appointment_status(
-    appointment_id: str,
+async def update_appointment_status(
+    appointment_id: UUID,
     status_update: schemas.AppointmentUpdateStatus,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    appt = db.query(models.Appointment).filter(
-        models.Appointment.id == appointment_id).first()
+    appt = await db.get(models.Appointment, appointment_id)
 
     if not appt:
         raise HTTPException(404, "Lịch hẹn không tồn tại.")
 
     # Kiểm tra quyền: chỉ bác sĩ của lịch hẹn hoặc admin mới được phép thay đổi
-    doctor_profile = db.query(Doctor).filter(
-        Doctor.user_id == current_user.id).first()
+    doctor_profile = await _get_doctor_profile(db, current_user.id)
 
     is_own_doctor = doctor_profile and doctor_profile.id == appt.doctor_id
     is_admin = current_user.role == "admin"
@@ -153,62 +206,92 @@ def update_appointment_status(
     if not is_own_doctor and not is_admin:
         raise HTTPException(403, "Bạn không có quyền thay đổi lịch hẹn này.")
 
-    # Cập nhật
+    # Cập nhật (thống kê theo ngày, bitmap ca cập nhật cùng transaction)
+    before = stats.contribution(appt)
+    was_booked = slots.is_booked(appt)
     appt.status = status_update.status
     if status_update.doctor_note is not None:
         appt.doctor_note = status_update.doctor_note
 
-    db.commit()
-    db.refresh(appt)
-    return appt
+    try:
+        await stats.apply_change(db, before, appt)
+        await slots.apply_change(db, was_booked, appt)
+        await db.commit()
+    except IntegrityError as e:
+        # Mở lại lịch đã hủy nhưng khung giờ đã có người khác đặt
+        await db.rollback()
+        if _is_overlap_violation(e):
+            raise HTTPException(409, detail="Bác sĩ đã kín lịch khung giờ này")
+        raise
+    return await _load_appointment(db, appt.id)
 
 
-# API Thống kê
+# API Thống kê (đọc từ bảng tổng hợp doctor_daily_stats, O(số ngày))
 @router.get("/stats/revenue", dependencies=[Depends(get_current_admin)])
-def get_platform_revenue(
+async def get_platform_revenue(
     start_date: datetime,
     end_date: datetime,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 
 ):
     """
     Tính tổng doanh thu của toàn hệ thống trong khoảng thời gian.
-    Chỉ tính các lịch đã HOÀN THÀNH (completed).
+    Chỉ tính các lịch đã HOÀN THÀNH (completed), theo ngày khám (UTC),
+    tính trọn ngày của start_date và end_date.
     """
-    revenue = db.query(func.sum(models.Appointment.paid_price))\
-        .filter(models.Appointment.status == "completed",
-                models.Appointment.start_time >= start_date,
-                models.Appointment.start_time <= end_date)\
-        .scalar()  # scalar() để lấy ra con số duy nhất thay vì list
+    Daily = models.DoctorDailyStats
+    revenue, refunds = (await db.execute(
+        select(func.sum(Daily.revenue), func.sum(Daily.refunds))
+        .where(Daily.day >= to_utc_naive(start_date).date(),
+               Daily.day <= to_utc_naive(end_date).date()))).one()
 
     return {
         "start_date": start_date,
         "end_date": end_date,
-        "revenue": revenue or 0
+        "revenue": revenue or 0,
+        "refunds": refunds or 0
     }
 
-# Thống kê revenue cho bác sĩ
 
+@router.get("/export", dependencies=[Depends(get_current_admin)])
+async def export_appointments(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    include_archived: bool = False,
+):
+    """
+    Admin xuất toàn bộ lịch hẹn có giờ khám trong [from, to) ra CSV hoặc NDJSON,
+    sắp theo giờ khám. Dữ liệu được gửi dần (xem export.py), dùng được cho cả
+    khoảng thời gian rất dài. include_archived: lấy cả lịch đã lưu trữ.
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Thời gian kết thúc phải sau thời gian bắt đầu")
+    filename = f"appointments_{start:%Y%m%d}_{end:%Y%m%d}.{file_format}"
+    return StreamingResponse(
+        export.stream_export(start, end, file_format, include_archived),
+        media_type=export.MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
-def get_my_income(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+
+# Thống kê revenue cho bác sĩ
+@router.get("/stats/my-income")
+async def get_my_income(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)
 
 ):
     # Tìm profile bác sĩ
-    doctor = db.query(Doctor).filter(Doctor.user_id == current_user.id).first()
+    doctor = await _get_doctor_profile(db, current_user.id)
     if not doctor:
         raise HTTPException(400, "Bạn không phải là bác sĩ")
 
-    income = db.query(func.sum(models.Appointment.paid_price)).filter(
-        models.Appointment.doctor_id == doctor.id,
-        models.Appointment.status == "completed"
-    ).scalar()
-
-    count = db.query(func.count(models.Appointment.id)).filter(
-        models.Appointment.doctor_id == doctor.id,
-        models.Appointment.status == "completed"
-    ).scalar()
+    Daily = models.DoctorDailyStats
+    income, count = (await db.execute(
+        select(func.sum(Daily.revenue), func.sum(Daily.completed_count))
+        .where(Daily.doctor_id == doctor.id))).one()
 
     return {
         "total_income": income or 0,
@@ -217,42 +300,46 @@ def get_my_income(
 
 
 @router.patch("/{appointment_id}/payment", response_model=schemas.AppointmentResponse)
-def confirm_payment(
+async def confirm_payment(
     appointment_id: UUID,
     payment_in: schemas.PaymentUpdate,
-    db: Session = Depends(get_db),
-    current_user:  User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    idempotency: Idempotency = Depends(get_idempotency)
 ):
-    appt = db.query(models.Appointment).filter(
-        models.Appointment.id == appointment_id).first()
+    replayed = await idempotency.begin(db, current_user.id)
+    if replayed is not None:
+        return replayed
+
+    appt = await db.get(models.Appointment, appointment_id)
     if not appt:
         raise HTTPException(404, "Không tìm thấy lịch.")
 
     # Check quyền
-    doctor_profile = db.query(Doctor).filter(
-        Doctor.user_id == current_user.id).first()
+    doctor_profile = await _get_doctor_profile(db, current_user.id)
     is_owner = doctor_profile and doctor_profile.id == appt.doctor_id
     is_admin = current_user.role == "admin"
 
     if not (is_owner or is_admin):
         raise HTTPException(403, "Bạn không có quyền xác nhận thanh toán.")
 
+    before = stats.contribution(appt)
     appt.payment_status = payment_in.payment_status
-    db.commit()
-    db.refresh(appt)
-    return appt
+    await stats.apply_change(db, before, appt)
+    await db.flush()
+    return await idempotency.commit(db, schemas.AppointmentResponse,
+                                    await _load_appointment(db, appt.id))
 
 
 @router.patch("/{appointment_id}/cancel", response_model=schemas.AppointmentResponse)
-def cancel_my_appointment(
+async def cancel_my_appointment(
     appointment_id: UUID,
     cancel_in: schemas.AppointmentCancel,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     # 1. Tìm lịch hẹn
-    appt = db.query(models.Appointment).filter(
-        models.Appointment.id == appointment_id).first()
+    appt = await db.get(models.Appointment, appointment_id)
     if not appt:
         raise HTTPException(404, "Lịch hẹn không tồn tại")
 
@@ -267,8 +354,8 @@ def cancel_my_appointment(
             400, "Lịch hẹn này đã kết thúc hoặc đã hủy từ trước")
 
     # 4. CHECK THỜI GIAN (QUAN TRỌNG)
-    # Lấy giờ hiện tại theo UTC để so sánh
-    now = datetime.now(timezone.utc)
+    # Lấy giờ hiện tại theo UTC để so sánh (start_time lưu UTC không kèm tzinfo)
+    now = utcnow_naive()
 
     time_diff = appt.start_time - now
 
@@ -279,6 +366,8 @@ def cancel_my_appointment(
         raise HTTPException(400, "Không thể hủy lịch hẹn quá khứ")
 
     refund_msg = ""
+    before = stats.contribution(appt)
+    was_booked = slots.is_booked(appt)
 
     if appt.payment_status == "paid":
 
@@ -300,6 +389,7 @@ def cancel_my_appointment(
     cancel_reason = cancel_in.reason if cancel_in.reason else "Bệnh nhân tự hủy"
     appt.reason = f"{appt.reason} | [Đã hủy]: {cancel_reason}"
 
-    db.commit()
-    db.refresh(appt)
-    return appt
+    await stats.apply_change(db, before, appt)
+    await slots.apply_change(db, was_booked, appt)
+    await db.commit()
+    return await _load_appointment(db, appt.id)
@@ -0,0 +1,399 @@
+"""
+Bitmap ca theo ngày của từng bác sĩ (bảng doctor_day_slots).
+
+Mỗi ngày (giờ địa phương, SCHEDULE_UTC_OFFSET_MINUTES) chia thành các ca
+APPOINTMENT_DURATION_MINUTES phút tính từ 00:00, bit i = ca thứ i. Kiểm tra ca
+khi đặt lịch hay tìm ca trống chỉ còn là vài phép toán bit trên 1 dòng / ngày
+thay vì query khoảng thời gian trên bảng appointments.
+
+- working tính từ lịch làm việc hằng tuần + ngoại lệ (nghỉ, làm thêm, lễ),
+  booked từ các lịch hẹn chưa hủy.
+- Dòng được tạo khi có lịch đặt vào ngày đó, hoặc tính trước bằng
+  python -m app.cli slots rebuild. Ngày chưa có dòng thì khi đọc (ca trống)
+  được tính tạm trong bộ nhớ từ lịch làm việc + lịch hẹn.
+- Đặt / hủy / mở lại lịch: cập nhật booked trong cùng transaction, khóa dòng
+  của ngày đó. Ràng buộc chống trùng lịch trong DB vẫn là chốt chặn cuối.
+- Sửa lịch làm việc: tính lại working của các ngày đã có dòng.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import config
+from app.core.database import AsyncSessionLocal
+from app.core.timeutils import utcnow_naive
+from app.modules.appointments.models import NOT_CANCELLED, Appointment, DoctorDaySlots
+from app.modules.appointments.stats import UPSERT_DIALECTS
+from app.modules.doctors.models import Doctor, DoctorSchedule, ScheduleException
+
+LOCAL_OFFSET = timedelta(minutes=config.SCHEDULE_UTC_OFFSET_MINUTES)
+DAY_MINUTES = 24 * 60
+
+# Số bác sĩ mỗi transaction khi dựng lại bitmap
+_REBUILD_BATCH_DOCTORS = 100
+
+DayKey = Tuple[UUID, date]
+
+
+# --- Lưới ca và bitmap ---
+
+def slot_minutes() -> int:
+    return config.APPOINTMENT_DURATION_MINUTES
+
+
+def slot_length() -> timedelta:
+    return timedelta(minutes=slot_minutes())
+
+
+def slots_per_day() -> int:
+    # Ca vắt qua 00:00 hôm sau (độ dài ca không chia hết 1 ngày) không được tính
+    return DAY_MINUTES // slot_minutes()
+
+
+def full_day() -> int:
+    return (1 << slots_per_day()) - 1
+
+
+def encode(mask: int) -> bytes:
+    return mask.to_bytes((slots_per_day() + 7) // 8, "little")
+
+
+def decode(data: bytes) -> int:
+    return int.from_bytes(data, "little")
+
+
+def local_day(value: datetime) -> date:
+    """Ngày (giờ địa phương) của thời điểm value (UTC)."""
+    return (value + LOCAL_OFFSET).date()
+
+
+def day_start(day: date) -> datetime:
+    """00:00 giờ địa phương của day, đổi ra UTC."""
+    return datetime.combine(day, time()) - LOCAL_OFFSET
+
+
+def days(first_day: date, last_day: date) -> Iterator[date]:
+    day = first_day
+    while day <= last_day:
+        yield day
+        day += timedelta(days=1)
+
+
+def slot_of(start: datetime) -> Optional[Tuple[date, int]]:
+    """(ngày, số thứ tự ca) nếu start là giờ bắt đầu của 1 ca, ngược lại None."""
+    day = local_day(start)
+    index, rest = divmod(start - day_start(day), slot_length())
+    if rest or index >= slots_per_day():
+        return None
+    return day, index
+
+
+def slot_masks(start: datetime, end: datetime) -> Dict[date, int]:
+    """Các ca giao với [start, end) theo từng ngày (lịch cũ có thể lệch lưới ca)."""
+    step = slot_length()
+    masks: Dict[date, int] = {}
+    day = local_day(start)
+    while day_start(day) < end:
+        midnight = day_start(day)
+        first = max((start - midnight) // step, 0)
+        last = min(-(-(end - midnight) // step), slots_per_day())
+        if last > first:
+            masks[day] = ((1 << (last - first)) - 1) << first
+        day += timedelta(days=1)
+    return masks
+
+
+def hours_mask(start: Optional[time], end: Optional[time]) -> int:
+    """Các ca nằm trọn trong [start, end) của 1 ngày; không có giờ = cả ngày."""
+    if start is None or end is None:
+        return full_day()
+    step = slot_minutes()
+    first = -(-(start.hour * 60 + start.minute) // step)
+    last = min((end.hour * 60 + end.minute) // step, slots_per_day())
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def iter_slots(mask: int) -> Iterator[int]:
+    """Số thứ tự các bit 1 của mask, tăng dần."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# --- Lịch làm việc ---
+
+@dataclass
+class WorkPlan:
+    """Lịch làm việc của 1 bác sĩ đã đổi sang bitmap."""
+    # thứ -> ca làm; None: chưa khai báo lịch hằng tuần -> nhận lịch cả ngày
+    weekly: Optional[Dict[int, int]] = None
+    closed: Dict[date, int] = field(default_factory=dict)
+    extra: Dict[date, int] = field(default_factory=dict)
+
+    def working(self, day: date) -> int:
+        mask = full_day() if self.weekly is None else self.weekly.get(day.weekday(), 0)
+        # Trừ giờ nghỉ trước rồi mới cộng giờ làm thêm: bác sĩ trực ngày lễ vẫn nhận lịch
+        return (mask & ~self.closed.get(day, 0)) | self.extra.get(day, 0)
+
+
+async def load_plans(db: AsyncSession, doctor_ids: Iterable[UUID],
+                     first_day: date, last_day: date) -> Dict[UUID, WorkPlan]:
+    plans = {doctor_id: WorkPlan() for doctor_id in doctor_ids}
+
+    shifts = await db.execute(
+        select(DoctorSchedule.doctor_id, DoctorSchedule.weekday,
+               DoctorSchedule.start_time, DoctorSchedule.end_time)
+        .where(DoctorSchedule.doctor_id.in_(plans)))
+    for doctor_id, weekday, start, end in shifts:
+        plan = plans[doctor_id]
+        if plan.weekly is None:
+            plan.weekly = {}
+        plan.weekly[weekday] = plan.weekly.get(weekday, 0) | hours_mask(start, end)
+
+    # Ngoại lệ riêng của các bác sĩ + ngày nghỉ của cả phòng khám (doctor_id NULL)
+    exceptions = await db.execute(
+        select(ScheduleException.doctor_id, ScheduleException.day,
+               ScheduleException.start_time, ScheduleException.end_time,
+               ScheduleException.is_working)
+        .where(ScheduleException.day >= first_day, ScheduleException.day <= last_day,
+               or_(ScheduleException.doctor_id.in_(plans),
+                   ScheduleException.doctor_id.is_(None))))
+    for doctor_id, day, start, end, is_working in exceptions:
+        mask = hours_mask(start, end)
+        for plan in (plans.values() if doctor_id is None else (plans[doctor_id],)):
+            target = plan.extra if is_working else plan.closed
+            target[day] = target.get(day, 0) | mask
+    return plans
+
+
+async def _booked_masks(db: AsyncSession, doctor_ids: Iterable[UUID],
+                        first_day: date, last_day: date) -> Dict[DayKey, int]:
+    window_start, window_end = day_start(first_day), day_start(last_day + timedelta(days=1))
+    rows = await db.execute(
+        select(Appointment.doctor_id, Appointment.start_time, Appointment.end_time)
+        .where(Appointment.doctor_id.in_(list(doctor_ids)),
+               NOT_CANCELLED,
+               Appointment.start_time < window_end,
+               Appointment.end_time > window_start,
+               # Cận dưới theo start_time (mỗi lịch dài đúng 1 ca) để PostgreSQL
+               # chỉ quét các partition liên quan
+               Appointment.start_time > window_start - slot_length()))
+
+    masks: Dict[DayKey, int] = {}
+    for doctor_id, start, end in rows:
+        for day, mask in slot_masks(start, end).items():
+            if first_day <= day <= last_day:
+                masks[(doctor_id, day)] = masks.get((doctor_id, day), 0) | mask
+    return masks
+
+
+async def compute(db: AsyncSession, doctor_ids: Sequence[UUID], first_day: date,
+                  last_day: date) -> Dict[DayKey, Tuple[int, int]]:
+    """(working, booked) tính từ lịch làm việc + lịch hẹn, không dùng bảng bitmap."""
+    plans = await load_plans(db, doctor_ids, first_day, last_day)
+    booked = await _booked_masks(db, doctor_ids, first_day, last_day)
+    return {(doctor_id, day): (plan.working(day), booked.get((doctor_id, day), 0))
+            for doctor_id, plan in plans.items() for day in days(first_day, last_day)}
+
+
+# --- Đọc ---
+
+async def day_masks(db: AsyncSession, doctor_ids: Sequence[UUID], first_day: date,
+                    last_day: date) -> Dict[DayKey, Tuple[int, int]]:
+    """(working, booked) từng bác sĩ / ngày: đọc bitmap đã lưu, ngày chưa có thì tính tạm."""
+    rows = await db.execute(
+        select(DoctorDaySlots.doctor_id, DoctorDaySlots.day,
+               DoctorDaySlots.working, DoctorDaySlots.booked)
+        .where(DoctorDaySlots.doctor_id.in_(doctor_ids),
+               DoctorDaySlots.day >= first_day, DoctorDaySlots.day <= last_day,
+               DoctorDaySlots.slot_minutes == slot_minutes()))
+    result = {(doctor_id, day): (decode(working), decode(booked))
+              for doctor_id, day, working, booked in rows}
+
+    missing = [(doctor_id, day) for doctor_id in doctor_ids
+               for day in days(first_day, last_day) if (doctor_id, day) not in result]
+    if missing:
+        computed = await compute(db, sorted({doctor_id for doctor_id, _ in missing}),
+                                 min(day for _, day in missing),
+                                 max(day for _, day in missing))
+        for key in missing:
+            result[key] = computed[key]
+    return result
+
+
+# --- Ghi (gọi trước db.commit(), cùng transaction với thay đổi lịch hẹn) ---
+
+def _match(doctor_id: UUID, day: date):
+    return (DoctorDaySlots.doctor_id == doctor_id) & (DoctorDaySlots.day == day)
+
+
+async def _lock_row(db: AsyncSession, doctor_id: UUID, day: date):
+    return (await db.execute(
+        select(DoctorDaySlots.slot_minutes, DoctorDaySlots.working, DoctorDaySlots.booked)
+        .where(_match(doctor_id, day)).with_for_update())).one_or_none()
+
+
+async def _locked_day(db: AsyncSession, doctor_id: UUID, day: date) -> Tuple[int, int]:
+    """(working, booked) của dòng bitmap (tạo nếu chưa có), khóa tới hết transaction."""
+    row = await _lock_row(db, doctor_id, day)
+    if row is not None and row.slot_minutes == slot_minutes():
+        return decode(row.working), decode(row.booked)
+
+    working, booked = (await compute(db, [doctor_id], day, day))[(doctor_id, day)]
+    values = {"slot_minutes": slot_minutes(),
+              "working": encode(working), "booked": encode(booked)}
+    if row is not None:
+        # Dòng tính theo độ dài ca cũ
+        await db.execute(update(DoctorDaySlots).where(_match(doctor_id, day)).values(**values))
+        return working, booked
+
+    dialect = db.get_bind().dialect.name
+    upsert = UPSERT_DIALECTS.get(dialect)
+    if upsert is None:
+        raise RuntimeError(f"Chưa hỗ trợ bitmap ca cho {dialect}")
+    # Transaction khác vừa tạo cùng dòng thì dùng dòng đó (đã gồm lịch của transaction kia)
+    await db.execute(upsert(DoctorDaySlots.__table__)
+                     .values(doctor_id=doctor_id, day=day, **values)
+                     .on_conflict_do_nothing())
+    row = await _lock_row(db, doctor_id, day)
+    return decode(row.working), decode(row.booked)
+
+
+async def _save_booked(db: AsyncSession, doctor_id: UUID, day: date, booked: int):
+    await db.execute(update(DoctorDaySlots).where(_match(doctor_id, day))
+                     .values(booked=encode(booked)))
+
+
+async def book(db: AsyncSession, doctor_id: UUID, start: datetime, end: datetime,
+               check_working: bool = True) -> bool:
+    """
+    Đánh dấu các ca của lịch [start, end) là đã đặt (gọi sau khi INSERT lịch hẹn).
+    Trả False nếu có ca ngoài giờ làm việc của bác sĩ: người gọi rollback.
+    """
+    # Lịch hẹn vừa ghi phải được thấy khi tính booked cho dòng mới
+    await db.flush()
+    for day, mask in slot_masks(start, end).items():
+        working, booked = await _locked_day(db, doctor_id, day)
+        if check_working and mask & ~working:
+            return False
+        if mask & ~booked:
+            await _save_booked(db, doctor_id, day, booked | mask)
+    return True
+
+
+async def release(db: AsyncSession, doctor_id: UUID, start: datetime, end: datetime):
+    """
+    Lịch [start, end) vừa bị hủy: tính lại booked của ngày đó từ lịch hẹn (ca có
+    thể còn lịch cũ lệch lưới ca khác chiếm). Ngày chưa có dòng thì không cần làm gì.
+    """
+    await db.flush()
+    for day in slot_masks(start, end):
+        row = await _lock_row(db, doctor_id, day)
+        if row is None or row.slot_minutes != slot_minutes():
+            continue
+        booked = (await _booked_masks(db, [doctor_id], day, day)).get((doctor_id, day), 0)
+        if booked != decode(row.booked):
+            await _save_booked(db, doctor_id, day, booked)
+
+
+def is_booked(appt: Appointment) -> bool:
+    """Lịch có đang chiếm ca không (giống điều kiện NOT_CANCELLED)."""
+    return appt.status != "cancelled"
+
+
+async def apply_change(db: AsyncSession, was_booked: bool, appt: Appointment):
+    """Cập nhật booked khi lịch bị hủy / mở lại (không kiểm tra giờ làm việc)."""
+    if is_booked(appt) == was_booked:
+        return
+    if was_booked:
+        await release(db, appt.doctor_id, appt.start_time, appt.end_time)
+    else:
+        await book(db, appt.doctor_id, appt.start_time, appt.end_time, check_working=False)
+
+
+async def _lock_doctors(db: AsyncSession, doctor_ids: Optional[Sequence[UUID]]):
+    """
+    PostgreSQL: khóa dòng doctors. Đặt lịch giữ khóa KEY SHARE trên dòng bác sĩ
+    (khóa ngoại) từ lúc INSERT tới khi commit, nên sửa lịch làm việc phải chờ các
+    lịch đang đặt dở (và ngược lại): không dòng bitmap nào được tạo từ lịch cũ.
+    """
+    query = select(Doctor.id).order_by(Doctor.id).with_for_update()
+    if doctor_ids is not None:
+        query = query.where(Doctor.id.in_(doctor_ids))
+    await db.execute(query)
+
+
+async def refresh_working(db: AsyncSession, doctor_ids: Optional[Sequence[UUID]],
+                          first_day: date, last_day: Optional[date] = None):
+    """
+    Lịch làm việc vừa đổi (doctor_ids None: ngày nghỉ của cả phòng khám): tính
+    lại working của các ngày đã có dòng từ first_day. Người gọi commit.
+    """
+    await db.flush()
+    await _lock_doctors(db, doctor_ids)
+    query = (select(DoctorDaySlots.doctor_id, DoctorDaySlots.day, DoctorDaySlots.working)
+             .where(DoctorDaySlots.day >= first_day,
+                    DoctorDaySlots.slot_minutes == slot_minutes())
+             .with_for_update())
+    if doctor_ids is not None:
+        query = query.where(DoctorDaySlots.doctor_id.in_(doctor_ids))
+    if last_day is not None:
+        query = query.where(DoctorDaySlots.day <= last_day)
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return
+
+    plans = await load_plans(db, {row.doctor_id for row in rows},
+                             min(row.day for row in rows), max(row.day for row in rows))
+    for doctor_id, day, working in rows:
+        fresh = plans[doctor_id].working(day)
+        if fresh != decode(working):
+            await db.execute(update(DoctorDaySlots).where(_match(doctor_id, day))
+                             .values(working=encode(fresh)))
+
+
+async def rebuild(doctor_id: Optional[UUID] = None, days_ahead: Optional[int] = None) -> int:
+    """
+    Tính lại bitmap từ hôm nay tới days_ahead ngày tới cho các bác sĩ đang hoạt
+    động (hoặc 1 bác sĩ), xóa các dòng của những ngày đã qua (của bác sĩ đó). Mỗi nhóm bác sĩ 1
+    transaction. Trả số dòng đã ghi.
+    """
+    days_ahead = config.SLOTS_DAYS_AHEAD if days_ahead is None else days_ahead
+    first_day = local_day(utcnow_naive())
+    last_day = first_day + timedelta(days=days_ahead - 1)
+
+    async with AsyncSessionLocal() as db:
+        expired = delete(DoctorDaySlots).where(DoctorDaySlots.day < first_day)
+        query = select(Doctor.id).where(Doctor.is_active == True).order_by(Doctor.id)
+        if doctor_id is not None:
+            expired = expired.where(DoctorDaySlots.doctor_id == doctor_id)
+            query = select(Doctor.id).where(Doctor.id == doctor_id)
+        await db.execute(expired)
+        doctor_ids: List[UUID] = list((await db.scalars(query)).all())
+        await db.commit()
+
+    written = 0
+    for i in range(0, len(doctor_ids), _REBUILD_BATCH_DOCTORS):
+        batch = doctor_ids[i:i + _REBUILD_BATCH_DOCTORS]
+        async with AsyncSessionLocal() as db:
+            await _lock_doctors(db, batch)
+            computed = await compute(db, batch, first_day, last_day)
+            if not computed:
+                continue
+            upsert = UPSERT_DIALECTS[db.get_bind().dialect.name]
+            stmt = upsert(DoctorDaySlots.__table__).values([
+                {"doctor_id": key[0], "day": key[1], "slot_minutes": slot_minutes(),
+                 "working": encode(working), "booked": encode(booked)}
+                for key, (working, booked) in computed.items()])
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["doctor_id", "day"],
+                set_={name: stmt.excluded[name]
+                      for name in ("slot_minutes", "working", "booked")}))
+            await db.commit()
+        written += len(computed)
+    return written
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Date, case, delete, func, insert, inspect, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.modules.appointments.models import Appointment, AppointmentArchive, DoctorDailyStats
+
+# Bảng doctor_daily_stats được cập nhật cộng dồn: mỗi lần sửa 1 lịch hẹn, lấy
+# "phần đóng góp" của lịch đó trước và sau khi sửa rồi cộng phần chênh lệch
+# vào đúng 1 dòng (doctor_id, ngày). Thống kê chỉ cần đọc O(số ngày).
+
+UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+@dataclass(frozen=True)
+class Contribution:
+    doctor_id: UUID
+    day: date
+    completed_count: int
+    revenue: float
+    refunds: float
+
+
+def contribution(appt: Appointment) -> Contribution:
+    """Phần 1 lịch hẹn đóng góp vào bảng tổng hợp với trạng thái hiện tại."""
+    completed = appt.status == "completed"
+    return Contribution(
+        doctor_id=appt.doctor_id,
+        day=appt.start_time.date(),
+        completed_count=1 if completed else 0,
+        revenue=(appt.paid_price or 0.0) if completed else 0.0,
+        refunds=appt.refund_amount or 0.0,
+    )
+
+
+async def _add(db: AsyncSession, doctor_id: UUID, day: date,
+               completed_count: int, revenue: float, refunds: float):
+    if not (completed_count or revenue or refunds):
+        return
+
+    dialect = db.get_bind().dialect.name
+    upsert = UPSERT_DIALECTS.get(dialect)
+    if upsert is None:
+        raise RuntimeError(f"Chưa hỗ trợ cập nhật thống kê cho {dialect}")
+
+    table = DoctorDailyStats.__table__
+    stmt = upsert(table).values(doctor_id=doctor_id, day=day,
+                                completed_count=completed_count,
+                                revenue=revenue, refunds=refunds)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.doctor_id, table.c.day],
+        set_={
+            "completed_count": table.c.completed_count + stmt.excluded.completed_count,
+            "revenue": table.c.revenue + stmt.excluded.revenue,
+            "refunds": table.c.refunds + stmt.excluded.refunds,
+        })
+    await db.execute(stmt)
+
+
+async def apply_change(db: AsyncSession, before: Contribution, appt: Appointment):
+    """
+    Ghi phần chênh lệch của 1 lịch hẹn vào bảng tổng hợp.
+    Gọi trước db.commit() để thống kê và lịch hẹn cùng 1 transaction.
+    """
+    after = contribution(appt)
+    if after == before:
+        return
+
+    # Ghi lịch hẹn trước rồi mới tới thống kê: mọi transaction khóa theo cùng
+    # 1 thứ tự nên không deadlock, và lỗi trùng lịch (409) được báo trước
+    await db.flush()
+
+    if (after.doctor_id, after.day) != (before.doctor_id, before.day):
+        await _add(db, before.doctor_id, before.day, -before.completed_count,
+                   -before.revenue, -before.refunds)
+        await _add(db, after.doctor_id, after.day, after.completed_count,
+                   after.revenue, after.refunds)
+        return
+
+    await _add(db, after.doctor_id, after.day,
+               after.completed_count - before.completed_count,
+               after.revenue - before.revenue,
+               after.refunds - before.refunds)
+
+
+def rebuild(db: Session, doctor_id: Optional[UUID] = None) -> int:
+    """
+    Dựng lại bảng tổng hợp từ lịch sử lịch hẹn (toàn bộ hoặc 1 bác sĩ).
+    Không commit: người gọi quyết định transaction. Trả về số dòng đã ghi.
+    """
+    # Gồm cả lịch đã chuyển sang bảng lưu trữ (nếu DB đã có bảng này)
+    tables = [Appointment.__table__]
+    if inspect(db.get_bind()).has_table(AppointmentArchive.__tablename__):
+        tables.append(AppointmentArchive.__table__)
+    columns = ("doctor_id", "start_time", "status", "paid_price", "refund_amount")
+    parts = [select(*[table.c[name] for name in columns]) for table in tables]
+    if doctor_id is not None:
+        parts = [part.where(part.selected_columns.doctor_id == doctor_id) for part in parts]
+    history = union_all(*parts).subquery()
+
+    day = func.date(history.c.start_time, type_=Date)
+    completed = history.c.status == "completed"
+    completed_count = func.sum(case((completed, 1), else_=0))
+    revenue = func.sum(case((completed, history.c.paid_price), else_=0.0))
+    refunds = func.sum(func.coalesce(history.c.refund_amount, 0.0))
+
+    source = (
+        select(history.c.doctor_id, day, completed_count, revenue, refunds)
+        .group_by(history.c.doctor_id, day)
+        # Ngày không có gì để thống kê thì không cần dòng
+        .having((completed_count > 0) | (refunds > 0))
+    )
+    clear = delete(DoctorDailyStats)
+    if doctor_id is not None:
+        clear = clear.where(DoctorDailyStats.doctor_id == doctor_id)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Chặn các upsert đang chạy song song tới khi dựng lại xong, tránh cộng trùng
+        db.execute(text(
+            f"LOCK TABLE {DoctorDailyStats.__tablename__} IN EXCLUSIVE MODE"))
+
+    db.execute(clear)
+    result = db.execute(insert(DoctorDailyStats).from_select(
+        ["doctor_id", "day", "completed_count", "revenue", "refunds"], source))
+    return result.rowcount
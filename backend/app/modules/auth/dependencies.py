@@ -1,16 +1,56 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+from app.core import config
+from app.core.cache import TTLCache
 from app.core.database import get_db
 from app.core import security
 from app.modules.auth import models
+from app.modules.auth.revocation import revocation_list
 
 
 security_scheme = HTTPBearer()
 
 
-def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(security_scheme), db: Session = Depends(get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """Thông tin user đang đăng nhập (bản sao chỉ đọc, không gắn với session DB)."""
+    id: UUID
+    email: str
+    full_name: Optional[str]
+    phone_number: Optional[str]
+    role: str
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, email=user.email, full_name=user.full_name,
+                   phone_number=user.phone_number, role=user.role,
+                   is_active=user.is_active, created_at=user.created_at)
+
+
+# Cache user theo id để không phải SELECT users mỗi request.
+# Phải gọi invalidate_principal() mỗi khi role / is_active của user thay đổi.
+principal_cache = TTLCache(maxsize=config.PRINCIPAL_CACHE_SIZE,
+                           ttl=config.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(user_id: UUID):
+    principal_cache.invalidate(user_id)
+
+
+# User bị thu hồi toàn bộ token (cả ở worker khác) -> bỏ khỏi cache của worker này
+revocation_list.user_listeners.append(invalidate_principal)
+
+
+async def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(security_scheme), db: AsyncSession = Depends(get_db)):
 
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,25 +64,43 @@ def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(security_
         # Giai ma token
         payload = jwt.decode(token, security.SECRET_KEY,
                              algorithms=[security.ALGORITHM])
-        user_id: str = payload.get("sub")
+        user_id = UUID(payload.get("sub"))
 
-        if user_id is None:
-            raise credentials_exception
+    except (JWTError, TypeError, ValueError):
+        raise credentials_exception
 
-    except JWTError:
+    # Refresh token không dùng thay access token được; token cũ (chưa có "type")
+    # vẫn được nhận tới khi hết hạn
+    if payload.get("type", "access") != "access":
         raise credentials_exception
 
-    # Tim user trong db theo id lay tu token
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+    # Token đã bị thu hồi (đăng xuất, khóa tài khoản): tra trong bộ nhớ
+    if revocation_list.is_revoked(payload.get("jti"), user_id, payload.get("iat")):
         raise credentials_exception
 
-    return user
+    # Tim user trong cache, chi query db khi cache miss
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        generation = principal_cache.generation
+        user = await db.scalar(select(models.User).where(models.User.id == user_id))
+        if user is None:
+            raise credentials_exception
+
+        principal = Principal.from_user(user)
+        principal_cache.set(user_id, principal, generation=generation)
+
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Tài khoản đã bị khóa hoặc chưa được kích hoạt."
+        )
+
+    return principal
 
 # Kiem tra quyen admin, hàm kế thừa từ get_current_user
 
 
-def get_current_admin(current_user: models.User = Depends(get_current_user)):
+async def get_current_admin(current_user: Principal = Depends(get_current_user)):
     # Chỉ cho phép admin truy cập
     if current_user.role != 'admin':
         raise HTTPException(
@@ -1,9 +1,20 @@
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, DateTime, String, Boolean, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.core.database import Base
 from app.core.model_base import BaseModel
+from app.core.search import enable_trigram_extension, trigram_index
 
 
 class User(BaseModel):
     __tablename__ = "users"
+    __table_args__ = (
+        # Phục vụ phân trang keyset theo (created_at, id)
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Tìm kiếm gần đúng (admin tìm user), xem app/core/search.py
+        trigram_index("ix_users_full_name_trgm", "full_name"),
+        trigram_index("ix_users_email_trgm", "email"),
+        trigram_index("ix_users_phone_number_trgm", "phone_number"),
+    )
 
     email = Column(String(255), unique=True, index=True, nullable=False)
     password = Column(String(255), nullable=False)
@@ -12,3 +23,24 @@ class User(BaseModel):
 
     role = Column(String(20), default="patient")
     is_active = Column(Boolean, default=True)
+
+
+enable_trigram_extension(User.__table__)
+
+
+class RevokedToken(Base):
+    """
+    Token đã bị thu hồi (xem app/modules/auth/revocation.py):
+    - kind "access" / "refresh": 1 token, khóa là jti của token,
+    - kind "user": mọi token của user phát hành trước revoked_at (khóa tài
+      khoản, phát hiện refresh token bị dùng lại), khóa là "user:<user_id>".
+    Dòng hết tác dụng sau expires_at, dọn bằng: python -m app.cli tokens purge
+    """
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    kind = Column(String(10), nullable=False)
+    # Giờ UTC không kèm tzinfo, giống các cột thời gian của lịch hẹn
+    revoked_at = Column(DateTime, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,207 @@
+"""
+Thu hồi JWT: đăng xuất, khóa / xóa tài khoản, đổi refresh token.
+
+- Access token sống ngắn (ACCESS_TOKEN_EXPIRE_MINUTES) nên danh sách thu hồi chỉ
+  cần giữ tới khi token hết hạn: get_current_user tra trong bộ nhớ (2 lần tra
+  dict), không query DB.
+- Mỗi lần thu hồi ghi 1 dòng vào bảng revoked_tokens; mỗi worker đọc các dòng
+  mới sau mỗi REVOCATION_SYNC_SECONDS giây để biết token bị thu hồi ở worker
+  khác (worker thu hồi thì có hiệu lực ngay).
+- Đổi role / khóa / mở khóa tài khoản cũng thu hồi toàn bộ token của user:
+  worker nào đọc được dòng "user" thì bỏ user khỏi cache đăng nhập.
+- Refresh token (ít dùng) được kiểm tra thẳng trong DB. Mỗi refresh token chỉ
+  dùng được 1 lần: dùng xong bị thu hồi và đổi cặp token mới. Refresh token đã
+  thu hồi mà bị gửi lại (có thể đã lộ) thì thu hồi mọi token của user.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core import config, security
+from app.core.timeutils import utcnow_naive
+from app.modules.auth.models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LIFETIME = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
+REFRESH_LIFETIME = timedelta(days=security.REFRESH_TOKEN_EXPIRE_DAYS)
+# Mỗi lần đồng bộ đọc lùi thêm 1 khoảng: dòng có revoked_at trước lần đọc
+# trước nhưng commit sau đó vẫn được thấy
+_SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def _to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class RevocationList:
+    """
+    Token bị thu hồi trong bộ nhớ: jti -> hạn của token, user_id -> mốc thu hồi
+    toàn bộ. Phần tử bị xóa khi mọi access token liên quan đã hết hạn (heap
+    theo thời điểm hết tác dụng), nên kích thước chỉ bằng số lần thu hồi trong
+    ACCESS_TOKEN_EXPIRE_MINUTES phút gần nhất.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, float] = {}
+        self._users: Dict[UUID, float] = {}
+        # (hết tác dụng lúc, kind, jti / user_id)
+        self._expiry = []
+        self.synced_at: Optional[datetime] = None
+        self.sync_errors = 0
+        # Gọi với user_id mỗi khi user bị thu hồi toàn bộ (ở worker này hoặc
+        # đọc được lúc đồng bộ), vd để bỏ user khỏi cache đăng nhập
+        self.user_listeners: List[Callable[[UUID], None]] = []
+
+    def add_token(self, jti: str, expires_at: float):
+        if expires_at <= time.time():
+            return
+        self._tokens[jti] = expires_at
+        heapq.heappush(self._expiry, (expires_at, "access", jti))
+        self._evict()
+
+    def add_user(self, user_id: UUID, revoked_at: float):
+        if revoked_at <= self._users.get(user_id, 0):
+            return
+        self._users[user_id] = revoked_at
+        for listener in self.user_listeners:
+            listener(user_id)
+        # Access token phát hành trước revoked_at hết hạn chậm nhất sau ACCESS_LIFETIME
+        heapq.heappush(self._expiry,
+                       (revoked_at + ACCESS_LIFETIME.total_seconds(), "user", user_id))
+        self._evict()
+
+    def _evict(self):
+        now = time.time()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, kind, key = heapq.heappop(self._expiry)
+            if kind == "access":
+                self._tokens.pop(key, None)
+            elif self._users.get(key, now) + ACCESS_LIFETIME.total_seconds() <= now:
+                del self._users[key]
+
+    def is_revoked(self, jti: Optional[str], user_id: UUID, issued_at) -> bool:
+        if jti in self._tokens:
+            return True
+        revoked_before = self._users.get(user_id)
+        return revoked_before is not None and (issued_at or 0) < revoked_before
+
+    def add_row(self, row):
+        if row.kind == "access":
+            self.add_token(row.jti, _to_timestamp(row.expires_at))
+        elif row.kind == "user":
+            self.add_user(row.user_id, _to_timestamp(row.revoked_at))
+
+    async def sync(self, engine: AsyncEngine):
+        """Đọc các dòng thu hồi mới (của mọi worker) từ DB."""
+        now = utcnow_naive()
+        since = now - ACCESS_LIFETIME
+        if self.synced_at is not None:
+            since = max(since, self.synced_at - _SYNC_OVERLAP)
+        async with engine.connect() as conn:
+            rows = await conn.execute(
+                select(RevokedToken.jti, RevokedToken.user_id, RevokedToken.kind,
+                       RevokedToken.revoked_at, RevokedToken.expires_at)
+                .where(RevokedToken.kind != "refresh", RevokedToken.revoked_at >= since))
+            for row in rows:
+                self.add_row(row)
+        self.synced_at = now
+        self._evict()
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+            "sync_errors": self.sync_errors,
+        }
+
+
+revocation_list = RevocationList()
+
+
+async def run_sync(engine: AsyncEngine):
+    """Chạy nền trong app: định kỳ đồng bộ danh sách thu hồi từ DB."""
+    while True:
+        try:
+            await revocation_list.sync(engine)
+        except Exception:
+            revocation_list.sync_errors += 1
+            logger.exception("Không đồng bộ được danh sách token bị thu hồi")
+        await asyncio.sleep(config.REVOCATION_SYNC_SECONDS)
+
+
+async def revoke_token(db: AsyncSession, claims: dict, merge: bool = True):
+    """
+    Thu hồi 1 token (claims đã verify). Ghi vào session, người gọi commit.
+    merge=False: INSERT thẳng, token đã bị thu hồi thì lỗi IntegrityError
+    (dùng khi đổi refresh token để 2 request đổi cùng lúc chỉ 1 cái thành công).
+    """
+    row = RevokedToken(jti=claims["jti"], user_id=UUID(claims["sub"]),
+                       kind=claims["type"], revoked_at=utcnow_naive(),
+                       expires_at=_to_datetime(claims["exp"]))
+    if merge:
+        await db.merge(row)
+    else:
+        await db.execute(insert(RevokedToken).values(
+            jti=row.jti, user_id=row.user_id, kind=row.kind,
+            revoked_at=row.revoked_at, expires_at=row.expires_at))
+    if row.kind == "access":
+        revocation_list.add_token(row.jti, claims["exp"])
+
+
+async def revoke_user(db: AsyncSession, user_id: UUID):
+    """
+    Thu hồi mọi token đã phát hành của user (đổi role, khóa / mở khóa / xóa tài
+    khoản, refresh token bị dùng lại). Người gọi commit.
+    """
+    now = utcnow_naive()
+    await db.merge(RevokedToken(jti=_user_key(user_id), user_id=user_id, kind="user",
+                                revoked_at=now, expires_at=now + REFRESH_LIFETIME))
+    revocation_list.add_user(user_id, _to_timestamp(now))
+
+
+async def is_refresh_revoked(db: AsyncSession, claims: dict) -> bool:
+    """Kiểm tra refresh token trong DB (chính xác cho mọi worker)."""
+    user_id = UUID(claims["sub"])
+    found = await db.scalar(select(RevokedToken.jti).where(or_(
+        RevokedToken.jti == claims["jti"],
+        and_(RevokedToken.jti == _user_key(user_id),
+             RevokedToken.revoked_at > _to_datetime(claims.get("iat", 0))),
+    )).limit(1))
+    return found is not None
+
+
+async def is_refresh_reused(db: AsyncSession, claims: dict) -> bool:
+    """
+    Refresh token đã bị thu hồi riêng (đã đổi / đăng xuất) mà vẫn được gửi lại,
+    và user chưa bị thu hồi toàn bộ sau khi token được phát hành.
+    """
+    user_key = _user_key(UUID(claims["sub"]))
+    rows = dict((await db.execute(select(RevokedToken.jti, RevokedToken.revoked_at)
+                                  .where(RevokedToken.jti.in_([claims["jti"], user_key])))).all())
+    user_revoked_at = rows.get(user_key)
+    return claims["jti"] in rows and (
+        user_revoked_at is None or user_revoked_at <= _to_datetime(claims.get("iat", 0)))
+
+
+def purge_expired(db) -> int:
+    """Xóa các dòng đã hết tác dụng (session sync, dùng cho CLI). Trả số dòng đã xóa."""
+    result = db.execute(delete(RevokedToken)
+                        .where(RevokedToken.expires_at <= utcnow_naive()))
+    return result.rowcount
@@ -1,28 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import JWTError, jwt
 from uuid import UUID
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.modules.auth import models, schemas
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db, get_read_db
+from app.core import responses
+from app.core.pagination import cursor_headers, keyset_filter, split_page
+from app.modules.auth import models, revocation, schemas
 from app.core import security
-from app.modules.auth.dependencies import get_current_user
+from app.core.ratelimit import rate_limit
+from app.core import search as search_engine
 from typing import List, Optional
-from app.modules.auth.dependencies import get_current_user, get_current_admin
+from app.modules.auth.dependencies import (
+    Principal, get_current_user, get_current_admin, invalidate_principal, security_scheme)
 
 router = APIRouter()
 
 
-@router.post("/register", response_model=schemas.UserResponse)
-def register_user(user: schemas.UserRegister, db: Session = Depends(get_db)):
+def _issue_tokens(user_id) -> dict:
+    data = {"sub": str(user_id)}
+    return {
+        "access_token": security.create_access_token(data),
+        "refresh_token": security.create_refresh_token(data),
+        "token_type": "bearer",
+        "expires_in": security.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def _decode_refresh_token(token: str) -> Optional[dict]:
+    try:
+        claims = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+        UUID(claims["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+    if claims.get("type") != "refresh" or not claims.get("jti"):
+        return None
+    return claims
+
+
+@router.post("/register", response_model=schemas.UserResponse,
+             dependencies=[Depends(rate_limit("register"))])
+async def register_user(user: schemas.UserRegister, db: AsyncSession = Depends(get_db)):
     # Kiem tra neu email da ton tai
-    user_exist = db.query(models.User).filter(
-        models.User.email == user.email).first()
+    user_exist = await db.scalar(select(models.User).where(
+        models.User.email == user.email))
     if user_exist:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email đã được sử dụng.")
 
     # Hash mat khau
-    hashed_password = security.get_password_hash(user.password)
+    hashed_password = await security.get_password_hash_async(user.password)
 
     # Tao user moi
     new_user = models.User(
@@ -33,77 +62,138 @@ def register_user(user: schemas.UserRegister, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 
-@router.post("/login", response_model=schemas.Token)
-def login_user(user_in: schemas.UserLogin, db: Session = Depends(get_db)):
+@router.post("/login", response_model=schemas.Token,
+             dependencies=[Depends(rate_limit("login"))])
+async def login_user(user_in: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
     # Tim user
-    user = db.query(models.User).filter(
-        models.User.email == user_in.email).first()
+    user = await db.scalar(select(models.User).where(
+        models.User.email == user_in.email))
 
     # Check mat khau
-    if not user or not security.verify_password(user_in.password, user.password):
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Email hoặc mật khẩu không đúng.")
 
+    is_valid, new_hash = await security.verify_password_async(user_in.password, user.password)
+    if not is_valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Email hoặc mật khẩu không đúng.")
+
+    # Tham số Argon2 đã thay đổi -> lưu lại hash mới
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
     # Tao token
-    access_token = security.create_access_token(data={"sub": str(user.id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_tokens(user.id)
+
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_access_token(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Đổi refresh token lấy cặp token mới; refresh token cũ bị thu hồi (chỉ dùng 1 lần)."""
+    invalid = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Refresh token không hợp lệ hoặc đã hết hạn")
+    claims = _decode_refresh_token(body.refresh_token)
+    if claims is None:
+        raise invalid
+    if await revocation.is_refresh_revoked(db, claims):
+        # Refresh token đã dùng / đã đăng xuất bị gửi lại: có thể đã bị lộ, thu
+        # hồi mọi token của user (cả người giữ token mới nhất phải đăng nhập lại)
+        if await revocation.is_refresh_reused(db, claims):
+            await revocation.revoke_user(db, UUID(claims["sub"]))
+            await db.commit()
+        raise invalid
+
+    user = await db.get(models.User, UUID(claims["sub"]))
+    if user is None or not user.is_active:
+        raise invalid
+
+    try:
+        await revocation.revoke_token(db, claims, merge=False)
+        await db.commit()
+    except IntegrityError:
+        # Request khác vừa dùng cùng refresh token
+        await db.rollback()
+        raise invalid
+    return _issue_tokens(user.id)
 
 
 @router.post("/logout")
-def logout(current_user: models.User = Depends(get_current_user)):
+async def logout(body: Optional[schemas.LogoutRequest] = None,
+                 token_obj: HTTPAuthorizationCredentials = Depends(security_scheme),
+                 db: AsyncSession = Depends(get_db),
+                 current_user: Principal = Depends(get_current_user)):
+    """Thu hồi access token đang dùng (và refresh token nếu gửi kèm)."""
+    # Token đã được get_current_user verify
+    claims = jwt.get_unverified_claims(token_obj.credentials)
+    if claims.get("jti"):
+        await revocation.revoke_token(db, claims)
+
+    refresh_claims = _decode_refresh_token(body.refresh_token) if body and body.refresh_token else None
+    if refresh_claims and refresh_claims["sub"] == str(current_user.id):
+        await revocation.revoke_token(db, refresh_claims)
+
+    await db.commit()
     return {"message": "Đăng xuất thành công."}
 
 
 @router.get("/users", response_model=List[schemas.UserResponse])
-def get_users(
-    skip: int = 0,
-    limit: int = 10,
+async def get_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     search: Optional[str] = None,
     role: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
-    query = db.query(models.User)
+    query = select(models.User)
 
     # Lọc theo role
     if role:
         query = query.filter(models.User.role == role)
 
-    # Lọc theo từ khóa tìm kiếm
+    # Tìm theo từ khóa: trả về tối đa `limit` user giống nhất (không phân trang)
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                models.User.full_name.ilike(search_term),
-                models.User.email.ilike(search_term),
-                models.User.phone_number.ilike(search_term)
-            )
-        )
-
-    users = query.offset(skip).limit(limit).all()
-    return users
+        users = await search_engine.search(
+            db, query,
+            (models.User.full_name, models.User.email, models.User.phone_number),
+            search, limit)
+        return responses.model_response(List[schemas.UserResponse], users)
+
+    # Phân trang theo cursor (created_at, id), cursor trang sau trả trong header
+    sort_keys = (models.User.created_at, models.User.id)
+    rows = (await db.scalars(keyset_filter(query, sort_keys, cursor, limit))).all()
+    users, next_cursor = split_page(rows, sort_keys, limit)
+
+    # Serialize thẳng ra bytes (xem app/core/responses.py)
+    return responses.model_response(List[schemas.UserResponse], users,
+                                    headers=cursor_headers(next_cursor))
 
 # API sửa thông tin user (dành cho admin)
 
 
 @router.put("/users/{user_id}", response_model=schemas.UserResponse)
-def update_user_admin(
+async def update_user_admin(
     user_id: UUID,
     user_update: schemas.UserUpdateAdmin,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
     # Tìm user cần sửa
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User không tồn tại.")
 
+    # Đổi role / is_active phải có hiệu lực ở mọi worker
+    access_changed = (
+        (user_update.is_active is not None and user_update.is_active != user.is_active)
+        or (user_update.role is not None and user_update.role != user.role))
+
     # Cập nhật từng trường (nếu có)
     if user_update.full_name is not None:
         user.full_name = user_update.full_name
@@ -118,21 +208,27 @@ def update_user_admin(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Role không hợp lệ.")
         user.role = user_update.role
 
-    db.commit()
-    db.refresh(user)
+    # Khóa tài khoản / đổi quyền -> thu hồi mọi token đã cấp (đăng nhập lại để
+    # nhận quyền mới); các worker khác bỏ user khỏi cache khi đồng bộ
+    if user_update.is_active is False or access_changed:
+        await revocation.revoke_user(db, user.id)
+
+    await db.commit()
+    # Role / is_active có thể đã đổi -> bỏ user khỏi cache đăng nhập
+    invalidate_principal(user.id)
     return user
 
 # API xóa user (dành cho admin)
 
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user_admin(
+async def delete_user_admin(
     user_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
     """Xóa user theo ID (dành cho admin)"""
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User không tồn tại.")
@@ -142,6 +238,8 @@ def delete_user_admin(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Không thể xóa chính mình.")
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await revocation.revoke_user(db, user_id)
+    await db.commit()
+    invalidate_principal(user_id)
     return None
@@ -30,6 +30,18 @@ class UserResponse(BaseModel):
 class Token(BaseModel):  # Schema tra ve token
     access_token: str
     token_type: str
+    # Dùng ở /auth/refresh để lấy access token mới khi access token hết hạn
+    refresh_token: str
+    expires_in: int  # Số giây access token còn hiệu lực
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    # Gửi kèm để thu hồi luôn refresh token của phiên đăng nhập
+    refresh_token: Optional[str] = None
 
 
 class UserUpdateAdmin(BaseModel):
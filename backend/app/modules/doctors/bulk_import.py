@@ -0,0 +1,234 @@
+"""
+Import bác sĩ hàng loạt (tạo luôn tài khoản) từ file CSV có dòng tiêu đề hoặc
+NDJSON (mỗi dòng 1 object JSON). Dùng cho API POST /doctors/import và lệnh
+python -m app.cli import-doctors <file>.
+
+Cột / field: email, password, full_name, phone_number, specialty (ID hoặc tên),
+level (ID, mã hoặc tên, có thể bỏ trống), price_per_visit, description, is_active.
+
+- File được đọc dần theo lô IMPORT_BATCH_SIZE dòng, không nạp cả file vào bộ nhớ.
+- Mỗi dòng được kiểm tra bằng schemas.DoctorImportRow (giống đăng ký), chuyên
+  khoa / cấp bậc được nạp 1 lần lúc bắt đầu.
+- Mỗi lô: 1 query tìm email đã tồn tại, hash mật khẩu song song trên pool hash,
+  rồi INSERT nhiều dòng 1 lần (users rồi doctors) trong 1 transaction. Lô lỗi
+  khi INSERT (vd email vừa được đăng ký ở nơi khác) thì chèn lại từng dòng để
+  tìm đúng dòng lỗi.
+- Dòng lỗi không chặn các dòng khác; báo cáo trả về lỗi của từng dòng.
+  File lỗi UTF-8 / CSV thì bị từ chối cả file trước khi import dòng nào.
+"""
+import csv
+import io
+import json
+import tempfile
+import uuid
+from typing import AsyncIterator, Dict, IO, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core import config, search, security
+from app.core.database import AsyncSessionLocal
+from app.modules.auth.models import User
+from app.modules.doctors import schemas
+from app.modules.doctors.models import Doctor, DoctorLevel, Specialty
+
+FORMATS = ("csv", "ndjson")
+
+# Body lớn hơn mức này được ghi tạm ra đĩa thay vì giữ trong bộ nhớ
+_SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+def detect_format(text: IO[str]) -> str:
+    """NDJSON nếu ký tự đầu tiên (bỏ khoảng trắng) là "{", ngược lại CSV."""
+    start = text.read(1024)
+    text.seek(0)
+    return "ndjson" if start.lstrip().startswith("{") else "csv"
+
+
+def read_rows(text: IO[str], file_format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Từng dòng dữ liệu: (số dòng, dict field, lỗi đọc nếu có)."""
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Ô trống = không có giá trị (field tùy chọn lấy mặc định); bỏ cột thừa
+            data = {key.strip(): value for key, value in record.items()
+                    if isinstance(key, str) and isinstance(value, str) and value.strip()}
+            yield reader.line_num, data, None
+        return
+
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield number, None, "Dòng không phải JSON hợp lệ"
+            continue
+        if not isinstance(data, dict):
+            yield number, None, "Mỗi dòng phải là 1 object JSON"
+            continue
+        yield number, data, None
+
+
+def check_file(text: IO[str], file_format: str):
+    """
+    Đọc thử cả file trước khi import: lỗi UTF-8 / CSV (UnicodeDecodeError,
+    csv.Error) báo ngay, không phải giữa chừng khi các lô trước đã commit.
+    """
+    lines = csv.reader(text) if file_format == "csv" else text
+    for _ in lines:
+        pass
+    text.seek(0)
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+                     for item in error.errors())
+
+
+class DoctorImporter:
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or config.IMPORT_BATCH_SIZE
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self._seen_emails = set()
+        # Khóa tra cứu (ID, tên / mã viết thường) -> chuyên khoa / cấp bậc
+        self._specialties: Dict[str, uuid.UUID] = {}
+        self._levels: Dict[str, DoctorLevel] = {}
+
+    def report(self) -> dict:
+        return {"total": self.total, "imported": self.imported,
+                "failed": self.failed, "errors": self.errors}
+
+    def _fail(self, line: int, email: Optional[str], error: str):
+        self.failed += 1
+        if len(self.errors) < config.IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "email": email, "error": error})
+
+    async def _load_catalog(self):
+        async with AsyncSessionLocal() as db:
+            for specialty in await db.scalars(select(Specialty)):
+                for key in (str(specialty.id), specialty.id.hex, specialty.name.strip().lower()):
+                    self._specialties[key] = specialty.id
+            for level in await db.scalars(select(DoctorLevel)):
+                for key in (str(level.id), level.id.hex, level.code.strip().lower(), level.name.strip().lower()):
+                    self._levels[key] = level
+
+    def _prepare(self, line: int, data: dict) -> Optional[Tuple[dict, dict]]:
+        """Kiểm tra 1 dòng, trả (dòng users, dòng doctors) chưa có mật khẩu hash."""
+        try:
+            row = schemas.DoctorImportRow.model_validate(data)
+        except ValidationError as e:
+            email = data.get("email")
+            self._fail(line, email if isinstance(email, str) else None, _validation_message(e))
+            return None
+
+        if row.email in self._seen_emails:
+            self._fail(line, row.email, "Email bị trùng với dòng trước trong file")
+            return None
+        self._seen_emails.add(row.email)
+
+        specialty_id = self._specialties.get(row.specialty.strip().lower())
+        if specialty_id is None:
+            self._fail(line, row.email, f"Chuyên ngành không tồn tại: {row.specialty}")
+            return None
+        level = None
+        if row.level:
+            level = self._levels.get(row.level.strip().lower())
+            if level is None:
+                self._fail(line, row.email, f"Cấp bậc không tồn tại: {row.level}")
+                return None
+
+        # Không nhập giá (hoặc 0) thì lấy giá cơ bản của cấp bậc, giống khi admin duyệt
+        price = row.price_per_visit
+        if not price and level is not None:
+            price = level.base_price
+
+        user_id = uuid.uuid4()
+        user = {"id": user_id, "email": row.email, "password": row.password,
+                "full_name": row.full_name, "phone_number": row.phone_number,
+                "role": "doctor", "is_active": row.is_active}
+        doctor = {"id": uuid.uuid4(), "user_id": user_id, "specialty_id": specialty_id,
+                  "price_per_visit": price, "level_id": level.id if level else None,
+                  "description": row.description, "is_active": row.is_active}
+        return user, doctor
+
+    async def _import_batch(self, batch: List[Tuple[int, dict, dict]]):
+        async with AsyncSessionLocal() as db:
+            existing = set(await db.scalars(select(User.email).where(
+                User.email.in_([user["email"] for _, user, _ in batch]))))
+            pending = []
+            for line, user, doctor in batch:
+                if user["email"] in existing:
+                    self._fail(line, user["email"], "Email đã được sử dụng")
+                else:
+                    pending.append((line, user, doctor))
+            if not pending:
+                return
+
+            hashes = await security.get_password_hashes_async(
+                [user["password"] for _, user, _ in pending])
+            for (_, user, _), hashed in zip(pending, hashes):
+                user["password"] = hashed
+
+            try:
+                await db.execute(insert(User).values([user for _, user, _ in pending]))
+                await db.execute(insert(Doctor).values([doctor for _, _, doctor in pending]))
+                await db.commit()
+                self.imported += len(pending)
+                # INSERT bằng Core không qua session.new: tự báo index tìm kiếm
+                search.mark_stale(User, Doctor)
+                return
+            except IntegrityError:
+                await db.rollback()
+
+            # Có dòng vi phạm ràng buộc: chèn lại từng dòng để biết dòng nào lỗi
+            for line, user, doctor in pending:
+                try:
+                    await db.execute(insert(User).values(user))
+                    await db.execute(insert(Doctor).values(doctor))
+                    await db.commit()
+                    self.imported += 1
+                except IntegrityError:
+                    await db.rollback()
+                    self._fail(line, user["email"], "Email đã được sử dụng")
+            search.mark_stale(User, Doctor)
+
+    async def run(self, text: IO[str], file_format: Optional[str] = None) -> dict:
+        file_format = file_format or detect_format(text)
+        check_file(text, file_format)
+        await self._load_catalog()
+        batch = []
+        for line, data, error in read_rows(text, file_format):
+            self.total += 1
+            if error is not None:
+                self._fail(line, None, error)
+                continue
+            prepared = self._prepare(line, data)
+            if prepared is None:
+                continue
+            batch.append((line, *prepared))
+            if len(batch) >= self.batch_size:
+                await self._import_batch(batch)
+                batch = []
+        if batch:
+            await self._import_batch(batch)
+        return self.report()
+
+
+async def import_stream(chunks: AsyncIterator[bytes], file_format: Optional[str] = None) -> dict:
+    """Import từ body request: ghi tạm (bộ nhớ / đĩa) rồi đọc dần theo lô."""
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY) as spool:
+        async for chunk in chunks:
+            spool.write(chunk)
+        spool.seek(0)
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        return await DoctorImporter().run(text, file_format)
+
+
+async def import_file(path: str, file_format: Optional[str] = None) -> dict:
+    with open(path, encoding="utf-8-sig", newline="") as text:
+        return await DoctorImporter().run(text, file_format)
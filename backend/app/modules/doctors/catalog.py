@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response, status
+
+from app.core import config, responses
+from app.core.cache import TTLCache
+
+# Cache danh mục (chuyên khoa, cấp bậc) trong process: lưu sẵn JSON đã serialize
+# và ETag. Danh mục chỉ đổi khi admin tạo mới, nên lúc bình thường các API GET
+# không cần gọi DB; client gửi If-None-Match trùng ETag thì chỉ nhận 304.
+
+SPECIALTIES = "specialties"
+LEVELS = "levels"
+
+catalog_cache = TTLCache(maxsize=16, ttl=config.CATALOG_CACHE_TTL_SECONDS)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    body: bytes
+    etag: str
+
+
+async def get_entry(key: str, load: Callable[[], Awaitable[Any]],
+                    schema: Any) -> CatalogEntry:
+    entry = catalog_cache.get(key)
+    if entry is None:
+        # Ghi lại version trước khi đọc DB: nếu có invalidate xen giữa thì bỏ kết quả
+        generation = catalog_cache.generation
+        rows = await load()
+        body = responses.dump(schema, rows)
+        # ETag theo nội dung: các worker có cùng dữ liệu trả cùng ETag
+        entry = CatalogEntry(body=body, etag=f'"{sha256(body).hexdigest()}"')
+        catalog_cache.set(key, entry, generation)
+    return entry
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match so sánh "yếu": bỏ qua tiền tố W/
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+def respond(request: Request, entry: CatalogEntry) -> Response:
+    # no-cache: trình duyệt được lưu nhưng phải hỏi lại server (nhận 304 nếu chưa đổi)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def invalidate(key: str):
+    catalog_cache.invalidate(key)
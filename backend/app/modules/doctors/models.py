@@ -1,11 +1,18 @@
-from sqlalchemy import Column, String, ForeignKey, Boolean, Float
+from sqlalchemy import Column, String, ForeignKey, Boolean, Float, Index, Integer, Date, Time
 from sqlalchemy.orm import relationship
 from app.core.model_base import BaseModel
+from app.core.search import enable_trigram_extension, trigram_index
 from sqlalchemy.dialects.postgresql import UUID
 
 
 class Specialty(BaseModel):
     __tablename__ = "specialties"
+    __table_args__ = (
+        # Tìm chuyên khoa theo tên / từ khóa / đối tượng, xem app/core/search.py
+        trigram_index("ix_specialties_name_trgm", "name"),
+        trigram_index("ix_specialties_keywords_trgm", "keywords"),
+        trigram_index("ix_specialties_target_audience_trgm", "target_audience"),
+    )
 
     name = Column(String(100), nullable=False, unique=True)  # Ten chuyen khoa
     description = Column(String(500), nullable=True)  # Mo ta chuyen khoa
@@ -21,6 +28,10 @@ class Specialty(BaseModel):
 
 class Doctor(BaseModel):
     __tablename__ = "doctors"
+    __table_args__ = (
+        # Phục vụ phân trang keyset theo (created_at, id)
+        Index("ix_doctors_created_at_id", "created_at", "id"),
+    )
 
     # Lien ket voi bang users
     user_id = Column(UUID(as_uuid=True), ForeignKey(
@@ -56,3 +67,50 @@ class DoctorLevel(BaseModel):
     description = Column(String(255), nullable=True)  # Mô tả cấp bậc
 
     doctors = relationship("Doctor", backref="level_info")
+
+
+# ==========================================
+# LỊCH LÀM VIỆC
+# ==========================================
+# Giờ theo giờ địa phương của phòng khám (SCHEDULE_UTC_OFFSET_MINUTES). Được đổi
+# thành bitmap ca theo ngày (bảng doctor_day_slots, xem appointments/slots.py).
+
+
+class DoctorSchedule(BaseModel):
+    """
+    Lịch làm việc hằng tuần: mỗi dòng 1 ca làm trong 1 thứ (vd thứ 2 08:00-12:00).
+    Bác sĩ chưa có dòng nào thì nhận lịch cả ngày (như trước khi có lịch làm việc).
+    """
+    __tablename__ = "doctor_schedules"
+
+    doctor_id = Column(UUID(as_uuid=True), ForeignKey(
+        "doctors.id"), nullable=False, index=True)
+
+    weekday = Column(Integer, nullable=False)  # 0 = thứ 2 ... 6 = chủ nhật
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+
+
+class ScheduleException(BaseModel):
+    """
+    Ngoại lệ theo ngày: nghỉ (is_working = False) hoặc làm thêm giờ (True).
+    doctor_id NULL: ngày nghỉ của cả phòng khám (lễ, tết).
+    start_time / end_time NULL: cả ngày.
+    """
+    __tablename__ = "schedule_exceptions"
+    __table_args__ = (
+        Index("ix_schedule_exceptions_day_doctor", "day", "doctor_id"),
+    )
+
+    doctor_id = Column(UUID(as_uuid=True), ForeignKey(
+        "doctors.id"), nullable=True)
+
+    day = Column(Date, nullable=False)
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    is_working = Column(Boolean, nullable=False, default=False)
+
+    note = Column(String(255), nullable=True)  # Lý do nghỉ / ghi chú
+
+
+enable_trigram_extension(Specialty.__table__)
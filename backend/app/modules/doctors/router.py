@@ -1,29 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import csv
+from datetime import datetime, timedelta
 from typing import List, Optional
 from uuid import UUID
 
-from app.core.database import get_db
-from app.modules.doctors import schemas
-from app.modules.doctors.models import Doctor, Specialty, DoctorLevel
+from app.core.database import get_db, get_read_db
+from app.core.eager_load import eager_options
+from app.core import responses
+from app.core.pagination import cursor_headers, keyset_filter, split_page
+from app.core.ratelimit import rate_limit
+from app.core.timeutils import to_utc_naive, utcnow_naive
+from app.modules.doctors import bulk_import, catalog, schemas
+from app.modules.doctors.models import Doctor, Specialty, DoctorLevel, DoctorSchedule, ScheduleException
 from app.modules.auth.models import User
-from app.modules.auth.dependencies import get_current_admin
-from app.core import security
+from app.modules.auth import revocation
+from app.modules.auth.dependencies import Principal, get_current_admin, get_current_user, invalidate_principal
+from app.core import config, security
+from app.core import search as search_engine
+from app.modules.appointments import availability, slots
 
 router = APIRouter()
 
+# Các cột dùng khi tìm chuyên khoa (đều có index trigram)
+SPECIALTY_SEARCH_COLUMNS = (
+    Specialty.name, Specialty.keywords, Specialty.target_audience)
+
+# Số chuyên khoa khớp tối đa khi lọc bác sĩ theo tên chuyên khoa
+SPECIALTY_MATCH_LIMIT = 50
+
+
+def _doctor_query():
+    # Query Doctor kèm sẵn user / specialty_info / level_info cho DoctorResponse
+    return select(Doctor).options(*eager_options(Doctor, schemas.DoctorResponse))
+
+
+async def _load_doctor(db: AsyncSession, doctor_id) -> Doctor:
+    # populate_existing: lấy lại dữ liệu mới nhất sau khi commit
+    return await db.scalar(_doctor_query().where(Doctor.id == doctor_id)
+                           .execution_options(populate_existing=True))
+
 # ==========================================
 # PHẦN 1: QUẢN LÝ CHUYÊN NGÀNH (SPECIALTY)
 # ==========================================
 
 
 @router.post("/specialties", response_model=schemas.SpecialtyResponse, status_code=status.HTTP_201_CREATED)
-def create_specialty(
+async def create_specialty(
     specialty_in: schemas.SpecialtyCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin)  # Chỉ Admin
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)  # Chỉ Admin
 ):
-    if db.query(Specialty).filter(Specialty.name == specialty_in.name).first():
+    if await db.scalar(select(Specialty).where(Specialty.name == specialty_in.name)):
         raise HTTPException(
             status_code=400, detail="Chuyên ngành này đã tồn tại")
 
@@ -32,23 +61,38 @@ def create_specialty(
                               target_audience=specialty_in.target_audience,
                               keywords=specialty_in.keywords)
     db.add(new_specialty)
-    db.commit()
-    db.refresh(new_specialty)
+    await db.commit()
+    catalog.invalidate(catalog.SPECIALTIES)
     return new_specialty
 
 
 @router.get("/specialties", response_model=List[schemas.SpecialtyResponse])
-def get_all_specialties(db: Session = Depends(get_db)):
-    return db.query(Specialty).all()
+async def get_all_specialties(request: Request, db: AsyncSession = Depends(get_db)):
+    """Danh mục chuyên khoa, phục vụ từ cache kèm ETag (xem catalog.py)."""
+    async def load():
+        return (await db.scalars(select(Specialty).order_by(Specialty.name))).all()
+
+    entry = await catalog.get_entry(catalog.SPECIALTIES, load, List[schemas.SpecialtyResponse])
+    return catalog.respond(request, entry)
+
+
+@router.get("/specialties/search", response_model=List[schemas.SpecialtyResponse])
+async def search_specialties(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Tìm chuyên khoa theo tên, từ khóa, đối tượng; giống nhất xếp trước."""
+    return await search_engine.search(db, select(Specialty), SPECIALTY_SEARCH_COLUMNS, q, limit)
 
 # --- API QUẢN LÝ LEVEL ---
 
 
 @router.post("/levels", response_model=schemas.DoctorLevelResponse, status_code=status.HTTP_201_CREATED)
-def create_doctor_level(
+async def create_doctor_level(
     level_in: schemas.DoctorLevelCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
     level = DoctorLevel(
         name=level_in.name,
@@ -57,14 +101,19 @@ def create_doctor_level(
         description=level_in.description
     )
     db.add(level)
-    db.commit()
-    db.refresh(level)
+    await db.commit()
+    catalog.invalidate(catalog.LEVELS)
     return level
 
 
 @router.get("/levels", response_model=List[schemas.DoctorLevelResponse])
-def get_all_doctor_levels(db: Session = Depends(get_db)):
-    return db.query(DoctorLevel).all()
+async def get_all_doctor_levels(request: Request, db: AsyncSession = Depends(get_db)):
+    """Danh mục cấp bậc, phục vụ từ cache kèm ETag (xem catalog.py)."""
+    async def load():
+        return (await db.scalars(select(DoctorLevel).order_by(DoctorLevel.base_price, DoctorLevel.name))).all()
+
+    entry = await catalog.get_entry(catalog.LEVELS, load, List[schemas.DoctorLevelResponse])
+    return catalog.respond(request, entry)
 
 
 # ==========================================
@@ -72,27 +121,30 @@ def get_all_doctor_levels(db: Session = Depends(get_db)):
 # ==========================================
 
 
-@router.post("/register", response_model=schemas.DoctorResponse)
-def register_doctor_public(
+@router.post("/register", response_model=schemas.DoctorResponse,
+             dependencies=[Depends(rate_limit("register"))])
+async def register_doctor_public(
     doctor_in: schemas.DoctorRegisterPublic,  # Schema nhập full từ A-Z
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Dành cho bác sĩ tự đăng ký tài khoản mới.
     Mặc định: Giá = NULL, Level = NULL, Trạng thái = Chờ duyệt.
     """
     # 1. Check User tồn tại
-    if db.query(User).filter(User.email == doctor_in.email).first():
+    if await db.scalar(select(User).where(User.email == doctor_in.email)):
         raise HTTPException(status_code=400, detail="Email đã được sử dụng")
 
     # 2. Check Chuyên ngành
-    if not db.query(Specialty).filter(Specialty.id == doctor_in.specialty_id).first():
+    if not await db.get(Specialty, doctor_in.specialty_id):
         raise HTTPException(
             status_code=404, detail="Chuyên ngành không tồn tại")
 
+    # Hash trước khối try: pool hash đầy thì trả ngay 503 (Retry-After), không thành 500
+    hashed_password = await security.get_password_hash_async(doctor_in.password)
+
     try:
         # 3. Tạo User (Role Doctor, inactive)
-        hashed_password = security.get_password_hash(doctor_in.password)
         new_user = User(
             email=doctor_in.email,
             password=hashed_password,
@@ -102,7 +154,7 @@ def register_doctor_public(
             is_active=False
         )
         db.add(new_user)
-        db.flush()
+        await db.flush()
 
         # 4. Tạo Doctor Profile
         new_doctor = Doctor(
@@ -114,12 +166,11 @@ def register_doctor_public(
             is_active=False
         )
         db.add(new_doctor)
-        db.commit()
-        db.refresh(new_doctor)
-        return new_doctor
+        await db.commit()
+        return await _load_doctor(db, new_doctor.id)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Lỗi: {e}")
         raise HTTPException(status_code=500, detail="Lỗi hệ thống")
 
@@ -131,19 +182,19 @@ def register_doctor_public(
 
 
 @router.post("/promote", response_model=schemas.DoctorResponse)
-def promote_user_to_doctor(
+async def promote_user_to_doctor(
     doctor_in: schemas.DoctorCreateInternal,  # Schema chỉ cần user_id
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
     """
     Dành cho Admin: Biến một User cũ thành Bác sĩ.
     """
-    user = db.query(User).filter(User.id == doctor_in.user_id).first()
+    user = await db.get(User, doctor_in.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User không tồn tại")
 
-    if db.query(Doctor).filter(Doctor.user_id == doctor_in.user_id).first():
+    if await db.scalar(select(Doctor).where(Doctor.user_id == doctor_in.user_id)):
         raise HTTPException(
             status_code=400, detail="User này đã là bác sĩ rồi")
 
@@ -156,29 +207,31 @@ def promote_user_to_doctor(
         is_active=True  # Admin tạo thì cho active luôn
     )
 
+    # Đổi role -> thu hồi token cũ để mọi worker thấy quyền mới
+    if user.role != "doctor":
+        await revocation.revoke_user(db, user.id)
     user.role = "doctor"
     db.add(new_doctor)
-    db.commit()
-    db.refresh(new_doctor)
-    return new_doctor
+    await db.commit()
+    invalidate_principal(user.id)
+    return await _load_doctor(db, new_doctor.id)
 
 
 @router.put("/{doctor_id}/approve", response_model=schemas.DoctorResponse)
-def approve_doctor(
+async def approve_doctor(
     doctor_id: UUID,
     approve_data: schemas.DoctorApproveAdmin,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
 ):
     """
     Dành cho Admin: Duyệt hồ sơ, chốt giá và cấp bậc.
     """
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    doctor = await _load_doctor(db, doctor_id)
     if not doctor:
         raise HTTPException(status_code=404, detail="Không tìm thấy bác sĩ")
 
-    level_data = db.query(DoctorLevel).filter(
-        DoctorLevel.id == approve_data.level_id).first()
+    level_data = await db.get(DoctorLevel, approve_data.level_id)
     if not level_data:
         raise HTTPException(status_code=404, detail="Cấp bậc không tồn tại")
 
@@ -192,14 +245,36 @@ def approve_doctor(
     doctor.is_active = approve_data.is_active
     doctor.level_id = approve_data.level_id
 
-    # Mở khóa user
-    user = db.query(User).filter(User.id == doctor.user_id).first()
-    if user:
-        user.is_active = approve_data.is_active
-
-    db.commit()
-    db.refresh(doctor)
-    return doctor
+    # Mở khóa user (đã được load sẵn cùng doctor)
+    user_changed = doctor.user is not None and doctor.user.is_active != approve_data.is_active
+    if doctor.user:
+        doctor.user.is_active = approve_data.is_active
+    # Khóa / mở khóa bác sĩ -> thu hồi mọi token đã cấp, các worker khác bỏ
+    # user khỏi cache đăng nhập khi đồng bộ
+    if not approve_data.is_active or user_changed:
+        await revocation.revoke_user(db, doctor.user_id)
+
+    await db.commit()
+    invalidate_principal(doctor.user_id)
+    return await _load_doctor(db, doctor.id)
+
+
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_doctors(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    current_user: Principal = Depends(get_current_admin)
+):
+    """
+    Dành cho Admin: tạo hàng loạt bác sĩ (kèm tài khoản) từ nội dung file CSV
+    hoặc NDJSON gửi trong body (xem bulk_import.py). Không truyền format thì tự
+    nhận theo ký tự đầu tiên. Dòng lỗi được bỏ qua và liệt kê trong kết quả.
+    """
+    try:
+        return await bulk_import.import_stream(request.stream(), file_format)
+    except (UnicodeDecodeError, csv.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="File không đúng định dạng CSV / NDJSON (UTF-8)")
 
 # ==========================================
 # PHẦN 4: LẤY DANH SÁCH (PUBLIC)
@@ -207,18 +282,242 @@ def approve_doctor(
 
 
 @router.get("/", response_model=List[schemas.DoctorResponse])
-def get_doctors(
-    skip: int = 0,
-    limit: int = 10,
+async def get_doctors(
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     specialty_name: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    query = db.query(Doctor).filter(Doctor.is_active == True)
+    """
+    Danh sách bác sĩ, phân trang theo cursor (created_at, id).
+    Cursor của trang sau nằm trong header X-Next-Cursor.
+    """
+    query = _doctor_query().where(Doctor.is_active == True)
 
     if specialty_name:
-        query = query.join(Doctor.specialty_info).filter(
-            Specialty.name.ilike(f"%{specialty_name}%")
+        # Tìm gần đúng trên tên / từ khóa / đối tượng của chuyên khoa
+        specialties = await search_engine.search(
+            db, select(Specialty), SPECIALTY_SEARCH_COLUMNS,
+            specialty_name, SPECIALTY_MATCH_LIMIT)
+        if not specialties:
+            return []
+        query = query.where(Doctor.specialty_id.in_([s.id for s in specialties]))
+
+    sort_keys = (Doctor.created_at, Doctor.id)
+    rows = (await db.scalars(keyset_filter(query, sort_keys, cursor, limit))).all()
+    doctors, next_cursor = split_page(rows, sort_keys, limit)
+
+    # Serialize thẳng ra bytes (xem app/core/responses.py)
+    return responses.model_response(List[schemas.DoctorResponse], doctors,
+                                    headers=cursor_headers(next_cursor))
+
+
+# ==========================================
+# PHẦN 5: LỊCH TRỐNG CỦA BÁC SĨ (PUBLIC)
+# ==========================================
+
+
+def _availability_window(window_start: datetime, window_end: datetime):
+    window_start, window_end = to_utc_naive(window_start), to_utc_naive(window_end)
+    if window_end <= window_start:
+        raise HTTPException(
+            status_code=400, detail="Thời gian kết thúc phải sau thời gian bắt đầu")
+    if window_end - window_start > timedelta(days=availability.MAX_WINDOW_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chỉ xem được tối đa {availability.MAX_WINDOW_DAYS} ngày mỗi lần")
+    return window_start, window_end
+
+
+def _availability_response(free: dict) -> List[schemas.DoctorAvailability]:
+    return [
+        schemas.DoctorAvailability(
+            doctor_id=doctor_id,
+            slot_minutes=config.APPOINTMENT_DURATION_MINUTES,
+            slots=[schemas.TimeSlot(start_time=start, end_time=end)
+                   for start, end in doctor_slots],
         )
+        for doctor_id, doctor_slots in free.items()
+    ]
+
+
+@router.get("/availability", response_model=List[schemas.DoctorAvailability])
+async def get_doctors_availability(
+    doctor_ids: List[UUID] = Query(...),
+    window_start: datetime = Query(..., alias="from"),
+    window_end: datetime = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Ca trống của nhiều bác sĩ cùng lúc (?doctor_ids=..&doctor_ids=..&from=..&to=..).
+    Bác sĩ không tồn tại hoặc chưa hoạt động sẽ không có trong kết quả.
+    """
+    window_start, window_end = _availability_window(window_start, window_end)
+    if len(doctor_ids) > availability.MAX_DOCTORS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {availability.MAX_DOCTORS_PER_REQUEST} bác sĩ mỗi lần")
+
+    active_ids = (await db.scalars(
+        select(Doctor.id).where(Doctor.id.in_(set(doctor_ids)),
+                                Doctor.is_active == True))).all()
+    if not active_ids:
+        return []
+
+    free = await availability.get_free_slots(db, active_ids, window_start, window_end)
+    return _availability_response(free)
+
 
-    doctors = query.offset(skip).limit(limit).all()
-    return doctors
+@router.get("/{doctor_id}/availability", response_model=schemas.DoctorAvailability)
+async def get_doctor_availability(
+    doctor_id: UUID,
+    window_start: datetime = Query(..., alias="from"),
+    window_end: datetime = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Các ca trống (mỗi ca APPOINTMENT_DURATION_MINUTES phút) của bác sĩ
+    trong khoảng [from, to), để bệnh nhân chọn ca và đặt lịch ngay lần đầu.
+    """
+    window_start, window_end = _availability_window(window_start, window_end)
+
+    doctor = await db.get(Doctor, doctor_id)
+    if not doctor or not doctor.is_active:
+        raise HTTPException(
+            status_code=404, detail="Bác sĩ không tồn tại hoặc đang tạm nghỉ")
+
+    free = await availability.get_free_slots(db, [doctor.id], window_start, window_end)
+    return _availability_response(free)[0]
+
+
+# ==========================================
+# PHẦN 6: LỊCH LÀM VIỆC
+# ==========================================
+# Giờ theo giờ địa phương của phòng khám (SCHEDULE_UTC_OFFSET_MINUTES). Sửa lịch
+# làm việc cập nhật luôn bitmap ca (xem appointments/slots.py); các lịch hẹn
+# đã đặt không bị ảnh hưởng.
+
+
+async def _check_schedule_owner(db: AsyncSession, doctor_id: UUID, current_user: Principal):
+    # Bác sĩ tự sửa lịch của mình, hoặc admin
+    doctor = await db.get(Doctor, doctor_id)
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Không tìm thấy bác sĩ")
+    if current_user.role != "admin" and doctor.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Bạn không có quyền sửa lịch làm việc của bác sĩ này")
+
+
+async def _schedule_response(db: AsyncSession, doctor_id: UUID) -> schemas.DoctorScheduleResponse:
+    shifts = (await db.scalars(
+        select(DoctorSchedule).where(DoctorSchedule.doctor_id == doctor_id)
+        .order_by(DoctorSchedule.weekday, DoctorSchedule.start_time))).all()
+    # Ngoại lệ sắp tới của bác sĩ + ngày nghỉ của cả phòng khám
+    exceptions = (await db.scalars(
+        select(ScheduleException)
+        .where(or_(ScheduleException.doctor_id == doctor_id,
+                   ScheduleException.doctor_id.is_(None)),
+               ScheduleException.day >= slots.local_day(utcnow_naive()))
+        .order_by(ScheduleException.day, ScheduleException.start_time))).all()
+    return schemas.DoctorScheduleResponse(
+        doctor_id=doctor_id,
+        slot_minutes=config.APPOINTMENT_DURATION_MINUTES,
+        utc_offset_minutes=config.SCHEDULE_UTC_OFFSET_MINUTES,
+        shifts=[schemas.WeeklyShift.model_validate(shift) for shift in shifts],
+        exceptions=[schemas.ScheduleExceptionResponse.model_validate(item)
+                    for item in exceptions],
+    )
+
+
+@router.get("/{doctor_id}/schedule", response_model=schemas.DoctorScheduleResponse)
+async def get_doctor_schedule(
+    doctor_id: UUID,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Lịch làm việc hằng tuần và các ngày nghỉ / làm thêm sắp tới của bác sĩ.
+    Chưa có ca nào trong tuần: bác sĩ nhận lịch cả ngày.
+    """
+    if not await db.get(Doctor, doctor_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy bác sĩ")
+    return await _schedule_response(db, doctor_id)
+
+
+@router.put("/{doctor_id}/schedule", response_model=schemas.DoctorScheduleResponse)
+async def update_doctor_schedule(
+    doctor_id: UUID,
+    schedule_in: schemas.ScheduleUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Thay toàn bộ lịch làm việc hằng tuần của bác sĩ."""
+    await _check_schedule_owner(db, doctor_id, current_user)
+
+    await db.execute(delete(DoctorSchedule).where(DoctorSchedule.doctor_id == doctor_id))
+    db.add_all([DoctorSchedule(doctor_id=doctor_id, **shift.model_dump())
+                for shift in schedule_in.shifts])
+    await slots.refresh_working(db, [doctor_id], slots.local_day(utcnow_naive()))
+    await db.commit()
+    return await _schedule_response(db, doctor_id)
+
+
+@router.post("/{doctor_id}/schedule/exceptions",
+             response_model=schemas.ScheduleExceptionResponse,
+             status_code=status.HTTP_201_CREATED)
+async def add_schedule_exception(
+    doctor_id: UUID,
+    exception_in: schemas.ScheduleExceptionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Thêm ngày / giờ nghỉ (is_working = false) hoặc giờ làm thêm (true) của bác sĩ."""
+    await _check_schedule_owner(db, doctor_id, current_user)
+
+    schedule_exception = ScheduleException(doctor_id=doctor_id, **exception_in.model_dump())
+    db.add(schedule_exception)
+    await slots.refresh_working(db, [doctor_id], exception_in.day, exception_in.day)
+    await db.commit()
+    return schedule_exception
+
+
+@router.post("/holidays", response_model=schemas.ScheduleExceptionResponse,
+             status_code=status.HTTP_201_CREATED)
+async def add_holiday(
+    holiday_in: schemas.HolidayCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin)
+):
+    """
+    Dành cho Admin: ngày nghỉ của cả phòng khám (lễ, tết). Bác sĩ có giờ làm
+    thêm riêng trong ngày đó vẫn nhận lịch trong giờ làm thêm.
+    """
+    holiday = ScheduleException(doctor_id=None, day=holiday_in.day,
+                                note=holiday_in.note, is_working=False)
+    db.add(holiday)
+    await slots.refresh_working(db, None, holiday_in.day, holiday_in.day)
+    await db.commit()
+    return holiday
+
+
+@router.delete("/schedule/exceptions/{exception_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_schedule_exception(
+    exception_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Xóa ngày nghỉ / giờ làm thêm (ngày nghỉ của cả phòng khám: chỉ admin)."""
+    schedule_exception = await db.get(ScheduleException, exception_id)
+    if not schedule_exception:
+        raise HTTPException(status_code=404, detail="Không tìm thấy ngày nghỉ / giờ làm thêm")
+
+    doctor_id, day = schedule_exception.doctor_id, schedule_exception.day
+    if doctor_id is None:
+        if current_user.role != "admin":
+            raise HTTPException(
+                status_code=403, detail="Chỉ admin được sửa ngày nghỉ của phòng khám")
+    else:
+        await _check_schedule_owner(db, doctor_id, current_user)
+
+    await db.delete(schedule_exception)
+    await slots.refresh_working(db, [doctor_id] if doctor_id else None, day, day)
+    await db.commit()
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from uuid import UUID
-from typing import Optional
-from app.modules.auth.schemas import UserResponse
+from datetime import date, datetime, time
+from typing import List, Optional
+from app.modules.auth.schemas import UserRegister, UserResponse
 
 # --- 1. SPECIALTY SCHEMAS ---
 
@@ -33,7 +34,7 @@ class DoctorCreateInternal(BaseModel):
     user_id: UUID
     specialty_id: UUID
     price_per_visit: Optional[float] = None
-    level_id: Optional[str] = None
+    level_id: Optional[UUID] = None
     description: Optional[str] = Field(None, max_length=500)
 
 # Dành cho Bác sĩ tự đăng ký (Public)
@@ -57,6 +58,31 @@ class DoctorApproveAdmin(BaseModel):
     is_active: bool = True
 
 
+# Dành cho Admin import hàng loạt (CSV / NDJSON, xem bulk_import.py):
+# thông tin tài khoản (kiểm tra giống đăng ký) + hồ sơ bác sĩ
+
+
+class DoctorImportRow(UserRegister):
+    specialty: str = Field(..., max_length=100)  # ID hoặc tên chuyên khoa
+    level: Optional[str] = Field(None, max_length=50)  # ID, mã hoặc tên cấp bậc
+    price_per_visit: Optional[float] = Field(None, ge=0)  # Bỏ trống: lấy giá của cấp bậc
+    description: Optional[str] = Field(None, max_length=500)
+    is_active: bool = True
+
+
+class ImportRowError(BaseModel):
+    line: int  # Số dòng trong file (dòng tiêu đề CSV là dòng 1)
+    email: Optional[str] = None
+    error: str
+
+
+class ImportReport(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]  # Tối đa IMPORT_MAX_ERRORS dòng
+
+
 # --- LEVEL SCHEMA ---
 class DoctorLevelCreate(BaseModel):
     name: str
@@ -93,3 +119,79 @@ class DoctorResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# --- 4. LỊCH TRỐNG (AVAILABILITY) ---
+
+
+class TimeSlot(BaseModel):
+    start_time: datetime
+    end_time: datetime
+
+
+class DoctorAvailability(BaseModel):
+    doctor_id: UUID
+    slot_minutes: int
+    slots: List[TimeSlot]
+
+
+# --- 5. LỊCH LÀM VIỆC (giờ địa phương của phòng khám) ---
+
+
+class WeeklyShift(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = thứ 2 ... 6 = chủ nhật
+    start_time: time
+    end_time: time
+
+    @model_validator(mode="after")
+    def check_hours(self):
+        if self.end_time <= self.start_time:
+            raise ValueError("Giờ kết thúc phải sau giờ bắt đầu")
+        return self
+
+    class Config:
+        from_attributes = True
+
+
+class ScheduleUpdate(BaseModel):
+    # Thay toàn bộ lịch hằng tuần; danh sách rỗng = nhận lịch cả ngày như trước
+    shifts: List[WeeklyShift] = Field(..., max_length=100)
+
+
+class ScheduleExceptionCreate(BaseModel):
+    day: date
+    # Bỏ trống cả 2: cả ngày
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    is_working: bool = False  # False: nghỉ, True: làm thêm giờ
+    note: Optional[str] = Field(None, max_length=255)
+
+    @model_validator(mode="after")
+    def check_hours(self):
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValueError("Cần nhập cả giờ bắt đầu và giờ kết thúc (hoặc bỏ trống cả 2)")
+        if self.start_time is not None and self.end_time <= self.start_time:
+            raise ValueError("Giờ kết thúc phải sau giờ bắt đầu")
+        return self
+
+
+class HolidayCreate(BaseModel):
+    # Ngày nghỉ của cả phòng khám
+    day: date
+    note: Optional[str] = Field(None, max_length=255)
+
+
+class ScheduleExceptionResponse(ScheduleExceptionCreate):
+    id: UUID
+    doctor_id: Optional[UUID]  # None: ngày nghỉ của cả phòng khám
+
+    class Config:
+        from_attributes = True
+
+
+class DoctorScheduleResponse(BaseModel):
+    doctor_id: UUID
+    slot_minutes: int
+    utc_offset_minutes: int  # Giờ trong lịch là giờ UTC + chừng này phút
+    shifts: List[WeeklyShift]
+    exceptions: List[ScheduleExceptionResponse]  # Từ hôm nay trở đi
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, Query, status
+
+from app.core.database import async_engine, engine, pool_status, read_engine
+from app.core.ratelimit import limiter
+from app.core.slow_queries import slow_query_log
+
+from app.modules.auth.dependencies import get_current_admin, principal_cache
+from app.modules.auth.revocation import revocation_list
+from app.modules.doctors.catalog import catalog_cache
+
+# API nội bộ để theo dõi hệ thống (chỉ Admin)
+router = APIRouter(dependencies=[Depends(get_current_admin)])
+
+
+@router.get("/cache/principal")
+async def get_principal_cache_stats():
+    """Số liệu cache user đăng nhập: kích thước, hit / miss, số lần invalidate."""
+    return principal_cache.stats()
+
+
+@router.get("/cache/catalog")
+async def get_catalog_cache_stats():
+    """Số liệu cache danh mục chuyên khoa / cấp bậc."""
+    return catalog_cache.stats()
+
+
+@router.get("/revoked-tokens")
+async def get_revoked_token_stats():
+    """Số token / user đang bị thu hồi trong bộ nhớ worker này, lần đồng bộ gần nhất."""
+    return revocation_list.stats()
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats():
+    """
+    Pool kết nối DB của worker này: đang dùng / rảnh / overflow, thời gian chờ
+    lấy kết nối, số lần timeout. Dùng để chỉnh DB_POOL_SIZE theo số worker.
+    """
+    pools = {"async": pool_status(async_engine), "sync": pool_status(engine)}
+    if read_engine is not async_engine:
+        pools["read"] = pool_status(read_engine)
+    return pools
+
+
+@router.get("/rate-limit")
+async def get_rate_limit_stats():
+    """Số request được phép / bị chặn theo từng policy, số key đang giữ (worker này)."""
+    return limiter.stats()
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """
+    Câu SQL chậm gần đây của worker này (vượt SLOW_QUERY_MS): gom theo
+    fingerprint (tổng thời gian giảm dần) và danh sách mới nhất kèm plan nếu có.
+    """
+    return slow_query_log.snapshot(limit)
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries():
+    """Xóa buffer (vd sau khi đã sửa xong 1 câu chậm, để đo lại)."""
+    slow_query_log.clear()
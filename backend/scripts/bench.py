@@ -0,0 +1,262 @@
+"""
+Benchmark tải có thể lặp lại cho các API chính, chạy trên dữ liệu của
+scripts/seed.py. Mỗi kịch bản chạy lần lượt với số request và độ song song
+cố định, báo p50 / p95 / p99, throughput và số query SQL trung bình mỗi request.
+
+Mặc định chạy app ngay trong process (không cần server, đếm được query):
+
+    python scripts/seed.py --reset --appointments 200000
+    python scripts/bench.py --requests 500 --concurrency 20 --json result.json
+
+So với lần chạy trước (trả mã lỗi 1 nếu p95 chậm hơn quá --max-regression,
+hoặc số query mỗi request tăng):
+
+    python scripts/bench.py --baseline result.json --max-regression 0.2
+
+Với server thật (uvicorn / gunicorn) thì thêm --base-url http://localhost:8000;
+khi đó không đếm được query.
+Lưu ý: kịch bản "book" tạo lịch hẹn thật trong DB (ở xa trong tương lai);
+"login" bị 503 khi độ song song vượt HASH_MAX_PENDING (pool hash đang quá tải)
+và bị 429 do giới hạn tần suất theo IP: đo tải thì chạy với RATE_LIMIT_ENABLED=false.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from seed import ADMIN_EMAIL, SEED_DOMAIN  # noqa: E402
+
+SCENARIOS = ["login", "list_doctors", "book", "my_appointments", "revenue"]
+
+
+class QueryCounter:
+    """Đếm số câu SQL gửi xuống DB (chỉ khi chạy app trong process)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args, counter=None):
+        self.client = client
+        self.args = args
+        self.counter = counter
+        self.rng = random.Random(args.seed)
+        self.tokens = []
+        self.admin_headers = {}
+        self.doctor_ids = []
+
+    async def _login(self, email):
+        r = await self.client.post("/auth/login", json={
+            "email": email, "password": self.args.password})
+        r.raise_for_status()
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    async def setup(self):
+        """Đăng nhập sẵn 1 nhóm bệnh nhân + admin, lấy danh sách bác sĩ."""
+        self.admin_headers = await self._login(ADMIN_EMAIL)
+        # Đăng nhập lần lượt: gửi dồn sẽ bị pool hash mật khẩu từ chối (503)
+        for i in range(self.args.patients):
+            self.tokens.append(await self._login(f"patient{i}@{SEED_DOMAIN}"))
+
+        cursor = None
+        while len(self.doctor_ids) < 500:
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            r = await self.client.get("/doctors/", params=params)
+            r.raise_for_status()
+            self.doctor_ids += [d["id"] for d in r.json()]
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        if not self.doctor_ids:
+            sys.exit("Không có bác sĩ nào, chạy scripts/seed.py trước")
+
+    # ---------- Các kịch bản: mỗi hàm gửi 1 request ----------
+
+    async def login(self):
+        i = self.rng.randrange(self.args.patients)
+        return await self.client.post("/auth/login", json={
+            "email": f"patient{i}@{SEED_DOMAIN}", "password": self.args.password})
+
+    async def list_doctors(self):
+        return await self.client.get("/doctors/", params={"limit": 20})
+
+    async def book(self):
+        # Khung giờ ngẫu nhiên cách xa dữ liệu seed: phần lớn trống (201),
+        # thỉnh thoảng trùng (409) - cả 2 đều là kết quả hợp lệ
+        start = self.book_from + timedelta(days=self.rng.randrange(365),
+                                           hours=self.rng.randrange(7, 19))
+        return await self.client.post("/appointments/", headers=self.rng.choice(self.tokens), json={
+            "doctor_id": self.rng.choice(self.doctor_ids),
+            "start_time": start.isoformat() + "Z",
+            "reason": "benchmark"})
+
+    async def my_appointments(self):
+        return await self.client.get("/appointments/my-appointments",
+                                     headers=self.rng.choice(self.tokens))
+
+    async def revenue(self):
+        end = self.today - timedelta(days=self.rng.randrange(30))
+        return await self.client.get("/appointments/stats/revenue", headers=self.admin_headers,
+                                     params={"start_date": (end - timedelta(days=90)).isoformat(),
+                                             "end_date": end.isoformat()})
+
+    # ---------- Chạy ----------
+
+    async def run_scenario(self, name, requests):
+        send = getattr(self, name)
+        queue = iter(range(requests))
+        latencies, statuses = [], Counter()
+
+        async def worker():
+            for _ in queue:
+                started = time.perf_counter()
+                r = await send()
+                latencies.append(time.perf_counter() - started)
+                statuses[r.status_code] += 1
+
+        queries_before = self.counter.count if self.counter else 0
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        result = {
+            "requests": requests,
+            "statuses": {str(code): n for code, n in sorted(statuses.items())},
+            "throughput_rps": round(requests / elapsed, 1),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        }
+        if self.counter:
+            result["queries_per_request"] = round(
+                (self.counter.count - queries_before) / requests, 2)
+        return result
+
+    async def run(self):
+        from app.core.timeutils import utcnow_naive
+        self.today = utcnow_naive().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.book_from = self.today + timedelta(days=3 * 365)
+
+        await self.setup()
+        results = {}
+        for name in self.args.scenarios:
+            if self.args.warmup:
+                await self.run_scenario(name, self.args.warmup)
+            results[name] = await self.run_scenario(name, self.args.requests)
+            _print_row(name, results[name])
+        return results
+
+
+def _print_header():
+    print(f"{'scenario':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'req/s':>9}"
+          f"{'q/req':>7}  status")
+
+
+def _print_row(name, r):
+    queries = r.get("queries_per_request")
+    print(f"{name:<16}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+          f"{r['max_ms']:>9.1f}{r['throughput_rps']:>9.1f}"
+          f"{queries if queries is not None else '-':>7}  {r['statuses']}")
+
+
+def compare(results, baseline, max_regression) -> list:
+    """Danh sách các chỉ số tệ hơn baseline quá ngưỡng cho phép."""
+    problems = []
+    for name, r in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        limit = base["p95_ms"] * (1 + max_regression)
+        if r["p95_ms"] > limit:
+            problems.append(f"{name}: p95 {r['p95_ms']}ms > {limit:.1f}ms "
+                            f"(baseline {base['p95_ms']}ms)")
+        if r.get("queries_per_request", 0) > base.get("queries_per_request", float("inf")):
+            problems.append(f"{name}: {r['queries_per_request']} query/request "
+                            f"> baseline {base['queries_per_request']}")
+    return problems
+
+
+async def main_async(args):
+    _print_header()
+    timeout = httpx.Timeout(120)
+    if args.base_url:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits,
+                                     timeout=timeout) as client:
+            return await Bench(client, args).run()
+
+    from sqlalchemy import event
+    from app.core import database, security
+    from app.main import app
+
+    counter = QueryCounter()
+    engines = {database.async_engine.sync_engine, database.read_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", counter)
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                         timeout=timeout) as client:
+                return await Bench(client, args, counter).run()
+    finally:
+        security.shutdown_hash_executor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", help="bench server đang chạy thay vì app trong process")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=500, help="số request mỗi kịch bản")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20, help="số request khởi động (không tính)")
+    parser.add_argument("--patients", type=int, default=20,
+                        help="số bệnh nhân seed đăng nhập sẵn để gọi API")
+    parser.add_argument("--password", default="seed-password")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", help="file JSON của lần chạy trước để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="p95 được phép chậm hơn baseline bao nhiêu (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    report = {"config": {k: getattr(args, k) for k in ("base_url", "requests", "concurrency")},
+              "scenarios": results}
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.baseline:
+        problems = compare(results, json.loads(Path(args.baseline).read_text()),
+                           args.max_regression)
+        for problem in problems:
+            print("REGRESSION:", problem)
+        if problems:
+            sys.exit(1)
+        print("PASS: không chậm hơn baseline")
+
+
+if __name__ == "__main__":
+    main()
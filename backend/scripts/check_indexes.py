@@ -0,0 +1,190 @@
+"""
+Kiểm tra các API lịch hẹn dùng index: gọi API trong process trên dữ liệu của
+scripts/seed.py, ghi lại câu SQL thật mà mỗi API gửi xuống DB, chạy EXPLAIN
+và báo lỗi nếu bảng appointments / doctor_daily_stats / doctor_day_slots bị
+quét toàn bộ.
+
+- PostgreSQL: EXPLAIN (FORMAT JSON) với enable_seqscan = off để kết quả không
+  phụ thuộc kích thước dữ liệu (nếu không có index dùng được, planner vẫn phải
+  chọn Seq Scan). Index Scan không có Index Cond (quét cả index) cũng tính là lỗi.
+- SQLite: EXPLAIN QUERY PLAN, mọi lần đọc bảng phải là "SEARCH ... USING INDEX".
+
+    python scripts/seed.py --reset --appointments 50000
+    python scripts/check_indexes.py
+"""
+import asyncio
+import json
+import re
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import event, select  # noqa: E402
+
+from app.core import database, security  # noqa: E402
+from app.core.timeutils import utcnow_naive  # noqa: E402
+from app.main import app  # noqa: E402
+from app.modules.appointments.models import NOT_CANCELLED, Appointment  # noqa: E402
+from app.modules.auth.models import User  # noqa: E402
+from app.modules.doctors.models import Doctor  # noqa: E402
+from seed import ADMIN_EMAIL, SEED_DOMAIN  # noqa: E402
+
+CHECKED_TABLES = re.compile(r"\b(appointments|doctor_daily_stats|doctor_day_slots)\b")
+
+
+class Recorder:
+    """Ghi lại câu SQL (kèm tham số) đụng tới các bảng cần kiểm tra."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if (statement.lstrip().upper().startswith("SELECT")
+                and CHECKED_TABLES.search(statement)):
+            self.statements.append((statement, parameters))
+
+
+def _pg_problems(plan) -> list:
+    problems = []
+
+    def walk(node):
+        relation = node.get("Relation Name", "")
+        if CHECKED_TABLES.match(relation):
+            kind = node["Node Type"]
+            if kind == "Seq Scan" or (
+                    kind in ("Index Scan", "Index Only Scan") and "Index Cond" not in node):
+                problems.append(f"{kind} on {relation}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return problems
+
+
+def _sqlite_problems(rows) -> list:
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        if CHECKED_TABLES.search(detail) and not detail.startswith("SEARCH"):
+            problems.append(detail)
+    return problems
+
+
+async def explain(conn, statement, parameters):
+    if conn.dialect.name == "postgresql":
+        result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        plan = result.scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return _pg_problems(plan), json.dumps(plan[0]["Plan"], indent=1)
+    rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+    return _sqlite_problems(rows), "\n".join(row[-1] for row in rows)
+
+
+def _seed_ids():
+    with database.SessionLocal() as db:
+        row = db.execute(
+            select(Doctor.id, User.email).join(User, Doctor.user_id == User.id)
+            .where(User.email == f"doctor0@{SEED_DOMAIN}")).one_or_none()
+    if row is None:
+        sys.exit("Không có dữ liệu seed, chạy scripts/seed.py trước")
+    return row
+
+
+async def run(password: str) -> int:
+    doctor_id, doctor_email = _seed_ids()
+    now = utcnow_naive().replace(minute=0, second=0, microsecond=0)
+    window = {"from": (now + timedelta(days=1)).isoformat(),
+              "to": (now + timedelta(days=8)).isoformat()}
+
+    recorder = Recorder()
+    for engine in {database.async_engine, database.read_engine}:
+        event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+
+    async def login(client, email):
+        r = await client.post("/auth/login", json={"email": email, "password": password})
+        r.raise_for_status()
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    scenarios = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            patient = await login(client, f"patient0@{SEED_DOMAIN}")
+            doctor = await login(client, doctor_email)
+            admin = await login(client, ADMIN_EMAIL)
+
+            async def call(name, method, url, **kwargs):
+                recorder.statements.clear()
+                r = await client.request(method, url, **kwargs)
+                r.raise_for_status()
+                scenarios[name] = list(recorder.statements)
+                return r
+
+            r = await call("my-appointments (bệnh nhân)", "GET",
+                           "/appointments/my-appointments", headers=patient)
+            if r.headers.get("X-Next-Cursor"):
+                await call("my-appointments trang 2 (bệnh nhân)", "GET",
+                           "/appointments/my-appointments", headers=patient,
+                           params={"cursor": r.headers["X-Next-Cursor"]})
+            await call("my-appointments (bác sĩ)", "GET",
+                       "/appointments/my-appointments", headers=doctor)
+            await call("availability", "GET", f"/doctors/{doctor_id}/availability",
+                       params=window)
+            await call("availability nhiều bác sĩ", "GET", "/doctors/availability",
+                       params={"doctor_ids": [str(doctor_id)], **window})
+            await call("stats/revenue", "GET", "/appointments/stats/revenue", headers=admin,
+                       params={"start_date": (now - timedelta(days=30)).isoformat(),
+                               "end_date": now.isoformat()})
+            await call("stats/my-income", "GET", "/appointments/stats/my-income",
+                       headers=doctor)
+
+    # Câu kiểm tra trùng lịch khi đặt (trigger của SQLite / trigger ranh giới
+    # tháng của PostgreSQL) chạy trong DB, không đi qua cursor của app nên
+    # chạy lại câu tương đương để lấy SQL
+    start = now + timedelta(days=2)
+    overlap = (select(Appointment.id)
+               .where(Appointment.doctor_id == doctor_id, NOT_CANCELLED,
+                      Appointment.start_time < start + timedelta(hours=1),
+                      Appointment.end_time > start,
+                      Appointment.start_time > start - timedelta(days=1))
+               .limit(1))
+
+    failed = 0
+    async with database.async_engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+        recorder.statements.clear()
+        await conn.execute(overlap)
+        scenarios["kiểm tra trùng lịch (đặt lịch)"] = list(recorder.statements)
+
+        for name, statements in scenarios.items():
+            if not statements:
+                print(f"?    {name}: không có câu SQL nào đụng tới bảng cần kiểm tra")
+                continue
+            for statement, parameters in statements:
+                problems, plan = await explain(conn, statement, parameters)
+                if problems:
+                    failed += 1
+                    print(f"FAIL {name}: {', '.join(problems)}")
+                    print("     " + " ".join(statement.split())[:300])
+                    print("     " + plan.replace("\n", "\n     "))
+                else:
+                    print(f"OK   {name}: {plan.splitlines()[0] if plan else ''}")
+    security.shutdown_hash_executor()
+    return failed
+
+
+def main():
+    password = sys.argv[1] if len(sys.argv) > 1 else "seed-password"
+    failed = asyncio.run(run(password))
+    print("PASS: mọi truy vấn đều dùng index" if not failed
+          else f"FAIL: {failed} truy vấn quét toàn bảng")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
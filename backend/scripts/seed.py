@@ -0,0 +1,294 @@
+"""
+Sinh dữ liệu giả để đo hiệu năng: bệnh nhân, chuyên khoa, cấp bậc, bác sĩ và
+rất nhiều lịch hẹn với phân bố gần giống thực tế:
+- vài bác sĩ "hot" nhận phần lớn lịch (phân bố Zipf, --skew),
+- lịch dồn vào giờ cao điểm (8h-11h, 14h-17h), Chủ nhật vắng,
+- lịch đã qua phần lớn completed, lịch sắp tới pending / confirmed.
+
+Cùng --seed thì sinh ra cùng dữ liệu. Mọi user dùng chung mật khẩu --password
+(hash 1 lần). Chạy với DB rỗng (hoặc --reset để xóa dữ liệu cũ):
+
+    python scripts/seed.py --patients 20000 --doctors 500 --appointments 1000000
+"""
+import argparse
+import heapq
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, func, select  # noqa: E402
+
+from app import migrations  # noqa: E402
+from app.core import config, security  # noqa: E402
+from app.core.database import SessionLocal, engine  # noqa: E402
+from app.core.timeutils import utcnow_naive  # noqa: E402
+from app.modules.appointments import partitions, stats  # noqa: E402
+from app.modules.appointments.models import (  # noqa: E402
+    OVERLAP_CONSTRAINT, SQLITE_OVERLAP_TRIGGERS, Appointment, AppointmentArchive,
+    DoctorDailyStats, DoctorDaySlots)
+from app.modules.auth.models import User  # noqa: E402
+from app.modules.doctors.models import (  # noqa: E402
+    Doctor, DoctorLevel, DoctorSchedule, ScheduleException, Specialty)
+
+SEED_DOMAIN = "seed.example.com"
+ADMIN_EMAIL = f"admin@{SEED_DOMAIN}"
+
+SPECIALTIES = [
+    ("Tim mạch", "tim, huyết áp, mạch vành", "Người lớn"),
+    ("Nhi khoa", "trẻ em, sốt, tiêm chủng", "Trẻ em"),
+    ("Da liễu", "mụn, dị ứng, nấm da", "Mọi lứa tuổi"),
+    ("Răng hàm mặt", "răng, nha chu, chỉnh nha", "Mọi lứa tuổi"),
+    ("Tai mũi họng", "viêm họng, xoang, viêm tai", "Mọi lứa tuổi"),
+    ("Nhãn khoa", "mắt, cận thị, đục thủy tinh thể", "Mọi lứa tuổi"),
+    ("Sản phụ khoa", "thai sản, phụ khoa", "Phụ nữ"),
+    ("Cơ xương khớp", "đau lưng, thoái hóa, gút", "Người lớn tuổi"),
+    ("Tiêu hóa", "dạ dày, đại tràng, gan", "Người lớn"),
+    ("Thần kinh", "đau đầu, mất ngủ, đột quỵ", "Người lớn"),
+    ("Nội tiết", "tiểu đường, tuyến giáp", "Người lớn"),
+    ("Tâm lý", "trầm cảm, lo âu, stress", "Mọi lứa tuổi"),
+]
+
+LEVELS = [
+    ("Bác sĩ", "BS", 150000),
+    ("Thạc sĩ", "THS", 250000),
+    ("Bác sĩ CKII", "CKII", 350000),
+    ("Tiến sĩ", "TS", 450000),
+    ("Phó giáo sư", "PGS", 600000),
+]
+
+REASONS = ["Khám định kỳ", "Đau đầu kéo dài", "Sốt cao", "Tái khám",
+           "Đau bụng", "Mất ngủ", "Kiểm tra sức khỏe", "Ho nhiều ngày"]
+
+# Giờ làm việc (UTC) và trọng số giờ cao điểm
+WORK_HOURS = range(7, 19)
+PEAK_WEIGHT = {8: 3.0, 9: 3.0, 10: 2.5, 14: 2.5, 15: 2.5, 16: 2.0}
+SUNDAY_WEIGHT = 0.3
+# Bác sĩ hot nhất cũng chỉ kín tối đa chừng này phần trăm số ca
+MAX_FILL = 0.85
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, table, rows, batch_size) -> int:
+    total = 0
+    for batch in _batches(rows, batch_size):
+        conn.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def _spread_created_at(rng, count, days):
+    # created_at rải trong quá khứ để phân trang theo (created_at, id) có ý nghĩa
+    now = datetime.now(timezone.utc)
+    return sorted(now - timedelta(seconds=rng.uniform(0, days * 86400)) for _ in range(count))
+
+
+def _allocate(total, weights, capacity):
+    """Chia total lịch theo trọng số, không bác sĩ nào vượt capacity."""
+    counts = [0] * len(weights)
+    remaining, open_ids = total, set(range(len(weights)))
+    while remaining > 0 and open_ids:
+        weight_sum = sum(weights[i] for i in open_ids)
+        given = 0
+        for i in list(open_ids):
+            share = max(1, round(remaining * weights[i] / weight_sum))
+            share = min(share, capacity - counts[i], remaining - given)
+            counts[i] += share
+            given += share
+            if counts[i] >= capacity:
+                open_ids.discard(i)
+            if given >= remaining:
+                break
+        remaining -= given
+        if given == 0:
+            break
+    return counts
+
+
+def _appointment_rows(rng, doctors, patient_ids, total, days_back, days_ahead, skew):
+    today = utcnow_naive().replace(hour=0, minute=0, second=0, microsecond=0)
+    now = utcnow_naive()
+    duration = timedelta(minutes=config.APPOINTMENT_DURATION_MINUTES)
+
+    # Lưới ca (ngày, giờ) kèm trọng số cao điểm
+    slots, slot_weights = [], []
+    for day in range(-days_back, days_ahead):
+        date = today + timedelta(days=day)
+        day_weight = SUNDAY_WEIGHT if date.weekday() == 6 else 1.0
+        for hour in WORK_HOURS:
+            slots.append(date + timedelta(hours=hour))
+            slot_weights.append(day_weight * PEAK_WEIGHT.get(hour, 1.0))
+
+    # Độ "hot" của bác sĩ theo Zipf, xáo để bác sĩ hot nằm rải rác
+    popularity = [1 / (rank + 1) ** skew for rank in range(len(doctors))]
+    rng.shuffle(popularity)
+    counts = _allocate(total, popularity, int(len(slots) * MAX_FILL))
+
+    for (doctor_id, price), count in zip(doctors, counts):
+        if not count:
+            continue
+        # Chọn count ca không lặp, ưu tiên giờ cao điểm (weighted sampling)
+        chosen = heapq.nlargest(count, range(len(slots)),
+                                key=lambda i: rng.random() ** (1 / slot_weights[i]))
+        for i in chosen:
+            start = slots[i]
+            past = start < now
+            roll = rng.random()
+            if past:
+                status = "completed" if roll < 0.8 else "cancelled" if roll < 0.95 else "confirmed"
+            else:
+                status = "pending" if roll < 0.6 else "confirmed" if roll < 0.9 else "cancelled"
+
+            payment_status, refund = "unpaid", 0.0
+            if status == "completed" and rng.random() < 0.9:
+                payment_status = "paid"
+            elif status == "cancelled" and rng.random() < 0.3:
+                payment_status, refund = "refunded", price
+
+            yield {
+                "id": uuid.uuid4(),
+                "patient_id": rng.choice(patient_ids),
+                "doctor_id": doctor_id,
+                "start_time": start,
+                "end_time": start + duration,
+                "status": status,
+                "reason": rng.choice(REASONS),
+                "paid_price": price,
+                "paid_method": "cash",
+                "payment_status": payment_status,
+                "refund_amount": refund,
+            }
+
+
+def reset(conn):
+    for model in (DoctorDailyStats, DoctorDaySlots, AppointmentArchive, Appointment,
+                  DoctorSchedule, ScheduleException, Doctor, DoctorLevel, Specialty, User):
+        conn.execute(delete(model))
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    password_hash = security.get_password_hash(args.password)
+    started = time.perf_counter()
+
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        if args.reset:
+            reset(conn)
+        elif conn.scalar(select(func.count()).select_from(User)):
+            sys.exit("DB đã có dữ liệu, dùng --reset để xóa trước khi sinh dữ liệu")
+
+        # PostgreSQL: tạo sẵn partition cho cả khoảng thời gian sinh lịch
+        partitions.ensure_partitions(
+            conn, since=partitions.month_start(utcnow_naive() - timedelta(days=args.days_back)),
+            months_ahead=max(config.PARTITION_MONTHS_AHEAD, args.days_ahead // 28 + 1))
+
+        # SQLite kiểm tra trùng lịch bằng trigger (quét theo từng dòng, rất chậm
+        # với hàng triệu dòng). Dữ liệu sinh ra vốn không trùng nên tạm bỏ trigger.
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            for suffix in ("insert", "update"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {OVERLAP_CONSTRAINT}_{suffix}")
+
+        # 1. Danh mục
+        specialty_ids = [uuid.uuid4() for _ in SPECIALTIES]
+        _insert(conn, Specialty.__table__, [
+            {"id": sid, "name": name, "keywords": keywords, "target_audience": audience,
+             "description": f"Chuyên khoa {name.lower()}"}
+            for sid, (name, keywords, audience) in zip(specialty_ids, SPECIALTIES)
+        ], args.batch_size)
+
+        levels = [(uuid.uuid4(), base_price) for *_, base_price in LEVELS]
+        _insert(conn, DoctorLevel.__table__, [
+            {"id": lid, "name": name, "code": code, "base_price": base_price}
+            for (lid, _), (name, code, base_price) in zip(levels, LEVELS)
+        ], args.batch_size)
+
+        # 2. User: admin, bệnh nhân, tài khoản bác sĩ
+        patient_ids = [uuid.uuid4() for _ in range(args.patients)]
+        doctor_user_ids = [uuid.uuid4() for _ in range(args.doctors)]
+        created = iter(_spread_created_at(rng, 1 + args.patients + args.doctors, args.days_back))
+
+        def users():
+            yield {"id": uuid.uuid4(), "email": ADMIN_EMAIL, "password": password_hash,
+                   "full_name": "Quản trị viên", "role": "admin", "is_active": True,
+                   "created_at": next(created)}
+            for i, uid in enumerate(patient_ids):
+                yield {"id": uid, "email": f"patient{i}@{SEED_DOMAIN}", "password": password_hash,
+                       "full_name": f"Bệnh nhân {i}", "phone_number": f"09{i:08d}",
+                       "role": "patient", "is_active": True, "created_at": next(created)}
+            for i, uid in enumerate(doctor_user_ids):
+                yield {"id": uid, "email": f"doctor{i}@{SEED_DOMAIN}", "password": password_hash,
+                       "full_name": f"Bác sĩ {i}", "phone_number": f"08{i:08d}",
+                       "role": "doctor", "is_active": True, "created_at": next(created)}
+
+        user_count = _insert(conn, User.__table__, users(), args.batch_size)
+
+        # 3. Hồ sơ bác sĩ (giá = giá cơ bản của cấp bậc x 1.0-1.5, làm tròn 10k)
+        doctors, doctor_rows = [], []
+        doctor_created = _spread_created_at(rng, args.doctors, args.days_back)
+        for user_id, created_at in zip(doctor_user_ids, doctor_created):
+            level_id, base_price = rng.choice(levels)
+            price = round(base_price * rng.uniform(1.0, 1.5), -4)
+            doctor_id = uuid.uuid4()
+            doctors.append((doctor_id, price))
+            doctor_rows.append({
+                "id": doctor_id, "user_id": user_id, "specialty_id": rng.choice(specialty_ids),
+                "level_id": level_id, "price_per_visit": price, "is_active": True,
+                "description": "Bác sĩ nhiều năm kinh nghiệm", "created_at": created_at})
+        _insert(conn, Doctor.__table__, doctor_rows, args.batch_size)
+
+        # 4. Lịch hẹn
+        appointment_count = _insert(conn, Appointment.__table__, _appointment_rows(
+            rng, doctors, patient_ids, args.appointments,
+            args.days_back, args.days_ahead, args.skew), args.batch_size)
+
+        if sqlite:
+            for trigger in SQLITE_OVERLAP_TRIGGERS:
+                trigger(Appointment.__table__, conn)
+
+    # 5. Bảng thống kê theo ngày
+    with SessionLocal() as db:
+        stats_rows = stats.rebuild(db)
+        db.commit()
+
+    print(f"Đã tạo {user_count} user, {args.doctors} bác sĩ, {appointment_count} lịch hẹn, "
+          f"{stats_rows} dòng thống kê trong {time.perf_counter() - started:.1f}s")
+    print(f"Đăng nhập: {ADMIN_EMAIL} / patient<i>@{SEED_DOMAIN} / doctor<i>@{SEED_DOMAIN}, "
+          f"mật khẩu '{args.password}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--days-back", type=int, default=300,
+                        help="số ngày lịch sử (lịch đã qua)")
+    parser.add_argument("--days-ahead", type=int, default=60,
+                        help="số ngày lịch sắp tới")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="độ lệch Zipf giữa các bác sĩ (0 = đều nhau)")
+    parser.add_argument("--password", default="seed-password")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true", help="xóa toàn bộ dữ liệu cũ trước")
+    seed(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
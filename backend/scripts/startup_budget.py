@@ -0,0 +1,84 @@
+"""
+Đo thời gian khởi động 1 worker: chạy process mới, import app.main và chạy
+phần startup của lifespan (giống uvicorn lúc khởi động worker).
+
+Import thư viện nền (FastAPI, SQLAlchemy, pydantic, jose, passlib) được đo
+riêng ("framework"): phần này không phụ thuộc code của app và chiếm phần lớn
+thời gian. Ngân sách (mặc định 0.3 giây) áp cho phần của app: trung vị của
+import app.main sau thư viện nền + lifespan ("app"), trả mã lỗi 1 nếu vượt.
+"ready" = framework + app; "total" tính thêm thời gian khởi động Python, chỉ
+để tham khảo.
+
+    python scripts/startup_budget.py --runs 5 --budget 0.3 [--schema-check]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Chạy trong process con: đo import và startup của lifespan
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import fastapi, fastapi.security, pydantic, sqlalchemy.ext.asyncio, sqlalchemy.orm
+import jose.jwt, passlib.context
+framework = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        print(json.dumps({"framework": framework - started, "import": imported - framework,
+                          "lifespan": ready - imported}))
+
+asyncio.run(startup())
+"""
+
+
+def run_once(env) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    # Tính cả thời gian khởi động interpreter (thời gian thật tới lúc sẵn sàng)
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.3,
+                        help="ngân sách cho phần của app (giây)")
+    parser.add_argument("--schema-check", action="store_true",
+                        help="bật SCHEMA_CHECK (cần DB đã chạy db upgrade)")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    env["SCHEMA_CHECK"] = "true" if args.schema_check else "false"
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    for run in runs:
+        run["app"] = run["import"] + run["lifespan"]
+        run["ready"] = run["framework"] + run["app"]
+    for key in ("framework", "import", "lifespan", "app", "ready", "total"):
+        values = [r[key] for r in runs]
+        print(f"{key:>9}: trung vị {statistics.median(values) * 1000:7.1f} ms, "
+              f"max {max(values) * 1000:7.1f} ms")
+
+    app_time = statistics.median(r["app"] for r in runs)
+    if app_time > args.budget:
+        print(f"FAIL: khởi động app {app_time:.3f}s > ngân sách {args.budget:.3f}s")
+        sys.exit(1)
+    print(f"PASS: khởi động app {app_time:.3f}s <= ngân sách {args.budget:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
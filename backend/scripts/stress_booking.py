@@ -0,0 +1,71 @@
+"""
+Stress test chống trùng lịch: bắn nhiều request đặt CÙNG 1 khung giờ của
+CÙNG 1 bác sĩ song song. Kết quả đúng: đúng 1 request 201, còn lại 409.
+
+Chạy với server đang chạy (uvicorn app.main:app):
+
+    python scripts/stress_booking.py --base-url http://localhost:8000 \\
+        --email patient@example.com --password secret1 \\
+        --doctor-id <uuid> --start 2030-01-01T09:00:00Z --requests 300
+"""
+import argparse
+import asyncio
+import sys
+from collections import Counter
+
+import httpx
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    r = await client.post("/auth/login", json={"email": email, "password": password})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def run(args) -> int:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        token = args.token or await _login(client, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = {"doctor_id": args.doctor_id,
+                   "start_time": args.start, "reason": "stress test"}
+
+        # Chờ tất cả request sẵn sàng rồi mới bắn cùng lúc
+        gate = asyncio.Event()
+
+        async def book():
+            await gate.wait()
+            r = await client.post("/appointments/", json=payload, headers=headers)
+            return r.status_code
+
+        tasks = [asyncio.create_task(book()) for _ in range(args.requests)]
+        await asyncio.sleep(0.1)
+        gate.set()
+        results = Counter(await asyncio.gather(*tasks))
+
+    print("Kết quả:", dict(sorted(results.items())))
+    ok = results.get(201, 0) == 1 and results.get(201, 0) + results.get(409, 0) == args.requests
+    print("PASS" if ok else "FAIL: phải có đúng 1 lịch được tạo, còn lại 409")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="access token của bệnh nhân")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--doctor-id", required=True)
+    parser.add_argument("--start", required=True,
+                        help="giờ bắt đầu (ISO 8601), phải là khung giờ còn trống")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    if not args.token and not (args.email and args.password):
+        parser.error("cần --token hoặc --email/--password")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()